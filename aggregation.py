@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+
+#
+# Standard library imports
+#
+import math
+import re
+import threading
+import time
+#
+# Project's imports
+#
+import lineprotocol
+
+
+FUNCTIONS = ('min', 'max', 'mean', 'last')
+QUANTILE = re.compile(r'^p(\d{1,2}(\.\d+)?)$')
+
+
+def is_function(name):
+    """Tell if a name is a known aggregation function
+
+    :param name: The name of the function, e.g. mean or p95
+    :return: True if the function is known
+    """
+    return name in FUNCTIONS or QUANTILE.match(str(name)) is not None
+
+
+class P2Quantile:
+    """Streaming quantile estimate in fixed memory (P-square algorithm)
+
+    Estimates a quantile with five markers whose heights are adjusted as the
+    values come in, as described by R. Jain and I. Chlamtac, "The P2
+    algorithm for dynamic calculation of quantiles and histograms without
+    storing observations" (1985). As P2 is coarse on a handful of values,
+    the quantile is computed exactly as long as no more than exact_limit
+    values were added.
+    """
+
+    def __init__(self, p, exact_limit=128):
+        """Creates the estimator
+
+        :param p: The quantile to estimate, between 0 and 1
+        :param exact_limit: Number of values kept for an exact computation
+        """
+        self.p = p
+        self.exact_limit = exact_limit
+        self.values = []
+        self.heights = []
+        self.positions = [0, 1, 2, 3, 4]
+        self.desired = [0, 2 * p, 4 * p, 2 + 2 * p, 4]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, value):
+        """Add a value
+
+        :param value: The value
+        :return: None
+        """
+        if self.values is not None:
+            if len(self.values) < self.exact_limit:
+                self.values.append(value)
+            else:
+                self.values = None
+        heights = self.heights
+        if len(heights) < 5:
+            heights.append(value)
+            heights.sort()
+            return
+        if value < heights[0]:
+            heights[0] = value
+            k = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            k = 3
+        else:
+            k = 0
+            while value >= heights[k + 1]:
+                k += 1
+        positions = self.positions
+        for i in range(k + 1, 5):
+            positions[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+        for i in (1, 2, 3):
+            d = self.desired[i] - positions[i]
+            if (d >= 1 and positions[i + 1] - positions[i] > 1) or (d <= -1 and positions[i - 1] - positions[i] < -1):
+                d = 1 if d > 0 else -1
+                height = self.parabolic(i, d)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = heights[i] + d * (heights[i + d] - heights[i]) / (positions[i + d] - positions[i])
+                heights[i] = height
+                positions[i] += d
+
+    def parabolic(self, i, d):
+        """Piecewise-parabolic prediction of the height of a marker
+
+        :param i: The index of the marker
+        :param d: The direction of the move, 1 or -1
+        :return: The predicted height
+        """
+        q = self.heights
+        n = self.positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+                (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def value(self):
+        """Get the current estimate
+
+        :return: The estimated quantile, None if no value was added
+        """
+        if not self.heights:
+            return None
+        if self.values is not None:
+            values = sorted(self.values)
+            rank = self.p * (len(values) - 1)
+            low = math.floor(rank)
+            high = min(low + 1, len(values) - 1)
+            return values[low] + (values[high] - values[low]) * (rank - low)
+        return self.heights[2]
+
+
+class FieldStats:
+    """Running statistics of a field over a window"""
+
+    def __init__(self, quantiles):
+        """Creates empty statistics
+
+        :param quantiles: A dictionary of function names (e.g. p95) to quantiles (e.g. 0.95)
+        """
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.last = None
+        self.estimators = {name: P2Quantile(p) for name, p in quantiles.items()}
+
+    def add(self, value):
+        """Add a value of the field
+
+        Values that are not numbers are only kept as the last value.
+
+        :param value: The value
+        :return: None
+        """
+        self.last = value
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None or value < self.min else self.min
+        self.max = value if self.max is None or value > self.max else self.max
+        for estimator in self.estimators.values():
+            estimator.add(value)
+
+    def results(self, name, functions):
+        """Get the aggregated fields
+
+        :param name: The name of the field
+        :param functions: A list of the function names
+        :return: A dictionary of <name>_<function> fields
+        """
+        fields = {}
+        for function in functions:
+            if function == 'last':
+                value = self.last
+            elif not self.count:
+                continue
+            elif function == 'min':
+                value = self.min
+            elif function == 'max':
+                value = self.max
+            elif function == 'mean':
+                value = self.total / self.count
+            else:
+                value = self.estimators[function].value()
+            fields["{}_{}".format(name, function)] = value
+        return fields
+
+
+class Aggregator:
+    """Windowed aggregation stage in front of a writer
+
+    Sits between a job and the writer. The points of each series are
+    accumulated over windows of window seconds aligned on the wall clock,
+    and one point per series is written per window, with the min, max,
+    mean, last and/or quantile (e.g. p95) of each field as
+    <field>_<function> fields. Quantiles are estimated in fixed memory.
+    Blocks are handled as the points they hold, and point dictionaries are
+    passed through untouched.
+    """
+
+    def __init__(self, writer, aggregate_config):
+        """Creates the aggregation stage
+
+        :param writer: The writer the aggregated points are handed to
+        :param aggregate_config: The window (secs), or a dictionary of the aggregation configuration
+        """
+        if not isinstance(aggregate_config, dict):
+            aggregate_config = {"window": aggregate_config}
+        self.writer = writer
+        self.window = aggregate_config["window"] if "window" in aggregate_config else 10
+        self.functions = aggregate_config["functions"] if "functions" in aggregate_config else [
+            'min', 'max', 'mean', 'last', 'p95',
+        ]
+        self.quantiles = {
+            function: float(QUANTILE.match(function).group(1)) / 100
+            for function in self.functions if function not in FUNCTIONS
+        }
+        self.lock = threading.Lock()
+        self.windows = {}
+
+    def write_points(self, record):
+        """Accumulate points, writing the aggregates of the windows they close
+
+        :param record: A list of the points
+        :return: None
+        """
+        passed = []
+        closed = []
+        now = time.time() * 10 ** 9
+        with self.lock:
+            for point in lineprotocol.expand(record):
+                if type(point) is not lineprotocol.Point:
+                    passed.append(point)
+                    continue
+                point_time = point.time if point.time is not None else now
+                window_end = (math.floor(point_time / 10 ** 9 / self.window) + 1) * self.window * 10 ** 9
+                #
+                # Windows are keyed by the rendered prefix of their series, so
+                # that series created on the fly are recognized
+                #
+                key = point.series.prefix
+                state = self.windows.get(key)
+                if state is not None and state[0] != window_end:
+                    closed.append(self.close_window(state))
+                    state = None
+                if state is None:
+                    state = self.windows[key] = (window_end, point.series, {})
+                stats = state[2]
+                for name, value in point.fields.items():
+                    field_stats = stats.get(name)
+                    if field_stats is None:
+                        field_stats = stats[name] = FieldStats(self.quantiles)
+                    field_stats.add(value)
+            #
+            # Close the windows of the series that stopped reporting
+            #
+            for key, state in list(self.windows.items()):
+                if state[0] + self.window * 10 ** 9 < now:
+                    closed.append(self.close_window(state))
+                    del self.windows[key]
+        if passed or closed:
+            self.writer.write_points(passed + closed)
+
+    def close_window(self, state):
+        """Build the aggregated point of a window
+
+        :param state: A tuple of the window end (ns), of the Series object and of the statistics of the fields of the
+        window
+        :return: A Point object
+        """
+        window_end, series, stats = state
+        fields = {}
+        for name, field_stats in stats.items():
+            fields.update(field_stats.results(name, self.functions))
+        #
+        # The aggregate is stamped with the start of its window, as InfluxDB
+        # does with GROUP BY time()
+        #
+        return lineprotocol.Point(series, fields, int(window_end - self.window * 10 ** 9))
+
+    def flush(self):
+        """Write the aggregates of the windows in progress
+
+        :return: None
+        """
+        with self.lock:
+            closed = [self.close_window(state) for state in self.windows.values()]
+            self.windows = {}
+        if closed:
+            self.writer.write_points(closed)
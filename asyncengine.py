@@ -0,0 +1,523 @@
+# -*- coding: utf-8 -*-
+
+#
+# Standard library imports
+#
+import asyncio
+import base64
+import collections
+import concurrent.futures
+import logging
+import math
+import ssl
+import time
+import urllib.parse
+#
+# Project's imports
+#
+import lineprotocol
+import telemetry
+
+
+class AsyncInfluxDBWriter:
+    """Non-blocking InfluxDB writer running on an event loop
+
+    Jobs hand their points to the writer from any thread. The points are
+    batched on the event loop (batch_size points or flush_interval seconds,
+    as the BatchWriter does) and sent over a single keep-alive HTTP/1.1
+    connection. Requests are pipelined: up to pipeline batches are sent
+    without waiting for the previous responses, which are read in order by
+    a reader task.
+
+    Batches that fail are dropped and logged, as with the threaded writer
+    without a spool.
+    """
+
+    def __init__(self, influxdb_config):
+        """Creates the writer
+
+        :param influxdb_config: A dictionary of InfluxDB configuration
+        """
+        self.host = influxdb_config["host"] if "host" in influxdb_config else "localhost"
+        self.port = influxdb_config["port"] if "port" in influxdb_config else 8086
+        username = influxdb_config["username"] if "username" in influxdb_config else "root"
+        password = influxdb_config["password"] if "password" in influxdb_config else "root"
+        database = influxdb_config["database"] if "database" in influxdb_config else None
+        self.ssl = influxdb_config["ssl"] if "ssl" in influxdb_config else False
+        self.verify_ssl = influxdb_config["verify_ssl"] if "verify_ssl" in influxdb_config else False
+        self.timeout = influxdb_config["timeout"] if "timeout" in influxdb_config else None
+        self.batch_size = influxdb_config["batch_size"] if "batch_size" in influxdb_config else 5000
+        self.flush_interval = influxdb_config["flush_interval"] if "flush_interval" in influxdb_config else 1
+        self.pipeline = influxdb_config["pipeline"] if "pipeline" in influxdb_config else 4
+        self.precision = influxdb_config["precision"] if "precision" in influxdb_config else "n"
+        if "spool" in influxdb_config:
+            logging.getLogger().warning("The spool is not supported by the asyncio engine, ignoring it")
+        if "use_udp" in influxdb_config and influxdb_config["use_udp"]:
+            logging.getLogger().warning("UDP writes are not supported by the asyncio engine, writing over HTTP")
+        params = {"db": database} if database else {}
+        params["precision"] = self.precision
+        query = urllib.parse.urlencode(params)
+        credentials = base64.b64encode("{}:{}".format(username, password).encode()).decode()
+        self.request_head = (
+            "POST /write?{} HTTP/1.1\r\n"
+            "Host: {}:{}\r\n"
+            "Authorization: Basic {}\r\n"
+            "Content-Type: application/octet-stream\r\n"
+            "Connection: keep-alive\r\n"
+        ).format(query, self.host, self.port, credentials)
+        self.loop = None
+        self.pending = []
+        self.pending_points = 0
+        self.pending_since = None
+        self.closing = False
+        self.wakeup = None
+        self.slots = None
+        self.flusher = None
+        self.reader = None
+        self.stream = None
+        self.receiver = None
+        self.inflight = collections.deque()
+
+    def start(self):
+        """Start the flusher task on the running event loop
+
+        :return: None
+        """
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        self.slots = asyncio.Semaphore(self.pipeline)
+        self.flusher = self.loop.create_task(self.flush_loop())
+
+    def write_points(self, record):
+        """Queue points for the next batch, from any thread
+
+        :param record: A list of the points to write
+        :return: None
+        """
+        self.loop.call_soon_threadsafe(self.enqueue, record)
+
+    def enqueue(self, record):
+        """Queue points for the next batch, on the event loop
+
+        :param record: A list of the points to write
+        :return: None
+        """
+        if not self.pending:
+            self.pending_since = self.loop.time()
+            self.wakeup.set()
+        self.pending.extend(record)
+        self.pending_points += lineprotocol.count_points(record)
+        if self.pending_points >= self.batch_size:
+            self.wakeup.set()
+
+    async def flush_loop(self):
+        """Flusher task body: sends the batches until closed
+
+        :return: None
+        """
+        logger = logging.getLogger()
+        while self.pending or not self.closing:
+            if self.pending_points < self.batch_size and not self.closing:
+                timeout = None
+                if self.pending:
+                    timeout = self.pending_since + self.flush_interval - self.loop.time()
+                if timeout is None or timeout > 0:
+                    self.wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self.wakeup.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+            batch, self.pending, points = lineprotocol.split(self.pending, self.batch_size)
+            self.pending_points -= points
+            self.pending_since = self.loop.time() if self.pending else None
+            try:
+                await self.send(batch)
+            except Exception:
+                logger.exception("Unexpected error writing a batch of {} points".format(len(batch)))
+
+    async def connect(self):
+        """Open the keep-alive connection and start its reader task
+
+        :return: None
+        """
+        context = None
+        if self.ssl:
+            context = ssl.create_default_context()
+            if not self.verify_ssl:
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+        self.reader, self.stream = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port, ssl=context),
+                self.timeout,
+        )
+        self.receiver = self.loop.create_task(self.receive_loop(self.reader))
+
+    def disconnect(self):
+        """Drop the connection, failing the requests waiting for a response
+
+        :return: None
+        """
+        logger = logging.getLogger()
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+            self.reader = None
+        if self.receiver is not None:
+            self.receiver.cancel()
+            self.receiver = None
+        while self.inflight:
+            points, started = self.inflight.popleft()
+            logger.warning("Connection error writing {} points".format(points))
+            self.slots.release()
+
+    async def acquire_slot(self):
+        """Wait for room in the pipeline
+
+        When InfluxDB does not answer within timeout seconds, the
+        connection is dropped, which frees the slots of its requests.
+
+        :return: None
+        """
+        try:
+            await asyncio.wait_for(self.slots.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            logging.getLogger().warning("No response from InfluxDB within {} secs, reconnecting".format(
+                    self.timeout))
+            if telemetry.enabled:
+                telemetry.count("writer", "failures_TimeoutError")
+            self.disconnect()
+            await self.slots.acquire()
+
+    async def send(self, batch):
+        """Render a batch and send it without waiting for the response
+
+        :param batch: A list of points
+        :return: None
+        """
+        logger = logging.getLogger()
+        started = time.perf_counter()
+        lines = lineprotocol.render(batch, precision=self.precision)
+        if not lines:
+            return
+        body = '\n'.join(lines).encode('utf-8')
+        if telemetry.enabled:
+            telemetry.observe("writer", "serialize_seconds", time.perf_counter() - started)
+            telemetry.observe("writer", "batch_points", len(lines), telemetry.SIZE_BOUNDS)
+        await self.acquire_slot()
+        try:
+            if self.stream is None:
+                await self.connect()
+        except (OSError, asyncio.TimeoutError) as e:
+            logger.warning("Connection error writing {} points".format(len(lines)))
+            if telemetry.enabled:
+                telemetry.count("writer", "failures_{}".format(type(e).__name__))
+            self.slots.release()
+            return
+        #
+        # The request is registered before it is sent, as its response may
+        # be read as soon as this task yields
+        #
+        self.inflight.append((len(lines), time.perf_counter()))
+        try:
+            self.stream.write(
+                    (self.request_head + "Content-Length: {}\r\n\r\n".format(len(body))).encode('latin-1') + body
+            )
+            await self.stream.drain()
+        except OSError as e:
+            if telemetry.enabled:
+                telemetry.count("writer", "failures_{}".format(type(e).__name__))
+            self.disconnect()
+
+    async def receive_loop(self, reader):
+        """Reader task body: reads the responses of the pipelined requests
+
+        :param reader: The StreamReader of the connection
+        :return: None
+        """
+        logger = logging.getLogger()
+        while True:
+            try:
+                status, body = await read_response(reader)
+            except (OSError, EOFError, asyncio.IncompleteReadError, ValueError) as e:
+                if self.reader is reader:
+                    if telemetry.enabled and self.inflight:
+                        telemetry.count("writer", "failures_{}".format(type(e).__name__))
+                    self.receiver = None
+                    self.disconnect()
+                return
+            if not self.inflight:
+                continue
+            points, started = self.inflight.popleft()
+            self.slots.release()
+            if telemetry.enabled:
+                telemetry.observe("writer", "write_seconds", time.perf_counter() - started)
+            if 200 <= status < 300:
+                logger.debug("Wrote {} points".format(points))
+            elif 400 <= status < 500:
+                logger.warning("InfluxDBClientError writing {} points, dropping them: {}".format(
+                        points, body.decode('utf-8', 'replace')))
+                if telemetry.enabled:
+                    telemetry.count("writer", "failures_InfluxDBClientError")
+            else:
+                logger.warning("InfluxDBServerError writing {} points".format(points))
+                if telemetry.enabled:
+                    telemetry.count("writer", "failures_InfluxDBServerError")
+
+    async def close(self):
+        """Send the pending points, wait for their responses and disconnect
+
+        :return: None
+        """
+        self.closing = True
+        self.wakeup.set()
+        await self.flusher
+        for _ in range(self.pipeline):
+            await self.acquire_slot()
+        self.disconnect()
+
+
+async def read_response(reader):
+    """Read an HTTP/1.1 response
+
+    :param reader: A StreamReader
+    :return: A tuple of the status code and of the body
+    """
+    status_line = await reader.readline()
+    if not status_line:
+        raise EOFError("Connection closed by InfluxDB")
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        key, _, value = line.decode('latin-1').partition(':')
+        headers[key.strip().lower()] = value.strip()
+    body = b''
+    if "content-length" in headers:
+        body = await reader.readexactly(int(headers["content-length"]))
+    elif headers.get("transfer-encoding", "").lower() == "chunked":
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            chunk = await reader.readexactly(size + 2)
+            if not size:
+                break
+            body += chunk[:-2]
+    return status, body
+
+
+class AsyncJob:
+    """A job scheduled by the asyncio engine"""
+
+    def __init__(self, interval, job_name, function, args, overrun):
+        """Creates the job
+
+        :param interval: The interval (secs) between two runs
+        :param job_name: The name of the job
+        :param function: The function performing the job
+        :param args: A tuple of the arguments of the job function
+        :param overrun: The overrun policy of the job
+        """
+        self.interval = interval
+        self.job_name = job_name
+        self.function = function
+        self.args = args
+        self.overrun = overrun
+        self.running = 0
+        self.queued = False
+        self.skipped = 0
+        self.task = None
+
+
+class AsyncEngine:
+    """Single-threaded, event loop based runtime
+
+    Alternative to the Scheduler and WorkerPool pair: every job is driven by
+    a task of the event loop sleeping until its next tick (aligned on the
+    wall clock, missed ticks skipped and counted, as the Scheduler does),
+    and the jobs, whose psutil reads block, run in a small executor. The
+    overrun policies are those of the WorkerPool.
+    """
+
+    def __init__(self, pool_size=4):
+        """Creates the engine
+
+        :param pool_size: Number of threads of the executor running the jobs
+        """
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=pool_size,
+                thread_name_prefix='sysprobe-worker',
+        )
+        self.jobs = []
+        self.running = set()
+        self.loop = None
+        self.stopped = None
+
+    def every(self, interval, job_name, function, args, overrun='skip'):
+        """Schedule a job to run every interval seconds
+
+        :param interval: The interval (secs) between two runs
+        :param job_name: The name of the job
+        :param function: The function performing the job
+        :param args: A tuple of the arguments of the job function
+        :param overrun: The overrun policy of the job
+        :return: An AsyncJob object
+        """
+        job = AsyncJob(interval, job_name, function, args, overrun)
+        self.jobs.append(job)
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.start_ticker, job)
+        return job
+
+    def cancel(self, job):
+        """Cancel a scheduled job, from any thread
+
+        :param job: An AsyncJob object
+        :return: None
+        """
+        if job in self.jobs:
+            self.jobs.remove(job)
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stop_ticker, job)
+
+    def start_ticker(self, job):
+        """Start the task driving a job
+
+        :param job: An AsyncJob object
+        :return: None
+        """
+        job.task = self.loop.create_task(self.ticker(job))
+
+    def stop_ticker(self, job):
+        """Stop the task driving a job
+
+        :param job: An AsyncJob object
+        :return: None
+        """
+        if job.task is not None:
+            job.task.cancel()
+            job.task = None
+
+    async def ticker(self, job):
+        """Task body: fire the ticks of a job
+
+        :param job: An AsyncJob object
+        :return: None
+        """
+        logger = logging.getLogger()
+        wall_now = time.time()
+        deadline = self.loop.time() + math.ceil(wall_now / job.interval) * job.interval - wall_now
+        while True:
+            await asyncio.sleep(deadline - self.loop.time())
+            now = self.loop.time()
+            missed = math.floor((now - deadline) / job.interval)
+            if missed > 0:
+                logger.warning("Scheduler late by {:.3f} secs, skipped {} ticks of {}".format(
+                        now - deadline, missed, job.job_name))
+                if telemetry.enabled:
+                    telemetry.count("scheduler", "ticks_missed", missed)
+            deadline += job.interval * (max(missed, 0) + 1)
+            self.submit(job)
+
+    def submit(self, job):
+        """Run a job, applying its overrun policy
+
+        :param job: An AsyncJob object
+        :return: None
+        """
+        logger = logging.getLogger()
+        if job.running and job.overrun != 'run':
+            if job.overrun == 'queue':
+                job.queued = True
+                if telemetry.enabled:
+                    telemetry.count(job.job_name, "queued")
+            else:
+                job.skipped += 1
+                logger.warning("Job {} still running, skipped ({} skipped so far)".format(
+                        job.job_name, job.skipped))
+                if telemetry.enabled:
+                    telemetry.count(job.job_name, "skipped")
+            return
+        job.running += 1
+        future = self.loop.run_in_executor(self.executor, self.run_job, job)
+        self.running.add(future)
+        future.add_done_callback(lambda done: self.finished(job, done))
+
+    def finished(self, job, future):
+        """Book-keeping of the end of a run, starting the queued run if any
+
+        :param job: An AsyncJob object
+        :param future: The future of the run
+        :return: None
+        """
+        self.running.discard(future)
+        job.running -= 1
+        if job.queued and not job.running and not self.stopped.is_set():
+            job.queued = False
+            self.submit(job)
+
+    def run_job(self, job):
+        """Executor body: run a job
+
+        :param job: An AsyncJob object
+        :return: None
+        """
+        logger = logging.getLogger()
+        started = time.perf_counter() if telemetry.enabled else None
+        try:
+            job.function(*job.args)
+        except Exception as e:
+            logger.exception("Job {} failed".format(job.job_name))
+            if started is not None:
+                telemetry.count(job.job_name, "failures_{}".format(type(e).__name__))
+        if started is not None:
+            telemetry.observe(job.job_name, "collect_seconds", time.perf_counter() - started)
+
+    async def main(self, writer, on_stop):
+        """Event loop body: run the jobs until stopped, then shut down
+
+        :param writer: The AsyncInfluxDBWriter of the jobs
+        :param on_stop: A function called once the jobs are done, before the writer is closed
+        :return: None
+        """
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        writer.start()
+        for job in self.jobs:
+            self.start_ticker(job)
+        try:
+            await self.stopped.wait()
+        finally:
+            self.stopped.set()
+            tasks = [job.task for job in self.jobs if job.task is not None]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            while self.running:
+                await asyncio.gather(*self.running, return_exceptions=True)
+            self.executor.shutdown(wait=True)
+            if on_stop is not None:
+                on_stop()
+            #
+            # Let the points handed over by on_stop reach the writer
+            #
+            await asyncio.sleep(0)
+            await writer.close()
+
+    def run(self, writer, on_stop=None):
+        """Run the event loop until the engine is stopped or interrupted
+
+        :param writer: The AsyncInfluxDBWriter of the jobs
+        :param on_stop: A function called once the jobs are done, before the writer is closed
+        :return: None
+        """
+        asyncio.run(self.main(writer, on_stop))
+
+    def stop(self):
+        """Stop the engine, from any thread
+
+        :return: None
+        """
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stopped.set)
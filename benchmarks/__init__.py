@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+
+"""SysProbe's benchmark suite
+
+Run from the root of the project:
+
+    python -m benchmarks [micro|scenarios|endtoend|startup|all] [-o results.json]
+
+- micro: each job of helpers.get_available_jobs(), a full cycle of all
+  the jobs, and the serialization of the points of a cycle
+- scenarios: the cpu and network jobs on synthetic high-cardinality hosts
+  (256 cpus, 500 NICs)
+- endtoend: the real scheduler, worker pool and writer chain writing to an
+  in-process stub of the InfluxDB /write API
+- startup: the time to load the agent and its jobs, its resident memory
+  and the modules loaded, in fresh interpreters
+
+The results are written as JSON: per-cycle cpu time and wall time, peak
+allocations (tracemalloc) and points per cpu second.
+"""
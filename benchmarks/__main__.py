@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+#
+# Standard library imports
+#
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+#
+# Third party imports
+#
+import psutil
+#
+# Project's imports
+#
+from benchmarks import endtoend
+from benchmarks import micro
+from benchmarks import scenarios
+from benchmarks import startup
+
+
+def parser_create():
+    """Creates the command line parser of the benchmark suite
+
+    :return: The parsed arguments
+    """
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    parser.add_argument(
+            'suite',
+            nargs='?',
+            default='all',
+            choices=('micro', 'scenarios', 'endtoend', 'startup', 'all'),
+            help='The benchmarks to run',
+    )
+    parser.add_argument('--cycles', type=int, default=100, help='Measured cycles per benchmark')
+    parser.add_argument('--duration', type=float, default=10, help='Duration (secs) of the end-to-end run')
+    parser.add_argument('--runs', type=int, default=10, help='Interpreters started per startup scenario')
+    parser.add_argument('-o', '--output', help='File to write the JSON results to, stdout by default')
+    return parser.parse_args()
+
+
+def main():
+    """Entry point of the benchmark suite
+
+    :return: None
+    """
+    flags = parser_create()
+    #
+    # The end-to-end run logs every skipped run and write error
+    #
+    logging.basicConfig(level=logging.ERROR)
+    results = []
+    if flags.suite in ('micro', 'all'):
+        results.extend(micro.run(flags.cycles))
+    if flags.suite in ('scenarios', 'all'):
+        results.extend(scenarios.run(flags.cycles))
+    if flags.suite in ('endtoend', 'all'):
+        results.extend(endtoend.run(flags.duration))
+    if flags.suite in ('startup', 'all'):
+        results.extend(startup.run(flags.runs))
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": psutil.cpu_count(),
+        "pid": os.getpid(),
+        "results": results,
+    }
+    if flags.output:
+        with open(flags.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+#
+# Standard library imports
+#
+import threading
+import time
+#
+# Project's imports
+#
+import helpers
+import scheduler
+import telemetry
+import workers
+import writers
+from benchmarks import stubinflux
+
+
+def run(duration, interval=1, jobs=None, batch_size=5000, flush_interval=1):
+    """Run the agent against a stub InfluxDB
+
+    The jobs are run by the real scheduler, worker pool and writer chain,
+    writing to an in-process stub of the InfluxDB /write API. The
+    telemetry is enabled for the run, so the collect and write latencies
+    are reported from its histograms.
+
+    :param duration: The duration (secs) of the run
+    :param interval: The interval (secs) of the jobs
+    :param jobs: A dictionary of job names to job functions, all the available jobs by default
+    :param batch_size: The batch size of the writer
+    :param flush_interval: The flush interval (secs) of the writer
+    :return: A list of a dictionary of the results
+    """
+    jobs = jobs if jobs is not None else helpers.get_available_jobs()
+    stub = stubinflux.StubInfluxDB()
+    telemetry.configure({"enabled": True})
+    writer = writers.get_writer({
+        "host": "127.0.0.1",
+        "port": stub.port,
+        "database": "sysprobe_benchmark",
+        "timeout": 5,
+        "batch_size": batch_size,
+        "flush_interval": flush_interval,
+    })
+    pool = workers.WorkerPool()
+    job_scheduler = scheduler.Scheduler()
+    for job_name, job in jobs.items():
+        job_scheduler.every(interval, pool.submit, job_name, job, (writer, {}), 'skip', name=job_name)
+    runner = threading.Thread(target=job_scheduler.run, name='sysprobe-scheduler', daemon=True)
+    cpu_started = time.process_time()
+    wall_started = time.perf_counter()
+    try:
+        runner.start()
+        time.sleep(duration)
+        job_scheduler.stop()
+        runner.join()
+        pool.shutdown()
+        writer.close()
+        wall_time = time.perf_counter() - wall_started
+        cpu_time = time.process_time() - cpu_started
+        components = telemetry.recorder.collect()
+    finally:
+        telemetry.configure({})
+        stub.close()
+    cycles = max(1, round(duration / interval))
+    writer_stats = components.get("writer", {})
+    return [{
+        "benchmark": "endtoend",
+        "duration": wall_time,
+        "cycles": cycles,
+        "cpu_seconds_per_cycle": cpu_time / cycles,
+        "points": stub.points,
+        "points_per_cycle": stub.points / cycles,
+        "points_per_second": stub.points / wall_time,
+        "points_per_cpu_second": stub.points / cpu_time if cpu_time else None,
+        "write_requests": stub.requests,
+        "write_bytes": stub.bytes,
+        "write_seconds_p50": writer_stats.get("write_seconds_p50"),
+        "write_seconds_p99": writer_stats.get("write_seconds_p99"),
+        "collect_seconds_p99": {
+            job_name: components[job_name]["collect_seconds_p99"]
+            for job_name in jobs if "collect_seconds_p99" in components.get(job_name, {})
+        },
+        "skipped": {
+            job_name: components[job_name]["skipped"]
+            for job_name in jobs if "skipped" in components.get(job_name, {})
+        },
+        "rss": components["agent"]["rss"],
+    }]
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+#
+# Standard library imports
+#
+import time
+import tracemalloc
+#
+# Project's imports
+#
+import lineprotocol
+
+
+class CountingWriter:
+    """Writer counting the points handed to it, optionally keeping them"""
+
+    def __init__(self, keep=False):
+        """Creates the writer
+
+        :param keep: True to keep the points written
+        """
+        self.keep = keep
+        self.points = 0
+        self.records = []
+
+    def write_points(self, record):
+        """Count (and keep) points
+
+        :param record: A list of the points
+        :return: True
+        """
+        self.points += lineprotocol.count_points(record)
+        if self.keep:
+            self.records.extend(record)
+        return True
+
+    def reset(self):
+        """Forget the points counted so far
+
+        :return: None
+        """
+        self.points = 0
+        self.records = []
+
+
+def measure(name, function, cycles, writer=None, points=None, setup=None):
+    """Benchmark a function
+
+    The function is called once to warm up (delta based jobs only prime
+    their state on their first run), then cycles times while measuring
+    the process cpu time and the wall time, and cycles times again while
+    tracing the allocations, which slows the calls down too much to be
+    timed in the same pass.
+
+    :param name: The name of the benchmark
+    :param function: The function to call, without arguments
+    :param cycles: The number of calls to measure
+    :param writer: The CountingWriter the function writes to, if any
+    :param points: The number of points handled per call, when there is no writer
+    :param setup: A function called without arguments before each call, untimed
+    :return: A dictionary of the results
+    """
+    if setup is not None:
+        setup()
+    function()
+    if writer is not None:
+        writer.reset()
+    cpu_time = 0
+    wall_time = 0
+    for _ in range(cycles):
+        if setup is not None:
+            setup()
+        cpu_started = time.process_time()
+        wall_started = time.perf_counter()
+        function()
+        wall_time += time.perf_counter() - wall_started
+        cpu_time += time.process_time() - cpu_started
+    points_per_cycle = writer.points / cycles if writer is not None else points or 0
+    peak = 0
+    tracemalloc.start()
+    try:
+        for _ in range(cycles):
+            if setup is not None:
+                setup()
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            function()
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+    if writer is not None:
+        writer.reset()
+    return {
+        "benchmark": name,
+        "cycles": cycles,
+        "cpu_seconds_per_cycle": cpu_time / cycles,
+        "wall_seconds_per_cycle": wall_time / cycles,
+        "alloc_peak_bytes_per_cycle": peak,
+        "points_per_cycle": points_per_cycle,
+        "points_per_cpu_second": points_per_cycle * cycles / cpu_time if cpu_time else None,
+    }
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+#
+# Project's imports
+#
+import helpers
+import lineprotocol
+import samples
+from benchmarks import measure
+
+
+def run_jobs(jobs, writer):
+    """Run jobs once each, as a scheduler tick would
+
+    :param jobs: A dictionary of job names to job functions
+    :param writer: The writer the jobs write to
+    :return: None
+    """
+    for job in jobs.values():
+        job(writer, {})
+
+
+def run(cycles, jobs=None):
+    """Benchmark the jobs and the serialization
+
+    Each job is measured alone with the sample cache disabled, so every run
+    reads the system. The full cycle runs all the jobs with a fresh cache,
+    as they share their samples on a tick. The serialization benchmark
+    renders the points of a cycle to line protocol.
+
+    :param cycles: The number of measured cycles per benchmark
+    :param jobs: A dictionary of job names to job functions, all the available jobs by default
+    :return: A list of dictionaries of the results
+    """
+    jobs = jobs if jobs is not None else helpers.get_available_jobs()
+    results = []
+    writer = measure.CountingWriter()
+    ttl = samples.cache.ttl
+    samples.cache.ttl = 0
+    try:
+        for job_name, job in jobs.items():
+            results.append(measure.measure(
+                    "job.{}".format(job_name),
+                    lambda: job(writer, {}),
+                    cycles,
+                    writer=writer,
+            ))
+    finally:
+        samples.cache.ttl = ttl
+    results.append(measure.measure(
+            "cycle",
+            lambda: run_jobs(jobs, writer),
+            cycles,
+            writer=writer,
+            setup=samples.cache.entries.clear,
+    ))
+    collector = measure.CountingWriter(keep=True)
+    samples.cache.entries.clear()
+    run_jobs(jobs, collector)
+    points = collector.records
+    results.append(measure.measure(
+            "serialize",
+            lambda: lineprotocol.render(points),
+            cycles,
+            points=lineprotocol.count_points(points),
+    ))
+    return results
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+#
+# Third party imports
+#
+import psutil
+#
+# Project's imports
+#
+import jobscpu
+import jobsnetwork
+import samples
+from benchmarks import micro
+
+
+SCENARIOS = (
+    {"name": "256_cpus", "cpus": 256, "nics": 0},
+    {"name": "500_nics", "cpus": 0, "nics": 500},
+    {"name": "256_cpus_500_nics", "cpus": 256, "nics": 500},
+)
+
+SCENARIO_JOBS = {
+    'cpu_times': jobscpu.cpu_times,
+    'cpu_times_percpu': jobscpu.cpu_times_percpu,
+    'cpu_percent': jobscpu.cpu_percent,
+    'cpu_percent_percpu': jobscpu.cpu_percent_percpu,
+    'cpu_times_percent': jobscpu.cpu_times_percent,
+    'cpu_times_percent_percpu': jobscpu.cpu_times_percent_percpu,
+    'network_io_counters': jobsnetwork.network_io_counters,
+    'network_io_counters_pernic': jobsnetwork.network_io_counters_pernic,
+}
+
+
+class SyntheticSources:
+    """Sample sources of a synthetic host
+
+    Stand-ins for the per cpu and per NIC sources of the samples module,
+    returning cpus cpu times and nics NIC counters which grow at a
+    different pace on every read, so the delta and rate computations of
+    the jobs do real work.
+    """
+
+    def __init__(self, cpus, nics):
+        """Creates the sources
+
+        :param cpus: The number of cpus of the host
+        :param nics: The number of NICs of the host
+        """
+        self.cpus = cpus
+        self.nics = nics
+        self.cpu_times_type = type(psutil.cpu_times())
+        self.net_io_type = type(psutil.net_io_counters())
+        self.reads = 0
+
+    def read_cpu_times_percpu(self):
+        """Read synthetic cpu times
+
+        :return: A list of psutil cpu times namedtuples
+        """
+        self.reads += 1
+        width = len(self.cpu_times_type._fields)
+        return [
+            self.cpu_times_type(*(self.reads * 0.01 * (cpu + field + 1) for field in range(width)))
+            for cpu in range(self.cpus)
+        ]
+
+    def read_net_io_counters_pernic(self):
+        """Read synthetic network io counters
+
+        :return: A dictionary of NIC names to psutil network io namedtuples
+        """
+        self.reads += 1
+        width = len(self.net_io_type._fields)
+        return {
+            "eth{}".format(nic): self.net_io_type(*(self.reads * (nic + field + 1) for field in range(width)))
+            for nic in range(self.nics)
+        }
+
+    def cpu_times_percpu(self):
+        """Get the synthetic cpu times through the sample cache
+
+        :return: A Sample of a list of psutil cpu times namedtuples
+        """
+        return samples.cache.get('cpu_times_percpu', lambda: samples.read(self.read_cpu_times_percpu))
+
+    def net_io_counters_pernic(self):
+        """Get the synthetic network io counters through the sample cache
+
+        :return: A Sample of a dictionary of NIC names to psutil network io namedtuples
+        """
+        return samples.cache.get('net_io_counters_pernic', lambda: samples.read(self.read_net_io_counters_pernic))
+
+
+def run(cycles):
+    """Benchmark the cpu and network jobs on synthetic hosts
+
+    The per cpu and per NIC sources of the samples module are replaced by
+    synthetic ones for the duration of each scenario. The benchmarks of a
+    scenario are named after it, e.g. 256_cpus.job.cpu_percent_percpu.
+
+    :param cycles: The number of measured cycles per benchmark
+    :return: A list of dictionaries of the results
+    """
+    results = []
+    original = (samples.cpu_times_percpu, samples.net_io_counters_pernic)
+    for scenario in SCENARIOS:
+        sources = SyntheticSources(scenario["cpus"], scenario["nics"])
+        jobs = {
+            job_name: job for job_name, job in SCENARIO_JOBS.items()
+            if scenario["cpus"] or not job_name.startswith('cpu_')
+            if scenario["nics"] or not job_name.startswith('network_')
+        }
+        samples.cache.entries.clear()
+        samples.cpu_times_percpu = sources.cpu_times_percpu
+        samples.net_io_counters_pernic = sources.net_io_counters_pernic
+        try:
+            for result in micro.run(cycles, jobs):
+                result["benchmark"] = "{}.{}".format(scenario["name"], result["benchmark"])
+                results.append(result)
+        finally:
+            samples.cpu_times_percpu, samples.net_io_counters_pernic = original
+            samples.cache.entries.clear()
+            #
+            # Start the next scenario from fresh job state
+            #
+            for previous in (
+                    jobscpu.cpu_percent_previous,
+                    jobscpu.cpu_percent_percpu_previous,
+                    jobscpu.cpu_times_percent_previous,
+                    jobscpu.cpu_times_percent_percpu_previous,
+            ):
+                previous.swap(None)
+            jobsnetwork.network_io_counters_rates.forget(None)
+            jobsnetwork.network_io_counters_pernic_rates.forget()
+    return results
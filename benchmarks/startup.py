@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+#
+# Standard library imports
+#
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+#
+# Project's imports
+#
+import registry
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+#
+# Body of the child interpreters: load the agent and the jobs, then report
+#
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+import sysprobe
+import registry
+jobs = registry.get_jobs({jobs!r})
+elapsed = time.perf_counter() - started
+import psutil
+print(json.dumps({{
+    "import_seconds": elapsed,
+    "rss": psutil.Process().memory_info().rss,
+    "modules": len(sys.modules),
+}}))
+"""
+
+
+def run(runs):
+    """Benchmark the startup of the agent in fresh interpreters
+
+    Measures the time to load the agent and its configured jobs, the
+    resident memory and the number of modules loaded, with a single job
+    configured and with all of them.
+
+    :param runs: The number of interpreters started per scenario
+    :return: A list of dictionaries of the results
+    """
+    scenarios = {
+        "memory_virtual_memory": ['memory_virtual_memory'],
+        "all_jobs": list(registry.get_job_specs()),
+    }
+    results = []
+    for name, jobs in scenarios.items():
+        reports = []
+        process_times = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            output = subprocess.run(
+                    [sys.executable, '-c', CHILD.format(root=ROOT, jobs=jobs)],
+                    check=True,
+                    stdout=subprocess.PIPE,
+            ).stdout
+            process_times.append(time.perf_counter() - started)
+            reports.append(json.loads(output))
+        results.append({
+            "benchmark": "startup.{}".format(name),
+            "runs": runs,
+            "process_seconds": statistics.median(process_times),
+            "import_seconds": statistics.median(report["import_seconds"] for report in reports),
+            "rss": statistics.median(report["rss"] for report in reports),
+            "modules": reports[-1]["modules"],
+        })
+    return results
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+#
+# Standard library imports
+#
+import http.server
+import threading
+
+
+class WriteHandler(http.server.BaseHTTPRequestHandler):
+    """Handler of the InfluxDB HTTP API: accepts every write and ping"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        """Accept a /write request, counting its points
+
+        :return: None
+        """
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        if self.path.split('?')[0] == '/write':
+            points = len(body.splitlines())
+            self.server.stub.record(points, length)
+            self.send_response(204)
+        else:
+            self.send_response(404)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        """Answer a /ping request
+
+        :return: None
+        """
+        self.send_response(204 if self.path.split('?')[0] == '/ping' else 404)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        """Silence the request log
+
+        :return: None
+        """
+        pass
+
+
+class StubInfluxDB:
+    """In-process stub of the InfluxDB /write API
+
+    Listens on an ephemeral port of the loopback interface, in a thread of
+    its own, and counts the requests, points and bytes written to it.
+    """
+
+    def __init__(self):
+        """Creates the stub and starts serving"""
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.points = 0
+        self.bytes = 0
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), WriteHandler)
+        self.server.daemon_threads = True
+        self.server.stub = self
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, name='stub-influxdb', daemon=True)
+        self.thread.start()
+
+    def record(self, points, length):
+        """Count a write request
+
+        :param points: The number of points of the request
+        :param length: The size (bytes) of the request body
+        :return: None
+        """
+        with self.lock:
+            self.requests += 1
+            self.points += points
+            self.bytes += length
+
+    def close(self):
+        """Stop serving
+
+        :return: None
+        """
+        self.server.shutdown()
+        self.server.server_close()
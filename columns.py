@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+
+#
+# Standard library imports
+#
+import array
+import collections
+import operator
+
+
+MASK_64 = 2 ** 64 - 1
+NAN = float('nan')
+
+Table = collections.namedtuple('Table', ['keys', 'columns'])
+Table.__doc__ = """Values of a set of entities (cpus, NICs...): a list of their keys and a dictionary of field names to
+columns of values, one value per key"""
+
+numpy_module = None
+numpy_loaded = False
+
+
+def get_numpy():
+    """Import NumPy on the first column operation
+
+    NumPy is optional: the columns are then array.array objects, and the
+    computations loop over them in Python. It is only imported by the jobs
+    building columns, so the agents without them do not load it.
+
+    :return: The numpy module, None if it is not installed
+    """
+    global numpy_module, numpy_loaded
+    if not numpy_loaded:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        numpy_module = numpy
+        numpy_loaded = True
+    return numpy_module
+
+
+def from_rows(keys, rows, fields, counters=False):
+    """Build a table from the rows of values of its entities
+
+    :param keys: A list of the keys of the entities
+    :param rows: A list of sequences (e.g. psutil namedtuples) of values, one per key
+    :param fields: The names of the fields, in the order of the values
+    :param counters: True for unsigned 64 bits counters, False for floats
+    :return: A Table object
+    """
+    numpy = get_numpy()
+    if numpy is not None:
+        matrix = numpy.array(rows, dtype=numpy.uint64 if counters else numpy.float64).reshape(len(rows), len(fields))
+        matrix = numpy.ascontiguousarray(matrix.T)
+        return Table(keys, {field: matrix[index] for index, field in enumerate(fields)})
+    typecode = 'Q' if counters else 'd'
+    values = zip(*rows) if rows else [()] * len(fields)
+    return Table(keys, {field: array.array(typecode, column) for field, column in zip(fields, values)})
+
+
+def add(first, second):
+    """Add two columns, counters wrapping around at 64 bits
+
+    :param first: A column
+    :param second: A column of the same length and type
+    :return: A column of the sums
+    """
+    numpy = get_numpy()
+    if numpy is not None:
+        return first + second
+    if first.typecode == 'Q':
+        return array.array('Q', [(a + b) & MASK_64 for a, b in zip(first, second)])
+    return array.array(first.typecode, map(operator.add, first, second))
+
+
+def subtract(first, second):
+    """Subtract two float columns
+
+    :param first: A column
+    :param second: A column of the same length
+    :return: A column of the differences
+    """
+    numpy = get_numpy()
+    if numpy is not None:
+        return first - second
+    return array.array('d', map(operator.sub, first, second))
+
+
+def total(columns):
+    """Sum float columns
+
+    :param columns: A non empty list of columns of the same length
+    :return: A column of the sums
+    """
+    result = columns[0]
+    for column in columns[1:]:
+        result = add(result, column)
+    return result
+
+
+def percent(part, whole):
+    """Compute percentages, clipped to [0, 100] and rounded to one decimal
+
+    :param part: A float column of the parts
+    :param whole: A float column of the wholes
+    :return: A column of the percentages, 0.0 where the whole is not positive
+    """
+    numpy = get_numpy()
+    if numpy is not None:
+        positive = whole > 0
+        ratio = part / numpy.where(positive, whole, 1.0) * 100
+        return numpy.where(positive, numpy.round(numpy.clip(ratio, 0.0, 100.0), 1), 0.0)
+    return array.array('d', [
+        round(min(max(a / b * 100, 0.0), 100.0), 1) if b > 0 else 0.0 for a, b in zip(part, whole)
+    ])
+
+
+def scale(column, factor):
+    """Multiply a float column by a factor
+
+    :param column: A float column
+    :param factor: The factor
+    :return: A column of the products
+    """
+    numpy = get_numpy()
+    if numpy is not None:
+        return column * factor
+    return array.array('d', [value * factor for value in column])
+
+
+def blank(column, positions):
+    """Blank the values of a column at the given positions, e.g. of entities without the value
+
+    :param column: A column
+    :param positions: A list of the positions
+    :return: The column itself when there is nothing to blank, a list with None at the positions otherwise
+    """
+    if not positions:
+        return column
+    values = list(tolist(column))
+    for position in positions:
+        values[position] = None
+    return values
+
+
+def take(column, positions):
+    """Gather the values of a column at the given positions
+
+    :param column: A non empty column
+    :param positions: A list of the positions, -1 for none
+    :return: A tuple of the gathered column and of the column telling the missing positions
+    """
+    numpy = get_numpy()
+    if numpy is not None:
+        positions = numpy.array(positions, dtype=numpy.intp)
+        missing = positions < 0
+        return column[numpy.where(missing, 0, positions)], missing
+    return (
+        array.array(column.typecode, [column[position] for position in positions]),
+        [position < 0 for position in positions],
+    )
+
+
+def select(column, positions):
+    """Get the values of a column at the given positions
+
+    :param column: A column
+    :param positions: A list of the positions
+    :return: A column of the values
+    """
+    numpy = get_numpy()
+    if numpy is not None:
+        return column[numpy.array(positions, dtype=numpy.intp)]
+    return array.array(column.typecode, [column[position] for position in positions])
+
+
+def select_rows(table, positions):
+    """Get the rows of a table at the given positions
+
+    :param table: A Table object
+    :param positions: A list of the positions of the rows
+    :return: A Table object of the rows
+    """
+    return Table(
+            [table.keys[position] for position in positions],
+            {name: select(column, positions) for name, column in table.columns.items()},
+    )
+
+
+def sum_rows(column, positions):
+    """Sum the values of a column at the given positions, leaving NaN out
+
+    :param column: A column
+    :param positions: A list of the positions
+    :return: The sum, NaN when there is no value to sum
+    """
+    values = [value for value in tolist(select(column, positions)) if value == value]
+    return sum(values) if values else NAN
+
+
+def counter_rates(previous, current, elapsed, missing=None):
+    """Compute the per second rates of a column of monotonic counters
+
+    Counters going backwards follow the wrap around rules of
+    rates.counter_delta: a 32 or 64 bits wrap giving an increase of less
+    than half the counter range, a reset otherwise.
+
+    :param previous: The column of the previous values of the counters
+    :param current: The column of their current values
+    :param elapsed: The time (secs) between the two columns
+    :param missing: None, or a column telling the counters without a previous value
+    :return: A float column of the rates, NaN for the counters reset or missing
+    """
+    numpy = get_numpy()
+    if numpy is not None:
+        delta = current - previous
+        backwards = current < previous
+        narrow = backwards & (previous < 2 ** 32)
+        delta = numpy.where(narrow, delta & numpy.uint64(2 ** 32 - 1), delta)
+        valid = ~backwards | (delta < numpy.where(narrow, numpy.uint64(2 ** 31), numpy.uint64(2 ** 63)))
+        if missing is not None:
+            valid &= ~missing
+        return numpy.where(valid, delta / elapsed, NAN)
+    rates = array.array('d')
+    for index, (before, after) in enumerate(zip(previous, current)):
+        if missing is not None and missing[index]:
+            rates.append(NAN)
+            continue
+        if after >= before:
+            rates.append((after - before) / elapsed)
+            continue
+        modulus = 2 ** 32 if before < 2 ** 32 else 2 ** 64
+        delta = modulus - before + after
+        rates.append(delta / elapsed if delta < modulus // 2 else NAN)
+    return rates
+
+
+def tolist(column):
+    """Convert a column to a list of Python values
+
+    :param column: A column, or a list
+    :return: A list of the values of the column
+    """
+    if type(column) is list:
+        return column
+    return column.tolist()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+#
+# Standard library imports
+#
+import threading
+import time
+#
+# Project's imports
+#
+import lineprotocol
+import telemetry
+
+
+class Deduplicator:
+    """Change-only emission stage in front of a writer
+
+    Remembers the last values written for each series, and only passes on
+    the fields whose value changed since: exactly for integers, strings and
+    booleans, by more than deadband for floats. Points left without fields
+    are dropped. Every heartbeat seconds the full point of a series is
+    written again, so that dashboards always find a recent value. Blocks
+    are handled as the points they hold, and point dictionaries are passed
+    through untouched.
+    """
+
+    def __init__(self, writer, dedup_config):
+        """Creates the deduplication stage
+
+        :param writer: The writer the changed points are handed to
+        :param dedup_config: The heartbeat (secs), or a dictionary of the deduplication configuration
+        """
+        if not isinstance(dedup_config, dict):
+            dedup_config = {"heartbeat": dedup_config}
+        self.writer = writer
+        self.heartbeat = dedup_config["heartbeat"] if "heartbeat" in dedup_config else 300
+        self.deadband = dedup_config["deadband"] if "deadband" in dedup_config else 0
+        self.lock = threading.Lock()
+        self.series = {}
+        self.swept_at = time.monotonic()
+
+    def changed(self, previous, value):
+        """Tell if a field value changed
+
+        :param previous: The value last written
+        :param value: The new value
+        :return: True if the new value must be written
+        """
+        if type(value) is float and type(previous) is float:
+            return abs(value - previous) > self.deadband
+        return value != previous or type(value) is not type(previous)
+
+    def write_points(self, record):
+        """Pass on the changed fields of the points
+
+        :param record: A list of the points
+        :return: None
+        """
+        passed = []
+        dropped = 0
+        now = time.monotonic()
+        with self.lock:
+            for point in lineprotocol.expand(record):
+                if type(point) is not lineprotocol.Point:
+                    passed.append(point)
+                    continue
+                #
+                # Series are keyed by their rendered prefix, so that series
+                # created on the fly (e.g. processes_top) are recognized
+                #
+                key = point.series.prefix
+                state = self.series.get(key)
+                if state is None or now - state[0] >= self.heartbeat:
+                    self.series[key] = (now, dict(point.fields), now)
+                    passed.append(point)
+                    continue
+                last_values = state[1]
+                fields = {
+                    name: value for name, value in point.fields.items()
+                    if name not in last_values or self.changed(last_values[name], value)
+                }
+                self.series[key] = (state[0], last_values, now)
+                if not fields:
+                    dropped += 1
+                    continue
+                last_values.update(fields)
+                passed.append(point._replace(fields=fields))
+            #
+            # Forget the series that stopped reporting
+            #
+            if now - self.swept_at >= self.heartbeat:
+                self.swept_at = now
+                for key, state in list(self.series.items()):
+                    if now - state[2] >= self.heartbeat:
+                        del self.series[key]
+        if dropped and telemetry.enabled:
+            telemetry.count("dedup", "dropped_points", dropped)
+        if passed:
+            self.writer.write_points(passed)
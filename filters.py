@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+#
+# Standard library imports
+#
+import fnmatch
+import re
+import threading
+
+
+class NameFilter:
+    """Include/exclude filter on names (devices, file system types, NICs...)
+
+    A name passes the filter when it matches one of the include patterns
+    (or when there are none) and none of the exclude patterns. Patterns are
+    shell-style globs such as loop* or /dev/sd?, or regular expressions
+    searched in the names when prefixed with re:, such as re:^veth[0-9a-f]+$.
+    The decisions are cached, as the same names come back on every run.
+    """
+
+    max_cached = 4096
+
+    def __init__(self, filter_config=None):
+        """Creates the filter
+
+        :param filter_config: A dictionary with optional include and exclude lists of patterns
+        """
+        filter_config = filter_config or {}
+        self.include = compile_patterns(filter_config["include"] if "include" in filter_config else [])
+        self.exclude = compile_patterns(filter_config["exclude"] if "exclude" in filter_config else [])
+        self.lock = threading.Lock()
+        self.decisions = {}
+
+    def match(self, name):
+        """Tell if a name passes the filter
+
+        :param name: The name
+        :return: True if the name passes the filter
+        """
+        decision = self.decisions.get(name)
+        if decision is None:
+            decision = (
+                (self.include is None or self.include.search(name) is not None)
+                and (self.exclude is None or self.exclude.search(name) is None)
+            )
+            with self.lock:
+                if len(self.decisions) >= self.max_cached:
+                    self.decisions.clear()
+                self.decisions[name] = decision
+        return decision
+
+
+def compile_patterns(patterns):
+    """Compile a list of glob and regular expression patterns to a single regular expression
+
+    :param patterns: A list of glob patterns and of re: prefixed regular expressions
+    :return: A compiled regular expression matching any of the patterns, None without patterns
+    :raise re.error: When a regular expression is invalid
+    """
+    if not patterns:
+        return None
+    expressions = [
+        pattern[3:] if pattern.startswith('re:') else '^' + fnmatch.translate(pattern)
+        for pattern in map(str, patterns)
+    ]
+    return re.compile('|'.join('(?:{})'.format(expression) for expression in expressions))
+
+
+job_filters = {}
+
+
+def get_filter(job_name, settings, name):
+    """Get a filter of a job, built once from its settings
+
+    The filter is built again when its settings changed, e.g. after the
+    configuration was reloaded.
+
+    :param job_name: The name of the job
+    :param settings: A dictionary of the job settings
+    :param name: The name of the filter setting (devices, fstypes, nics...)
+    :return: A NameFilter object
+    """
+    key = (job_name, name)
+    filter_config = settings[name] if name in settings else None
+    cached = job_filters.get(key)
+    if cached is None or cached[0] != filter_config:
+        cached = job_filters[key] = (filter_config, NameFilter(filter_config))
+    return cached[1]
+
+
+class NameTracker:
+    """Bounded set of the names (e.g. NICs) a job reports
+
+    Names are admitted in the order they are first seen, up to max_names
+    when the set is capped: the names already tracked keep their place, so
+    the reported series do not change from one run to the next. Names not
+    seen for expire seconds are dropped, freeing their place.
+    """
+
+    def __init__(self):
+        """Creates an empty tracker"""
+        self.lock = threading.Lock()
+        self.last_seen = {}
+
+    def track(self, names, now, max_names=None, expire=300):
+        """Track the names seen by a run
+
+        :param names: An iterable of the names seen
+        :param now: The monotonic time (secs) of the run
+        :param max_names: The maximum number of names tracked, None for no limit
+        :param expire: Time (secs) after which a name not seen is dropped
+        :return: A tuple of the set of the names seen that are tracked and of the list of the names expired
+        """
+        names = list(names)
+        seen_now = set(names)
+        with self.lock:
+            expired = [
+                name for name, seen in self.last_seen.items() if name not in seen_now and now - seen > expire
+            ]
+            for name in expired:
+                del self.last_seen[name]
+            tracked = set()
+            for name in names:
+                if name in self.last_seen or max_names is None or len(self.last_seen) < max_names:
+                    self.last_seen[name] = now
+                    tracked.add(name)
+            return tracked, expired
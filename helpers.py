@@ -6,8 +6,8 @@
 import argparse
 import logging
 import logging.config
+import re
 import sys
-import threading
 #
 # Third party imports
 #
@@ -21,9 +21,14 @@ from influxdb.exceptions import InfluxDBServerError
 #
 # Project's imports
 #
-import jobscpu
-import jobsnetwork
-import jobsmemory
+import aggregation
+import filters
+import lineprotocol
+import rates
+import registry
+import samples
+import telemetry
+import workers
 
 
 def parser_create():
@@ -33,6 +38,14 @@ def parser_create():
     """
     parser = argparse.ArgumentParser()
     parser.add_argument("-c", "--config-file", type=str, help="yaml configuration file name", required=True)
+    parser.add_argument(
+            "-e",
+            "--engine",
+            type=str,
+            choices=("threads", "asyncio"),
+            default="threads",
+            help="runtime running the jobs: a scheduler thread and a worker pool, or an asyncio event loop",
+    )
     return parser.parse_args()
 
 
@@ -101,15 +114,108 @@ def get_jobs_config(config_data):
         sys.exit(1)
 
 
-def run_threaded(job_function, influxdb_config):
-    """Call a function in a new thread
+def get_job_settings(job_config):
+    """Normalizes the configuration of a job
+
+    A job is configured either with its interval alone, or with a dictionary
+    of its settings.
 
-    :param job_function: The function to be called in a new thread
-    :param influxdb_config: The InfluxDB configuration
-    :return: None
+    :param job_config: The interval (secs) of the job or a dictionary of its settings
+    :return: A dictionary of the job settings
     """
-    job_thread = threading.Thread(target=job_function, daemon=True, args=(influxdb_config,))
-    job_thread.start()
+    if isinstance(job_config, dict):
+        settings = dict(job_config)
+    else:
+        settings = {"interval": job_config}
+    if "interval" not in settings:
+        print('Missing job interval: {}'.format(job_config))
+        print('Sopping.')
+        sys.exit(1)
+    interval = settings["interval"]
+    if isinstance(interval, bool) or not isinstance(interval, (int, float)) or not 0 < interval < float('inf'):
+        print('Invalid job interval: {}'.format(interval))
+        print('Sopping.')
+        sys.exit(1)
+    if "overrun" in settings and settings["overrun"] not in workers.OVERRUN_POLICIES:
+        print('Unknown overrun policy: {}'.format(settings["overrun"]))
+        print('Sopping.')
+        sys.exit(1)
+    if "counters" in settings and settings["counters"] not in rates.COUNTERS_MODES:
+        print('Unknown counters mode: {}'.format(settings["counters"]))
+        print('Sopping.')
+        sys.exit(1)
+    for name in ('devices', 'fstypes', 'nics', 'cgroups'):
+        if name in settings:
+            try:
+                filters.NameFilter(settings[name])
+            except re.error as e:
+                print('Invalid {} filter: {}'.format(name, e))
+                print('Sopping.')
+                sys.exit(1)
+    if "max_nics" in settings and not (isinstance(settings["max_nics"], int) and settings["max_nics"] > 0):
+        print('Invalid max_nics: {}'.format(settings["max_nics"]))
+        print('Sopping.')
+        sys.exit(1)
+    if "max_depth" in settings and not (isinstance(settings["max_depth"], int) and settings["max_depth"] >= 0):
+        print('Invalid max_depth: {}'.format(settings["max_depth"]))
+        print('Sopping.')
+        sys.exit(1)
+    if isinstance(settings.get("aggregate"), dict) and "functions" in settings["aggregate"]:
+        for function in settings["aggregate"]["functions"]:
+            if not aggregation.is_function(function):
+                print('Unknown aggregation function: {}'.format(function))
+                print('Sopping.')
+                sys.exit(1)
+    return settings
+
+
+def get_collectors_config(config_data):
+    """Extracts collectors configuration from configuration data
+
+    The collectors section is optional.
+
+    :param config_data: Configuration data
+    :return: A dictionary of the collectors configuration
+    """
+    config = config_data["collectors"] if "collectors" in config_data else {}
+    if "backend" in config and config["backend"] not in samples.BACKENDS:
+        print('Unknown collectors backend: {}'.format(config["backend"]))
+        print('Sopping.')
+        sys.exit(1)
+    return config
+
+
+def get_workers_config(config_data):
+    """Extracts workers configuration from configuration data
+
+    The workers section is optional.
+
+    :param config_data: Configuration data
+    :return: A dictionary of the workers configuration
+    """
+    config = config_data["workers"] if "workers" in config_data else {}
+    if "overrun" in config and config["overrun"] not in workers.OVERRUN_POLICIES:
+        print('Unknown overrun policy: {}'.format(config["overrun"]))
+        print('Sopping.')
+        sys.exit(1)
+    return config
+
+
+def get_telemetry_config(config_data):
+    """Extracts telemetry configuration from configuration data
+
+    The telemetry section is optional, and the telemetry is disabled unless
+    enabled is set.
+
+    :param config_data: Configuration data
+    :return: A dictionary of the telemetry configuration
+    """
+    config = config_data["telemetry"] if "telemetry" in config_data else {}
+    if "interval" in config and not (isinstance(config["interval"], (int, float)) and config["interval"] > 0):
+        print('Invalid telemetry interval: {}'.format(config["interval"]))
+        print('Sopping.')
+        sys.exit(1)
+    return config
 
 
 def get_influxdb_config(config_data):
@@ -121,11 +227,28 @@ def get_influxdb_config(config_data):
     try:
         config = {k: config_data[k] for k in ('influxdb',)}
         config = config['influxdb']
-        return config
     except KeyError:
         print('Could not find InfluxDB section in configuration file')
         print('Sopping.')
         sys.exit(1)
+    if "precision" in config and config["precision"] not in lineprotocol.PRECISIONS:
+        print('Unknown timestamps precision: {}'.format(config["precision"]))
+        print('Sopping.')
+        sys.exit(1)
+    if isinstance(config.get("spool"), dict):
+        spool_config = config["spool"]
+        max_bytes = spool_config["max_bytes"] if "max_bytes" in spool_config else 100 * 1024 * 1024
+        segment_bytes = spool_config["segment_bytes"] if "segment_bytes" in spool_config else 4 * 1024 * 1024
+        if segment_bytes >= max_bytes:
+            #
+            # The segment being written is never evicted: the spool would
+            # grow past max_bytes
+            #
+            print('The spool segment_bytes ({}) must be lower than its max_bytes ({})'.format(
+                    segment_bytes, max_bytes))
+            print('Sopping.')
+            sys.exit(1)
+    return config
 
 
 def get_host_type():
@@ -193,46 +316,53 @@ def get_influxdb_client(influxdb_config):
     return client
 
 
-def influxdb_write_points(client, record):
+def influxdb_write_points(client, record, protocol='json', precision=None):
     """Write points to InfluxDB
 
+    Points rejected by InfluxDB (InfluxDBClientError) are dropped for good,
+    while server errors, connection errors and timeouts are reported to the
+    caller so the points can be written again later.
+
     :param client: A InfluxDB client object
-    :param record:  A dictionary of the InfluxDB record to write
-    :return: None
+    :param record: A list of the InfluxDB points to write
+    :param protocol: The protocol of the points, 'json' or 'line'
+    :param precision: The precision of the timestamps of the points, None for nanoseconds
+    :return: False if the write failed on a transient error, True otherwise
     """
     logger = logging.getLogger()
     try:
-        client.write_points(record)
-    except InfluxDBClientError:
-        logger.warning("InfluxDBClientError writing {}".format(record))
-    except InfluxDBServerError:
-        logger.warning("InfluxDBServerError writing {}".format(record))
-    except requests.exceptions.ConnectTimeout:
-        logger.warning("Connection timeout writing {}".format(record))
+        client.write_points(record, time_precision=precision, protocol=protocol)
+    except InfluxDBClientError as e:
+        logger.warning("InfluxDBClientError writing {} points, dropping them: {}".format(len(record), e))
+        if telemetry.enabled:
+            telemetry.count("writer", "failures_{}".format(type(e).__name__))
+    except InfluxDBServerError as e:
+        logger.warning("InfluxDBServerError writing {} points".format(len(record)))
+        if telemetry.enabled:
+            telemetry.count("writer", "failures_{}".format(type(e).__name__))
+        return False
+    except requests.exceptions.ConnectTimeout as e:
+        logger.warning("Connection timeout writing {} points".format(len(record)))
+        if telemetry.enabled:
+            telemetry.count("writer", "failures_{}".format(type(e).__name__))
+        return False
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+        logger.warning("Connection error writing {} points".format(len(record)))
+        if telemetry.enabled:
+            telemetry.count("writer", "failures_{}".format(type(e).__name__))
+        return False
     else:
-        logger.debug("Wrote {}".format(record))
+        logger.debug("Wrote {} points".format(len(record)))
+    return True
 
 
 def get_available_jobs():
     """Returns the availables jobs
 
-    Creates a mapping of jobs names to functions to call to perform the jobs
+    Creates a mapping of jobs names to functions to call to perform the jobs.
+    This imports the modules of every job, see registry.get_jobs() to only
+    import the configured ones.
 
     :return: A dictionary of the available jobs
     """
-    available_jobs = {
-        'cpu_times': jobscpu.cpu_times,
-        'cpu_times_percpu': jobscpu.cpu_times_percpu,
-        'cpu_percent': jobscpu.cpu_percent,
-        'cpu_percent_percpu': jobscpu.cpu_percent_percpu,
-        'cpu_times_percent': jobscpu.cpu_times_percent,
-        'cpu_times_percent_percpu': jobscpu.cpu_times_percent_percpu,
-        'cpu_count': jobscpu.cpu_count,
-        'cpu_stats': jobscpu.cpu_stats,
-        'cpu_freq': jobscpu.cpu_freq,
-        'cpu_freq_percpu': jobscpu.cpu_freq_percpu,
-        'network_io_counters': jobsnetwork.network_io_counters,
-        'network_io_counters_pernic': jobsnetwork.network_io_counters_pernic,
-        'memory_virtual_memory': jobsmemory.memory_virtual_memory,
-    }
-    return available_jobs
+    return registry.get_jobs(registry.get_job_specs())
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+#
+# Standard library imports
+#
+import ctypes
+import ctypes.util
+import os
+import struct
+import sys
+
+
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+EVENT = struct.Struct('iIII')
+
+libc = None
+
+
+def get_libc():
+    """Load the C library exposing the inotify calls, once
+
+    :return: The ctypes library, None if inotify is not available
+    """
+    global libc
+    if libc is None:
+        libc = False
+        if sys.platform.startswith('linux'):
+            try:
+                library = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+                library.inotify_init1
+                library.inotify_add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+                libc = library
+            except (OSError, AttributeError):
+                pass
+    return libc or None
+
+
+class Inotify:
+    """Minimal non-blocking inotify instance (Linux)
+
+    The events are read in batches when the caller is ready for them, e.g.
+    once per job run, so nothing waits on the file descriptor.
+    """
+
+    def __init__(self):
+        """Creates the instance
+
+        :raise OSError: When inotify is not available or the instance can not be created
+        """
+        self.libc = get_libc()
+        if self.libc is None:
+            raise OSError("inotify is not available")
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+    def add_watch(self, path, mask):
+        """Watch a path
+
+        :param path: The path name to watch
+        :param mask: The events to watch, e.g. IN_CREATE | IN_DELETE
+        :return: The watch descriptor
+        :raise OSError: When the watch can not be added (e.g. ENOSPC past max_user_watches)
+        """
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        return wd
+
+    def read_events(self):
+        """Read the pending events
+
+        :return: A list of (watch descriptor, mask, name) tuples
+        """
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT.unpack_from(data, offset)
+                offset += EVENT.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                events.append((wd, mask, name))
+
+    def close(self):
+        """Close the instance, dropping its watches
+
+        :return: None
+        """
+        os.close(self.fd)
@@ -0,0 +1,494 @@
+# -*- coding: utf-8 -*-
+
+#
+# Standard library imports
+#
+import errno
+import logging
+import os
+import threading
+import time
+try:
+    import resource
+except ImportError:
+    #
+    # Not available on Windows, where there are no cgroups anyway
+    #
+    resource = None
+#
+# Project's imports
+#
+import columns
+import filters
+import inotify
+import lineprotocol
+import procfs
+import rates
+import samples
+
+
+CGROUP_PATHS = ('/sys/fs/cgroup', '/sys/fs/cgroup/unified')
+
+#
+# Files read in every cgroup, with the initial size of their buffer
+#
+CGROUP_FILES = (('cpu.stat', 512), ('memory.current', 64), ('io.stat', 512))
+
+CPU_KEYS = (b'usage_usec', b'user_usec', b'system_usec', b'nr_periods', b'nr_throttled', b'throttled_usec')
+IO_KEYS = (b'rbytes', b'wbytes', b'rios', b'wios')
+CPU_FIELDS = tuple('cpu_' + key.decode('ascii') for key in CPU_KEYS)
+IO_FIELDS = tuple('io_' + key.decode('ascii') for key in IO_KEYS)
+FIELDS = CPU_FIELDS + ('memory_current',) + IO_FIELDS
+COUNTERS = CPU_FIELDS + IO_FIELDS
+
+WATCH_MASK = inotify.IN_CREATE | inotify.IN_DELETE | inotify.IN_ONLYDIR
+
+#
+# Files left to the rest of the agent when raising the limit of open files
+#
+FILES_MARGIN = 256
+
+
+def find_root():
+    """Find the mount point of the cgroup v2 hierarchy
+
+    Either /sys/fs/cgroup (unified hierarchy) or /sys/fs/cgroup/unified
+    (hybrid hierarchy, next to the v1 controllers).
+
+    :return: The path name of the mount point, None if cgroup v2 is not mounted
+    """
+    for path in CGROUP_PATHS:
+        if os.path.exists(os.path.join(path, 'cgroup.controllers')):
+            return path
+    return None
+
+
+def parse_cpu_stat(data):
+    """Parse the content of a cpu.stat file
+
+    :param data: The content of the file, e.g. b'usage_usec 123\nuser_usec 100\n...'
+    :return: A tuple of the values of CPU_KEYS, 0 for the keys not in the file
+    """
+    words = data.split()
+    values = dict(zip(words[::2], words[1::2]))
+    return tuple(int(values.get(key, 0)) for key in CPU_KEYS)
+
+
+def parse_io_stat(data):
+    """Parse the content of an io.stat file, summing the values of all the devices
+
+    :param data: The content of the file, e.g. b'8:0 rbytes=1024 wbytes=0 rios=1 wios=0 dbytes=0 dios=0\n'
+    :return: A tuple of the sums of the values of IO_KEYS
+    """
+    totals = dict.fromkeys(IO_KEYS, 0)
+    for word in data.split():
+        key, _, value = word.partition(b'=')
+        if key in totals:
+            totals[key] += int(value)
+    return tuple(totals[key] for key in IO_KEYS)
+
+
+def raise_files_limit(needed):
+    """Raise the soft limit of open files, up to the hard limit
+
+    :param needed: The number of files the process needs to open
+    :return: The soft limit of open files, None if unknown
+    """
+    if resource is None:
+        return None
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY or soft >= needed:
+        return soft
+    target = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+    if target <= soft:
+        return soft
+    try:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+    except (ValueError, OSError):
+        return soft
+    logging.getLogger().info("Raised the limit of open files from {} to {} for the cgroups".format(soft, target))
+    return target
+
+
+class Cgroup:
+    """The cpu.stat, memory.current and io.stat files of a cgroup, kept open
+
+    The files of the controllers not enabled for the cgroup do not exist
+    and are left out.
+    """
+
+    def __init__(self, path):
+        """Opens the files of the cgroup
+
+        :param path: The path name of the directory of the cgroup
+        """
+        self.files = {}
+        for name, size in CGROUP_FILES:
+            try:
+                self.files[name] = procfs.ProcFile(os.path.join(path, name), size)
+            except OSError as e:
+                if e.errno in (errno.EMFILE, errno.ENFILE):
+                    self.close()
+                    raise
+                continue
+
+    def read_file(self, name):
+        """Read one of the files of the cgroup
+
+        :param name: The name of the file
+        :return: The content of the file, None if the file is not available
+        """
+        proc_file = self.files.get(name)
+        if proc_file is None:
+            return None
+        with proc_file.lock:
+            try:
+                size = proc_file.read()
+            except OSError:
+                #
+                # ENODEV once the cgroup is removed
+                #
+                return None
+            return bytes(proc_file.buffer[:size])
+
+    def read(self):
+        """Read the files of the cgroup
+
+        :return: A tuple of the cpu values, of the memory usage and of the io values, None for those not available
+        """
+        cpu_stat = self.read_file('cpu.stat')
+        memory_current = self.read_file('memory.current')
+        io_stat = self.read_file('io.stat')
+        return (
+            parse_cpu_stat(cpu_stat) if cpu_stat is not None else None,
+            int(memory_current) if memory_current else None,
+            parse_io_stat(io_stat) if io_stat is not None else None,
+        )
+
+    def close(self):
+        """Close the files of the cgroup
+
+        :return: None
+        """
+        for proc_file in self.files.values():
+            proc_file.close()
+        self.files = {}
+
+
+class CgroupTree:
+    """Cache of the cgroups of a cgroup v2 hierarchy and of their open files
+
+    The hierarchy is walked once, then kept up to date from the inotify
+    events of its directories, the cgroup file system not updating their
+    modification times. Without inotify (or past the limit of watches), the
+    hierarchy is walked again when the number of cgroups in the cgroup.stat
+    file of the root changes, and every rescan seconds. The cgroups are
+    named by their path in the hierarchy, / being the root cgroup.
+    """
+
+    def __init__(self, root, cgroups_filter, max_depth=None, rescan=60):
+        """Walks the hierarchy
+
+        :param root: The mount point of the hierarchy
+        :param cgroups_filter: A NameFilter object of the cgroups reported
+        :param max_depth: The depth of the deepest cgroups reported, None for no limit
+        :param rescan: The interval (secs) between two walks of the hierarchy without inotify
+        """
+        logger = logging.getLogger()
+        self.root = root
+        self.cgroups_filter = cgroups_filter
+        self.max_depth = max_depth
+        self.rescan = rescan
+        self.cgroups = {}
+        self.watches = {}
+        self.files_limit = None
+        self.left_out = False
+        self.descendants = None
+        self.scanned = None
+        try:
+            self.inotify = inotify.Inotify()
+        except OSError as e:
+            logger.info("Walking the cgroups every {} secs, inotify is not available: {}".format(rescan, e))
+            self.inotify = None
+        self.scan(time.monotonic())
+
+    def get_path(self, name):
+        """Get the path name of the directory of a cgroup
+
+        :param name: The name of the cgroup
+        :return: The path name
+        """
+        return self.root if name == '/' else self.root + name
+
+    def read_descendants(self):
+        """Read the numbers of cgroups below the root
+
+        :return: A tuple of the numbers of live and dying cgroups, None if unknown
+        """
+        try:
+            with open(os.path.join(self.root, 'cgroup.stat'), 'rb') as f:
+                words = f.read().split()
+        except OSError:
+            return None
+        values = dict(zip(words[::2], words[1::2]))
+        return values.get(b'nr_descendants'), values.get(b'nr_dying_descendants')
+
+    def stop_watching(self, reason):
+        """Fall back to walking the hierarchy
+
+        :param reason: The reason inotify can no longer be used
+        :return: None
+        """
+        logging.getLogger().warning("Walking the cgroups every {} secs, {}".format(self.rescan, reason))
+        self.inotify.close()
+        self.inotify = None
+        self.watches = {}
+
+    def open_cgroup(self, name):
+        """Open the files of a cgroup and add it to the cache
+
+        :param name: The name of the cgroup
+        :return: None
+        """
+        needed = (len(self.cgroups) + 1) * len(CGROUP_FILES) + FILES_MARGIN
+        if self.files_limit is None or needed > self.files_limit:
+            #
+            # Raised in steps, so that the limit is only checked every 256
+            # cgroups
+            #
+            self.files_limit = raise_files_limit(needed + FILES_MARGIN * len(CGROUP_FILES))
+        try:
+            if self.files_limit is not None and needed > self.files_limit:
+                raise OSError(errno.EMFILE, "Not enough open files left for the agent")
+            self.cgroups[name] = Cgroup(self.get_path(name))
+        except OSError as e:
+            #
+            # Reported once: the cgroups left out are tried again on the
+            # next walks
+            #
+            if not self.left_out:
+                logging.getLogger().warning("Leaving cgroups out, starting with {}: {}".format(name, e))
+            self.left_out = True
+
+    def walk(self, name, seen=None):
+        """Add a cgroup and the cgroups below it to the cache
+
+        :param name: The name of the cgroup
+        :param seen: None, or a set the names of the cgroups walked are added to
+        :return: None
+        """
+        depth = 0 if name == '/' else name.count('/')
+        if self.max_depth is not None and depth > self.max_depth:
+            return
+        path = self.get_path(name)
+        descend = self.max_depth is None or depth < self.max_depth
+        if descend and self.inotify is not None:
+            #
+            # Watched before its children are listed, so that none of them
+            # is missed
+            #
+            try:
+                self.watches[self.inotify.add_watch(path, WATCH_MASK)] = name
+            except OSError as e:
+                if e.errno in (errno.ENOENT, errno.ENOTDIR):
+                    return
+                self.stop_watching("could not watch {}: {}".format(path, e))
+        if seen is not None:
+            seen.add(name)
+        if name not in self.cgroups and self.cgroups_filter.match(name):
+            self.open_cgroup(name)
+        if not descend:
+            return
+        try:
+            with os.scandir(path) as entries:
+                children = [entry.name for entry in entries if entry.is_dir(follow_symlinks=False)]
+        except OSError:
+            return
+        prefix = '' if name == '/' else name
+        for child in children:
+            self.walk(prefix + '/' + child, seen)
+
+    def remove(self, name):
+        """Remove a cgroup and the cgroups below it from the cache
+
+        :param name: The name of the cgroup
+        :return: A list of the names of the cgroups removed
+        """
+        prefix = name + '/'
+        removed = [cgroup for cgroup in self.cgroups if cgroup == name or cgroup.startswith(prefix)]
+        for cgroup in removed:
+            self.cgroups.pop(cgroup).close()
+        self.watches = {
+            wd: cgroup for wd, cgroup in self.watches.items() if cgroup != name and not cgroup.startswith(prefix)
+        }
+        return removed
+
+    def scan(self, now):
+        """Walk the whole hierarchy, dropping the cgroups that are gone
+
+        :param now: The monotonic time (secs) of the walk
+        :return: A list of the names of the cgroups removed
+        """
+        seen = set()
+        self.descendants = self.read_descendants()
+        self.scanned = now
+        self.walk('/', seen)
+        removed = [name for name in self.cgroups if name not in seen]
+        for name in removed:
+            self.cgroups.pop(name).close()
+        self.watches = {wd: name for wd, name in self.watches.items() if name in seen}
+        return removed
+
+    def refresh(self, now):
+        """Apply the changes of the hierarchy since the last refresh
+
+        :param now: The monotonic time (secs) of the refresh
+        :return: A list of the names of the cgroups removed
+        """
+        if self.inotify is None:
+            if self.read_descendants() != self.descendants or now - self.scanned >= self.rescan:
+                return self.scan(now)
+            return []
+        removed = []
+        for wd, mask, child in self.inotify.read_events():
+            if mask & inotify.IN_Q_OVERFLOW:
+                return removed + self.scan(now)
+            if mask & inotify.IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            parent = self.watches.get(wd)
+            if parent is None or not mask & inotify.IN_ISDIR:
+                continue
+            name = ('' if parent == '/' else parent) + '/' + child
+            if mask & inotify.IN_CREATE:
+                self.walk(name)
+            elif mask & inotify.IN_DELETE:
+                removed.extend(self.remove(name))
+            if self.inotify is None:
+                #
+                # Ran out of watches: the hierarchy is walked from now on
+                #
+                return removed + self.scan(now)
+        return removed
+
+    def read(self):
+        """Read the files of all the cgroups
+
+        :return: A tuple of a Table of the FIELDS counters of the cgroups, and of a dictionary of cpu, memory and io to
+        the positions of the cgroups without these values
+        """
+        keys = []
+        rows = []
+        missing = {'cpu': [], 'memory': [], 'io': []}
+        no_cpu = (0,) * len(CPU_KEYS)
+        no_io = (0,) * len(IO_KEYS)
+        for name, cgroup in self.cgroups.items():
+            cpu, memory, io = cgroup.read()
+            position = len(keys)
+            keys.append(name)
+            if cpu is None:
+                missing['cpu'].append(position)
+                cpu = no_cpu
+            if memory is None:
+                missing['memory'].append(position)
+                memory = 0
+            if io is None:
+                missing['io'].append(position)
+                io = no_io
+            rows.append(cpu + (memory,) + io)
+        return columns.from_rows(keys, rows, FIELDS, counters=True), missing
+
+    def close(self):
+        """Close the files of the cgroups and stop watching the hierarchy
+
+        :return: None
+        """
+        for cgroup in self.cgroups.values():
+            cgroup.close()
+        self.cgroups = {}
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+
+
+cgroups_rates = rates.ColumnRates()
+cgroups_lock = threading.Lock()
+cgroup_tree = None
+cgroup_tree_config = None
+
+
+def get_tree(settings):
+    """Get the cache of the cgroups, built again when its settings changed
+
+    :param settings: A dictionary of the job settings
+    :return: A CgroupTree object, None if cgroup v2 is not mounted
+    """
+    global cgroup_tree, cgroup_tree_config
+    root = settings["path"] if "path" in settings else find_root()
+    max_depth = settings["max_depth"] if "max_depth" in settings else None
+    rescan = settings["rescan"] if "rescan" in settings else 60
+    tree_config = (root, settings["cgroups"] if "cgroups" in settings else None, max_depth, rescan)
+    if tree_config == cgroup_tree_config:
+        return cgroup_tree
+    if cgroup_tree is not None:
+        for name in cgroup_tree.cgroups:
+            lineprotocol.forget_series("cgroups", ("cgroup", name))
+        cgroup_tree.close()
+        cgroup_tree = None
+    cgroup_tree_config = tree_config
+    if root is None or not os.path.isdir(root):
+        logging.getLogger().warning("cgroup v2 is not mounted on this host")
+        return None
+    cgroup_tree = CgroupTree(root, filters.get_filter('cgroups', settings, 'cgroups'), max_depth, rescan)
+    return cgroup_tree
+
+
+def cgroups(writer, settings):
+    """Retrieve the cpu, memory and io usage per cgroup (cgroup v2)
+
+    Writes one point per cgroup, tagged with its path in the hierarchy
+    (e.g. /system.slice/docker-<id>.scope), with the cpu.stat counters
+    (cpu_*, µs), the memory usage (memory_current, bytes) and the io.stat
+    counters summed over the devices (io_*). The counters are written as
+    rates by default (counters setting), with cpu_percent, the cpu usage in
+    percent of one cpu. The fields of the controllers not enabled for a
+    cgroup are left out. The cgroups can be filtered by path with the
+    cgroups setting and by depth with max_depth. Nothing is written on hosts
+    without cgroup v2.
+
+    :param writer: The InfluxDB writer to hand the points to
+    :param settings: A dictionary of the job settings
+    :return: None
+    """
+    counters_mode = settings["counters"] if "counters" in settings else "rates"
+    with cgroups_lock:
+        tree = get_tree(settings)
+        if tree is None:
+            return
+        for name in tree.refresh(time.monotonic()):
+            lineprotocol.forget_series("cgroups", ("cgroup", name))
+        sample = samples.read(tree.read)
+    table, missing = sample.value
+    if not table.keys:
+        return
+    fields = rates.get_column_fields(
+            cgroups_rates,
+            sample.time,
+            table.keys,
+            {name: table.columns[name] for name in COUNTERS},
+            counters_mode,
+    )
+    if not fields:
+        return
+    fields["memory_current"] = table.columns["memory_current"]
+    if "cpu_usage_usec_rate" in fields:
+        fields["cpu_percent"] = columns.scale(fields["cpu_usage_usec_rate"], 10 ** -4)
+    for name in fields:
+        fields[name] = columns.blank(fields[name], missing[name.partition('_')[0]])
+    writer.write_points([
+        lineprotocol.Block(
+                [lineprotocol.get_series("cgroups", ("cgroup", name)) for name in table.keys],
+                fields,
+                samples.timestamp(sample.time),
+        )
+    ])
@@ -1,10 +1,6 @@
 # -*- coding: utf-8 -*-
 
 
-#
-# Standard library imports
-#
-import platform
 #
 # Third party imports
 #
@@ -12,277 +8,281 @@ import psutil
 #
 # Project's imports
 #
-import helpers
+import columns
+import lineprotocol
+import rates
+import samples
+
 
+cpu_percent_previous = samples.PreviousSample()
+cpu_percent_percpu_previous = samples.PreviousSample()
+cpu_times_percent_previous = samples.PreviousSample()
+cpu_times_percent_percpu_previous = samples.PreviousSample()
+cpu_stats_rates = rates.RateEngine()
 
-def cpu_times(influxdb_config):
+
+def cpu_times(writer, settings):
     """Retrieve the cpu times
 
-    :param influxdb_config: A dictionary of InfluxDB to connect to
+    :param writer: The InfluxDB writer to hand the points to
+    :param settings: A dictionary of the job settings
     :return: None
     """
-    result = psutil.cpu_times(percpu=False)
-    host_type = helpers.get_host_type()
+    sample = samples.cpu_times()
+    result = sample.value
+    timestamp = samples.timestamp(sample.time)
     #
     # TODO -> Add platform specific counters
     #
-    client = helpers.get_influxdb_client(influxdb_config)
     record = [
-        {
-            "measurement": "cpu_times",
-            "tags": {
-                "host_type": host_type,
-                "host_name": platform.node(),
-            },
-            "fields": {
-                "user": result.user,
-                "system": result.system,
-                "idle": result.idle,
-            }
-        }
+        lineprotocol.Point(
+                lineprotocol.get_series("cpu_times"),
+                {
+                    "user": result.user,
+                    "system": result.system,
+                    "idle": result.idle,
+                },
+                timestamp,
+        )
     ]
-    helpers.influxdb_write_points(client, record)
+    writer.write_points(record)
 
 
-def cpu_times_percpu(influxdb_config):
+def cpu_times_percpu(writer, settings):
     """Retrieve the cpu times per cpu
 
-    :param influxdb_config: A dictionary of InfluxDB to connect to
+    :param writer: The InfluxDB writer to hand the points to
+    :param settings: A dictionary of the job settings
     :return: None
     """
-    results = psutil.cpu_times(percpu=True)
-    host_type = helpers.get_host_type()
+    sample = samples.cpu_times_percpu_table()
+    table = sample.value
     #
     # TODO -> Add platform specific counters
     #
-    client = helpers.get_influxdb_client(influxdb_config)
-    records = []
-    for cpu_num, result in enumerate(results):
-        records.append(
+    record = [
+        lineprotocol.Block(
+                [lineprotocol.get_series("cpu_times_percpu", ("cpu_num", cpu_num)) for cpu_num in table.keys],
                 {
-                    "measurement": "cpu_times_percpu",
-                    "tags": {
-                        "host_type": host_type,
-                        "host_name": platform.node(),
-                        "cpu_num": cpu_num,
-                    },
-                    "fields": {
-                        "user": result.user,
-                        "system": result.system,
-                        "idle": result.idle,
-                    }
-                }
+                    "user": table.columns["user"],
+                    "system": table.columns["system"],
+                    "idle": table.columns["idle"],
+                },
+                samples.timestamp(sample.time),
         )
-    helpers.influxdb_write_points(client, records)
+    ]
+    writer.write_points(record)
 
 
-def cpu_percent(influxdb_config):
+def cpu_percent(writer, settings):
     """Retrieve the cpu usage in percent
 
-    :param influxdb_config: A dictionary of InfluxDB to connect to
+    The usage is computed over the interval since the previous run, nothing
+    is written on the first run.
+
+    :param writer: The InfluxDB writer to hand the points to
+    :param settings: A dictionary of the job settings
     :return: None
     """
-    result = psutil.cpu_percent(interval=.1, percpu=False)
-    host_type = helpers.get_host_type()
-    client = helpers.get_influxdb_client(influxdb_config)
+    sample = samples.cpu_times()
+    current = sample.value
+    previous = cpu_percent_previous.swap(current)
+    if previous is None:
+        return
+    result = samples.cpu_percent(previous, current)
+    timestamp = samples.timestamp(sample.time)
     record = [
-        {
-            "measurement": "cpu_percent",
-            "tags": {
-                "host_type": host_type,
-                "host_name": platform.node(),
-            },
-            "fields": {
-                "current": result,
-            }
-        }
+        lineprotocol.Point(
+                lineprotocol.get_series("cpu_percent"),
+                {
+                    "current": result,
+                },
+                timestamp,
+        )
     ]
-    helpers.influxdb_write_points(client, record)
+    writer.write_points(record)
 
 
-def cpu_percent_percpu(influxdb_config):
+def cpu_percent_percpu(writer, settings):
     """Retrieve the cpu usage of each cpu in percent
 
-    :param influxdb_config: A dictionary of InfluxDB to connect to
+    The usage is computed over the interval since the previous run, nothing
+    is written on the first run or when the number of cpu changed.
+
+    :param writer: The InfluxDB writer to hand the points to
+    :param settings: A dictionary of the job settings
     :return: None
     """
-    results = psutil.cpu_percent(interval=.1, percpu=True)
-    host_type = helpers.get_host_type()
-    client = helpers.get_influxdb_client(influxdb_config)
-    records = []
-    for cpu_num, result in enumerate(results):
-        records.append(
+    sample = samples.cpu_times_percpu_table()
+    current = sample.value
+    previous = cpu_percent_percpu_previous.swap(current)
+    if previous is None or previous.keys != current.keys:
+        return
+    result = samples.cpu_percent_columns(previous, current)
+    record = [
+        lineprotocol.Block(
+                [lineprotocol.get_series("cpu_percent_percpu", ("cpu_num", cpu_num)) for cpu_num in current.keys],
                 {
-                    "measurement": "cpu_percent_percpu",
-                    "tags": {
-                        "host_type": host_type,
-                        "host_name": platform.node(),
-                        "cpu_num": cpu_num,
-                    },
-                    "fields": {
-                        "current": result,
-                    }
-                }
+                    "current": result,
+                },
+                samples.timestamp(sample.time),
         )
-    helpers.influxdb_write_points(client, records)
+    ]
+    writer.write_points(record)
 
 
-def cpu_times_percent(influxdb_config):
+def cpu_times_percent(writer, settings):
     """Retrieve the cpu times percent
 
-    :param influxdb_config: A dictionary of InfluxDB to connect to
+    The percentages are computed over the interval since the previous run,
+    nothing is written on the first run.
+
+    :param writer: The InfluxDB writer to hand the points to
+    :param settings: A dictionary of the job settings
     :return: None
     """
-    result = psutil.cpu_times_percent(interval=0.1, percpu=False)
-    host_type = helpers.get_host_type()
-    client = helpers.get_influxdb_client(influxdb_config)
+    sample = samples.cpu_times()
+    current = sample.value
+    previous = cpu_times_percent_previous.swap(current)
+    if previous is None:
+        return
+    result = samples.cpu_times_percent(previous, current)
+    timestamp = samples.timestamp(sample.time)
     record = [
-        {
-            "measurement": "cpu_times_percent",
-            "tags": {
-                "host_type": host_type,
-                "host_name": platform.node(),
-            },
-            "fields": {
-                "user": result.user,
-                "system": result.system,
-                "idle": result.idle,
-            }
-        }
+        lineprotocol.Point(
+                lineprotocol.get_series("cpu_times_percent"),
+                {
+                    "user": result.user,
+                    "system": result.system,
+                    "idle": result.idle,
+                },
+                timestamp,
+        )
     ]
-    helpers.influxdb_write_points(client, record)
+    writer.write_points(record)
 
 
-def cpu_times_percent_percpu(influxdb_config):
+def cpu_times_percent_percpu(writer, settings):
     """Retrieve the cpu times percent per cpu
 
-    :param influxdb_config: A dictionary of InfluxDB to connect to
+    The percentages are computed over the interval since the previous run,
+    nothing is written on the first run or when the number of cpu changed.
+
+    :param writer: The InfluxDB writer to hand the points to
+    :param settings: A dictionary of the job settings
     :return: None
     """
-    results = psutil.cpu_times_percent(interval=.1, percpu=True)
-    host_type = helpers.get_host_type()
-    client = helpers.get_influxdb_client(influxdb_config)
-    records = []
-    for cpu_num, result in enumerate(results):
-        records.append(
-                {
-                    "measurement": "cpu_times_percent_percpu",
-                    "tags": {
-                        "host_type": host_type,
-                        "host_name": platform.node(),
-                        "cpu_num": cpu_num,
-                    },
-                    "fields": {
-                        "user": result.user,
-                        "system": result.system,
-                        "idle": result.idle,
-                    }
-                }
+    sample = samples.cpu_times_percpu_table()
+    current = sample.value
+    previous = cpu_times_percent_percpu_previous.swap(current)
+    if previous is None or previous.keys != current.keys:
+        return
+    result = samples.cpu_times_percent_columns(previous, current, ("user", "system", "idle"))
+    record = [
+        lineprotocol.Block(
+                [lineprotocol.get_series("cpu_times_percent_percpu", ("cpu_num", cpu_num)) for cpu_num in current.keys],
+                result,
+                samples.timestamp(sample.time),
         )
-    helpers.influxdb_write_points(client, records)
+    ]
+    writer.write_points(record)
 
 
-def cpu_count(influxdb_config):
+def cpu_count(writer, settings):
     """Retrieve the number of cpu
 
-    :param influxdb_config: A dictionary of InfluxDB to connect to
+    :param writer: The InfluxDB writer to hand the points to
+    :param settings: A dictionary of the job settings
     :return: None
     """
-    result = psutil.cpu_count()
-    host_type = helpers.get_host_type()
-    client = helpers.get_influxdb_client(influxdb_config)
+    sample = samples.read(psutil.cpu_count)
+    result = sample.value
+    timestamp = samples.timestamp(sample.time)
     record = [
-        {
-            "measurement": "cpu_count",
-            "tags": {
-                "host_type": host_type,
-                "host_name": platform.node(),
-            },
-            "fields": {
-                "value": result,
-            }
-        }
+        lineprotocol.Point(
+                lineprotocol.get_series("cpu_count"),
+                {
+                    "value": result,
+                },
+                timestamp,
+        )
     ]
-    helpers.influxdb_write_points(client, record)
+    writer.write_points(record)
 
 
-def cpu_stats(influxdb_config):
+def cpu_stats(writer, settings):
     """Retrieve the cpu statistics
 
-    :param influxdb_config: A dictionary of InfluxDB to connect to
+    :param writer: The InfluxDB writer to hand the points to
+    :param settings: A dictionary of the job settings
     :return: None
     """
-    result = psutil.cpu_stats()
-    host_type = helpers.get_host_type()
-    client = helpers.get_influxdb_client(influxdb_config)
-    record = [
-        {
-            "measurement": "cpu_stats",
-            "tags": {
-                "host_type": host_type,
-                "host_name": platform.node(),
-            },
-            "fields": {
+    sample = samples.cpu_stats()
+    result = sample.value
+    counters_mode = settings["counters"] if "counters" in settings else "raw"
+    fields = rates.get_fields(
+            cpu_stats_rates,
+            None,
+            sample.time,
+            {
                 "ctx_switches": result.ctx_switches,
                 "interrupts": result.interrupts,
                 "soft_interrupts": result.soft_interrupts,
                 "syscalls": result.syscalls,
-            }
-        }
+            },
+            counters_mode,
+    )
+    if not fields:
+        return
+    timestamp = samples.timestamp(sample.time)
+    record = [
+        lineprotocol.Point(
+                lineprotocol.get_series("cpu_stats"),
+                fields,
+                timestamp,
+        )
     ]
-    helpers.influxdb_write_points(client, record)
+    writer.write_points(record)
 
 
-def cpu_freq(influxdb_config):
+def cpu_freq(writer, settings):
     """Retrieve the cpu frequency
 
-    :param influxdb_config: A dictionary of InfluxDB to connect to
+    :param writer: The InfluxDB writer to hand the points to
+    :param settings: A dictionary of the job settings
     :return: None
     """
-    result = psutil.cpu_freq(percpu=False)
-    host_type = helpers.get_host_type()
-    client = helpers.get_influxdb_client(influxdb_config)
+    sample = samples.read(psutil.cpu_freq, percpu=False)
+    result = sample.value
+    timestamp = samples.timestamp(sample.time)
     record = [
-        {
-            "measurement": "cpu_freq",
-            "tags": {
-                "host_type": host_type,
-                "host_name": platform.node(),
-            },
-            "fields": {
-                "current": result.current,
-                "min": result.min,
-                "max": result.max,
-            }
-        }
+        lineprotocol.Point(
+                lineprotocol.get_series("cpu_freq"),
+                {
+                    "current": result.current,
+                    "min": result.min,
+                    "max": result.max,
+                },
+                timestamp,
+        )
     ]
-    helpers.influxdb_write_points(client, record)
+    writer.write_points(record)
 
 
-def cpu_freq_percpu(influxdb_config):
+def cpu_freq_percpu(writer, settings):
     """Retrieve the frequency of each cpu
 
-    :param influxdb_config: A dictionary of InfluxDB to connect to
+    :param writer: The InfluxDB writer to hand the points to
+    :param settings: A dictionary of the job settings
     :return: None
     """
-    results = psutil.cpu_freq(percpu=True)
-    host_type = helpers.get_host_type()
-    client = helpers.get_influxdb_client(influxdb_config)
-    records = []
-    for cpu_num, result in enumerate(results):
-        records.append(
-                {
-                    "measurement": "cpu_freq_percpu",
-                    "tags": {
-                        "host_type": host_type,
-                        "host_name": platform.node(),
-                        "cpu_num": cpu_num,
-                    },
-                    "fields": {
-                        "current": result.current,
-                        "min": result.min,
-                        "max": result.max,
-                    }
-                }
+    sample = samples.read(psutil.cpu_freq, percpu=True)
+    table = columns.from_rows(list(range(len(sample.value))), sample.value, ("current", "min", "max"))
+    record = [
+        lineprotocol.Block(
+                [lineprotocol.get_series("cpu_freq_percpu", ("cpu_num", cpu_num)) for cpu_num in table.keys],
+                table.columns,
+                samples.timestamp(sample.time),
         )
-    helpers.influxdb_write_points(client, records)
+    ]
+    writer.write_points(record)
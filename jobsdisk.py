@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+#
+# Standard library imports
+#
+import logging
+import os
+import select
+import threading
+import time
+#
+# Third party imports
+#
+import psutil
+#
+# Project's imports
+#
+import filters
+import lineprotocol
+import rates
+import samples
+
+
+class PartitionCache:
+    """Cache of the mounted partitions
+
+    psutil.disk_partitions() is only called again when the mount table
+    changed. On Linux, changes are detected by polling /proc/self/mounts,
+    which the kernel flags on every mount and umount. Elsewhere the list is
+    refreshed every refresh seconds.
+    """
+
+    def __init__(self, refresh=60):
+        """Creates an empty cache
+
+        :param refresh: Refresh interval (secs) when changes can not be detected
+        """
+        self.refresh = refresh
+        self.lock = threading.Lock()
+        self.partitions = None
+        self.refreshed_at = None
+        self.mounts = None
+        self.poller = None
+        if psutil.LINUX and hasattr(select, 'poll'):
+            try:
+                self.mounts = open('/proc/self/mounts', 'rb')
+                self.poller = select.poll()
+                self.poller.register(self.mounts, select.POLLPRI | select.POLLERR)
+            except OSError as e:
+                logging.getLogger().warning("Could not watch the mount table: {}".format(e))
+                self.mounts = None
+                self.poller = None
+
+    def changed(self):
+        """Tell if the mount table changed since the last refresh
+
+        Must be called with the lock held.
+
+        :return: True if the partitions must be listed again
+        """
+        if self.partitions is None:
+            return True
+        if self.poller is not None:
+            return bool(self.poller.poll(0))
+        return time.monotonic() - self.refreshed_at >= self.refresh
+
+    def get(self):
+        """Get the mounted partitions
+
+        :return: A list of psutil partition namedtuples
+        """
+        with self.lock:
+            if self.changed():
+                if self.mounts is not None:
+                    #
+                    # Reading the mount table acknowledges the change
+                    #
+                    self.mounts.seek(0)
+                    self.mounts.read()
+                self.partitions = psutil.disk_partitions(all=False)
+                self.refreshed_at = time.monotonic()
+            return self.partitions
+
+
+partition_cache = PartitionCache()
+disk_io_counters_rates = rates.RateEngine()
+disk_io_counters_perdisk_rates = rates.RateEngine()
+
+
+def disk_io_counters(writer, settings):
+    """Retrieve the disk io counters
+
+    The counters are written with their per second rates (throughput and
+    IOPS) unless the counters setting says otherwise.
+
+    :param writer: The InfluxDB writer to hand the points to
+    :param settings: A dictionary of the job settings
+    :return: None
+    """
+    sample = samples.disk_io_counters()
+    if sample.value is None:
+        return
+    counters_mode = settings["counters"] if "counters" in settings else "both"
+    fields = rates.get_fields(
+            disk_io_counters_rates,
+            None,
+            sample.time,
+            sample.value._asdict(),
+            counters_mode,
+    )
+    if not fields:
+        return
+    timestamp = samples.timestamp(sample.time)
+    record = [
+        lineprotocol.Point(
+                lineprotocol.get_series("disk_io_counters"),
+                fields,
+                timestamp,
+        )
+    ]
+    writer.write_points(record)
+
+
+def disk_io_counters_perdisk(writer, settings):
+    """Retrieve the disk io counters per disk
+
+    The disks can be filtered with the devices setting, and the counters
+    are written with their per second rates (throughput and IOPS) unless
+    the counters setting says otherwise.
+
+    :param writer: The InfluxDB writer to hand the points to
+    :param settings: A dictionary of the job settings
+    :return: None
+    """
+    sample = samples.disk_io_counters_perdisk()
+    devices = filters.get_filter('disk_io_counters_perdisk', settings, 'devices')
+    counters_mode = settings["counters"] if "counters" in settings else "both"
+    timestamp = samples.timestamp(sample.time)
+    records = []
+    for disk, counters in sample.value.items():
+        if not devices.match(disk):
+            continue
+        fields = rates.get_fields(
+                disk_io_counters_perdisk_rates,
+                disk,
+                sample.time,
+                counters._asdict(),
+                counters_mode,
+        )
+        if not fields:
+            continue
+        records.append(
+                lineprotocol.Point(
+                        lineprotocol.get_series("disk_io_counters_perdisk", ("disk_name", disk)),
+                        fields,
+                        timestamp,
+                )
+        )
+    if records:
+        writer.write_points(records)
+
+
+def disk_usage(writer, settings):
+    """Retrieve the usage of the mounted file systems
+
+    The file systems can be filtered on their device name with the devices
+    setting and on their type with the fstypes setting.
+
+    :param writer: The InfluxDB writer to hand the points to
+    :param settings: A dictionary of the job settings
+    :return: None
+    """
+    devices = filters.get_filter('disk_usage', settings, 'devices')
+    fstypes = filters.get_filter('disk_usage', settings, 'fstypes')
+    timestamp = samples.timestamp(time.monotonic())
+    records = []
+    for partition in partition_cache.get():
+        if not devices.match(os.path.basename(partition.device)) or not fstypes.match(partition.fstype):
+            continue
+        try:
+            result = psutil.disk_usage(partition.mountpoint)
+        except OSError:
+            continue
+        records.append(
+                lineprotocol.Point(
+                        lineprotocol.get_series(
+                                "disk_usage",
+                                ("device", partition.device),
+                                ("fstype", partition.fstype),
+                                ("mountpoint", partition.mountpoint),
+                        ),
+                        {
+                            "total": result.total,
+                            "used": result.used,
+                            "free": result.free,
+                            "percent": result.percent,
+                        },
+                        timestamp,
+                )
+        )
+    if records:
+        writer.write_points(records)
@@ -1,44 +1,35 @@
 # -*- coding: utf-8 -*-
 
-#
-# Standard library imports
-#
-import platform
-#
-# Third party imports
-#
-import psutil
 #
 # Project's imports
 #
-import helpers
+import lineprotocol
+import samples
 
 
-def memory_virtual_memory(influxdb_config):
+def memory_virtual_memory(writer, settings):
     """Retrieve the system memory usage
 
-    :param influxdb_config: A dictionary of InfluxDB to connect to
+    :param writer: The InfluxDB writer to hand the points to
+    :param settings: A dictionary of the job settings
     :return: None
     """
-    result = psutil.virtual_memory()
-    host_type = helpers.get_host_type()
+    sample = samples.virtual_memory()
+    result = sample.value
+    timestamp = samples.timestamp(sample.time)
     #
     # TODO -> Add platform specific counters
     #
-    client = helpers.get_influxdb_client(influxdb_config)
     record = [
-        {
-            "measurement": "virtual_memory",
-            "tags": {
-                "host_type": host_type,
-                "host_name": platform.node(),
-            },
-            "fields": {
-                "total": result.total,
-                "available": result.available,
-                "used": result.used,
-                "free": result.free,
-            }
-        }
+        lineprotocol.Point(
+                lineprotocol.get_series("virtual_memory"),
+                {
+                    "total": result.total,
+                    "available": result.available,
+                    "used": result.used,
+                    "free": result.free,
+                },
+                timestamp,
+        )
     ]
-    helpers.influxdb_write_points(client, record)
+    writer.write_points(record)
@@ -1,87 +1,164 @@
 # -*- coding: utf-8 -*-
 
-#
-# Standard library imports
-#
-import platform
-#
-# Third party imports
-#
-import psutil
 #
 # Project's imports
 #
-import helpers
+import columns
+import filters
+import lineprotocol
+import rates
+import samples
+
 
+network_io_counters_rates = rates.RateEngine()
+network_io_counters_pernic_rates = rates.ColumnRates()
+network_io_counters_pernic_tracker = filters.NameTracker()
+
+
+def get_counters(result):
+    """Build the counters of a network io sample
+
+    :param result: A psutil network io namedtuple
+    :return: A dictionary of counter names to values
+    """
+    return {
+        "bytes_sent": result.bytes_sent,
+        "bytes_recv": result.bytes_recv,
+        "bytes_total": result.bytes_sent + result.bytes_recv,
+        "packets_sent": result.packets_sent,
+        "packets_recv": result.packets_recv,
+        "packets_total": result.packets_sent + result.packets_recv,
+        "errors_in": result.errin,
+        "errors_out": result.errout,
+        "errors_total": result.errin + result.errout,
+        "drops_in": result.dropin,
+        "drops_out": result.dropout,
+        "drops_total": result.dropin + result.dropout,
+    }
 
-def network_io_counters(influxdb_config):
+
+def get_counter_columns(table):
+    """Build the counters of a table of network io samples
+
+    :param table: A columns.Table of psutil network io counters
+    :return: A dictionary of counter names to columns
+    """
+    counters = table.columns
+    return {
+        "bytes_sent": counters["bytes_sent"],
+        "bytes_recv": counters["bytes_recv"],
+        "bytes_total": columns.add(counters["bytes_sent"], counters["bytes_recv"]),
+        "packets_sent": counters["packets_sent"],
+        "packets_recv": counters["packets_recv"],
+        "packets_total": columns.add(counters["packets_sent"], counters["packets_recv"]),
+        "errors_in": counters["errin"],
+        "errors_out": counters["errout"],
+        "errors_total": columns.add(counters["errin"], counters["errout"]),
+        "drops_in": counters["dropin"],
+        "drops_out": counters["dropout"],
+        "drops_total": columns.add(counters["dropin"], counters["dropout"]),
+    }
+
+
+def network_io_counters(writer, settings):
     """Retrieve the network io counters
 
-    :param influxdb_config: A dictionary of InfluxDB to connect to
+    :param writer: The InfluxDB writer to hand the points to
+    :param settings: A dictionary of the job settings
     :return: None
     """
-    result = psutil.net_io_counters(pernic=False)
-    host_type = helpers.get_host_type()
-    client = helpers.get_influxdb_client(influxdb_config)
+    sample = samples.net_io_counters()
+    counters_mode = settings["counters"] if "counters" in settings else "raw"
+    fields = rates.get_fields(
+            network_io_counters_rates,
+            None,
+            sample.time,
+            get_counters(sample.value),
+            counters_mode,
+    )
+    if not fields:
+        return
+    timestamp = samples.timestamp(sample.time)
     record = [
-        {
-            "measurement": "network_io_counters",
-            "tags": {
-                "host_type": host_type,
-                "host_name": platform.node(),
-            },
-            "fields": {
-                "bytes_sent": result.bytes_sent,
-                "bytes_recv": result.bytes_recv,
-                "bytes_total": result.bytes_sent + result.bytes_recv,
-                "packets_sent": result.packets_sent,
-                "packets_recv": result.packets_recv,
-                "packets_total": result.packets_sent + result.packets_recv,
-                "errors_in": result.errin,
-                "errors_out": result.errout,
-                "errors_total": result.errin + result.errout,
-                "drops_in": result.dropin,
-                "drops_out": result.dropout,
-                "drops_total": result.dropin + result.dropout,
-            }
-        }
+        lineprotocol.Point(
+                lineprotocol.get_series("network_io_counters"),
+                fields,
+                timestamp,
+        )
     ]
-    helpers.influxdb_write_points(client, record)
+    writer.write_points(record)
 
 
-def network_io_counters_pernic(influxdb_config):
+def network_io_counters_pernic(writer, settings):
     """Retrieve the network io counters per NIC
 
-    :param influxdb_config: A dictionary of InfluxDB to connect to
+    The NICs can be filtered with the nics setting, and the number of NICs
+    reported can be capped with max_nics, the NICs seen first keeping their
+    place. With other set, the counters and rates of the NICs left out are
+    summed into a single series tagged nic_name=other. NICs not seen for
+    expire seconds are forgotten.
+
+    :param writer: The InfluxDB writer to hand the points to
+    :param settings: A dictionary of the job settings
     :return: None
     """
-    results = psutil.net_io_counters(pernic=True)
-    host_type = helpers.get_host_type()
-    client = helpers.get_influxdb_client(influxdb_config)
-    records = []
-    for nic, counters in results.items():
-        records.append(
-                {
-                    "measurement": "network_io_counters_pernic",
-                    "tags": {
-                        "host_type": host_type,
-                        "host_name": platform.node(),
-                        "nic_name": nic,
-                    },
-                    "fields": {
-                        "bytes_sent": counters.bytes_sent,
-                        "bytes_recv": counters.bytes_recv,
-                        "bytes_total": counters.bytes_sent + counters.bytes_recv,
-                        "packets_sent": counters.packets_sent,
-                        "packets_recv": counters.packets_recv,
-                        "packets_total": counters.packets_sent + counters.packets_recv,
-                        "errors_in": counters.errin,
-                        "errors_out": counters.errout,
-                        "errors_total": counters.errin + counters.errout,
-                        "drops_in": counters.dropin,
-                        "drops_out": counters.dropout,
-                        "drops_total": counters.dropin + counters.dropout,
-                    }
-                }
+    sample = samples.net_io_counters_pernic_table()
+    table = sample.value
+    counters_mode = settings["counters"] if "counters" in settings else "raw"
+    max_nics = settings["max_nics"] if "max_nics" in settings else None
+    expire = settings["expire"] if "expire" in settings else 300
+    other = settings["other"] if "other" in settings else False
+    nics = filters.get_filter('network_io_counters_pernic', settings, 'nics')
+    tracked, expired = network_io_counters_pernic_tracker.track(
+            [nic for nic in table.keys if nics.match(nic)],
+            sample.time,
+            max_nics,
+            expire,
+    )
+    for nic in expired:
+        lineprotocol.forget_series("network_io_counters_pernic", ("nic_name", nic))
+    kept = [position for position, nic in enumerate(table.keys) if nic in tracked]
+    left_out = [position for position, nic in enumerate(table.keys) if nic not in tracked]
+    if left_out and not other:
+        #
+        # The NICs left out are not tracked at all, not even their rates
+        #
+        table = columns.select_rows(table, kept)
+    fields = rates.get_column_fields(
+            network_io_counters_pernic_rates,
+            sample.time,
+            table.keys,
+            get_counter_columns(table),
+            counters_mode,
+    )
+    if not fields:
+        return
+    timestamp = samples.timestamp(sample.time)
+    record = []
+    keys = table.keys
+    other_fields = {}
+    if left_out and other:
+        keys = [table.keys[position] for position in kept]
+        for name, column in fields.items():
+            value = columns.sum_rows(column, left_out)
+            if value == value:
+                other_fields[name] = value
+        fields = {name: columns.select(column, kept) for name, column in fields.items()}
+    if keys:
+        record.append(
+                lineprotocol.Block(
+                        [lineprotocol.get_series("network_io_counters_pernic", ("nic_name", nic)) for nic in keys],
+                        fields,
+                        timestamp,
+                )
+        )
+    if other_fields:
+        record.append(
+                lineprotocol.Point(
+                        lineprotocol.get_series("network_io_counters_pernic", ("nic_name", "other")),
+                        other_fields,
+                        timestamp,
+                )
         )
-    helpers.influxdb_write_points(client, records)
+    if record:
+        writer.write_points(record)
@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+
+#
+# Standard library imports
+#
+import logging
+import os
+import select
+import threading
+import time
+#
+# Project's imports
+#
+import lineprotocol
+import procfs
+import rates
+import samples
+
+
+PSI_PATH = '/proc/pressure'
+RESOURCES = ('cpu', 'memory', 'io')
+
+
+def parse_pressure(buffer, size):
+    """Parse the content of a PSI file
+
+    :param buffer: The content of the file, e.g. b'some avg10=0.12 avg60=0.05 avg300=0.01 total=123456\n...'
+    :param size: The size of the content
+    :return: A dictionary of the values, e.g. some_avg10 (%) and some_total (µs)
+    """
+    values = {}
+    for line in bytes(buffer[:size]).split(b'\n'):
+        kind, _, pairs = line.partition(b' ')
+        if not pairs:
+            continue
+        kind = kind.decode('ascii')
+        for pair in pairs.split():
+            key, _, value = pair.partition(b'=')
+            name = "{}_{}".format(kind, key.decode('ascii'))
+            values[name] = float(value) if b'.' in value else int(value)
+    return values
+
+
+class PressureReader:
+    """Reader of the pressure stall information (PSI) of Linux
+
+    Keeps the cpu, memory and io files of /proc/pressure open and re-reads
+    them in place. The resources whose file can not be opened or read
+    (kernels without PSI, or booted with psi=0) are left out.
+    """
+
+    def __init__(self, psi_path=PSI_PATH):
+        """Opens the PSI files
+
+        :param psi_path: The directory of the PSI files
+        """
+        self.psi_path = psi_path
+        self.files = {}
+        for resource in RESOURCES:
+            try:
+                self.files[resource] = procfs.ProcFile(os.path.join(psi_path, resource))
+            except OSError:
+                continue
+
+    def read_resource(self, resource):
+        """Read the pressure of a resource
+
+        :param resource: The name of the resource (cpu, memory or io)
+        :return: A dictionary of the values, None if the resource can not be read
+        """
+        proc_file = self.files.get(resource)
+        if proc_file is None:
+            return None
+        with proc_file.lock:
+            try:
+                size = proc_file.read()
+            except OSError:
+                return None
+            return parse_pressure(proc_file.buffer, size)
+
+    def read(self):
+        """Read the pressure of all the resources
+
+        :return: A dictionary of resource names to dictionaries of values
+        """
+        results = {}
+        for resource in self.files:
+            values = self.read_resource(resource)
+            if values is not None:
+                results[resource] = values
+        return results
+
+
+class TriggerWatcher:
+    """Thread reporting the PSI trigger events as they happen
+
+    Each trigger asks the kernel to wake the watcher up when the tasks of
+    the host were stalled on a resource (some of them, or all of them with
+    full) for more than stall seconds within window seconds. The kernel
+    does the monitoring, so events are caught the moment they happen
+    without polling the PSI files. A pressure_events point is written for
+    every event. Without CAP_SYS_RESOURCE, the window must be a multiple of
+    2 secs. The watcher stops itself when the job has not run for three of
+    its intervals, e.g. when it was removed from the configuration.
+    """
+
+    def __init__(self, writer, reader, triggers_config, interval):
+        """Registers the triggers and starts the watcher thread
+
+        :param writer: The InfluxDB writer to hand the points to
+        :param reader: A PressureReader object
+        :param triggers_config: A list of dictionaries of the triggers configuration
+        :param interval: The interval (secs) of the job
+        """
+        logger = logging.getLogger()
+        self.writer = writer
+        self.reader = reader
+        self.triggers_config = triggers_config
+        self.timeout = 3 * interval
+        self.last_run = time.monotonic()
+        self.expired = False
+        self.stopping = False
+        self.poller = select.poll()
+        self.triggers = {}
+        for trigger_config in triggers_config:
+            resource = trigger_config["resource"] if "resource" in trigger_config else "memory"
+            kind = trigger_config["type"] if "type" in trigger_config else "some"
+            stall = trigger_config["stall"] if "stall" in trigger_config else 0.1
+            window = trigger_config["window"] if "window" in trigger_config else 2
+            try:
+                fd = os.open(os.path.join(reader.psi_path, resource), os.O_RDWR | os.O_NONBLOCK)
+            except OSError as e:
+                logger.warning("Could not open the PSI file of {}: {}".format(resource, e))
+                continue
+            try:
+                os.write(fd, "{} {} {}\0".format(kind, int(stall * 10 ** 6), int(window * 10 ** 6)).encode('ascii'))
+            except OSError as e:
+                logger.warning("Could not register the {} {} PSI trigger ({} secs in {} secs): {}".format(
+                        resource, kind, stall, window, e))
+                os.close(fd)
+                continue
+            self.poller.register(fd, select.POLLPRI)
+            self.triggers[fd] = (resource, kind, stall, window)
+        self.watcher = threading.Thread(target=self.watch_loop, name='sysprobe-psi-watcher', daemon=True)
+        if self.triggers:
+            self.watcher.start()
+
+    def watch_loop(self):
+        """Watcher thread body: waits for the events of the triggers
+
+        :return: None
+        """
+        logger = logging.getLogger()
+        try:
+            while not self.stopping and self.triggers:
+                if time.monotonic() - self.last_run > self.timeout:
+                    logger.info("The pressure job stopped running, stopping the PSI triggers")
+                    self.expired = True
+                    break
+                for fd, event in self.poller.poll(1000):
+                    if event & select.POLLERR:
+                        #
+                        # The PSI file went away
+                        #
+                        self.poller.unregister(fd)
+                        os.close(fd)
+                        del self.triggers[fd]
+                    elif event & select.POLLPRI:
+                        self.report(*self.triggers[fd])
+        except Exception:
+            logger.exception("Unexpected error watching the PSI triggers")
+        finally:
+            self.close_triggers()
+
+    def report(self, resource, kind, stall, window):
+        """Write the point of a trigger event
+
+        :param resource: The name of the resource
+        :param kind: The type of stall, some or full
+        :param stall: The stall threshold (secs) of the trigger
+        :param window: The window (secs) of the trigger
+        :return: None
+        """
+        sample = samples.read(self.reader.read_resource, resource)
+        fields = {
+            "stall": float(stall),
+            "window": float(window),
+        }
+        if sample.value is not None and "{}_avg10".format(kind) in sample.value:
+            fields["avg10"] = sample.value["{}_avg10".format(kind)]
+        self.writer.write_points([
+            lineprotocol.Point(
+                    lineprotocol.get_series("pressure_events", ("resource", resource), ("type", kind)),
+                    fields,
+                    samples.timestamp(sample.time),
+            )
+        ])
+
+    def close_triggers(self):
+        """Unregister the triggers
+
+        :return: None
+        """
+        for fd in list(self.triggers):
+            self.poller.unregister(fd)
+            os.close(fd)
+        self.triggers = {}
+
+    def close(self):
+        """Stop the watcher thread, unregistering the triggers
+
+        :return: None
+        """
+        self.stopping = True
+        if self.watcher.is_alive():
+            self.watcher.join()
+        else:
+            self.close_triggers()
+
+
+pressure_rates = rates.RateEngine()
+pressure_lock = threading.Lock()
+pressure_reader = None
+trigger_watcher = None
+
+
+def get_reader():
+    """Get the PSI reader, created on the first run
+
+    :return: A PressureReader object, None if PSI is not available
+    """
+    global pressure_reader
+    with pressure_lock:
+        if pressure_reader is None:
+            pressure_reader = PressureReader()
+            if not pressure_reader.read():
+                logging.getLogger().warning("Pressure stall information is not available on this host")
+        return pressure_reader if pressure_reader.files else None
+
+
+def update_watcher(writer, reader, settings):
+    """Start, restart or stop the trigger watcher according to the job settings
+
+    :param writer: The InfluxDB writer to hand the points to
+    :param reader: A PressureReader object
+    :param settings: A dictionary of the job settings
+    :return: None
+    """
+    global trigger_watcher
+    triggers_config = settings["triggers"] if "triggers" in settings else []
+    interval = settings["interval"] if "interval" in settings else 60
+    with pressure_lock:
+        watcher = trigger_watcher
+        if (
+                watcher is not None and not watcher.expired
+                and watcher.writer is writer and watcher.triggers_config == triggers_config
+        ):
+            watcher.last_run = time.monotonic()
+            watcher.timeout = 3 * interval
+            return
+        if watcher is not None:
+            watcher.close()
+        trigger_watcher = TriggerWatcher(writer, reader, triggers_config, interval) if triggers_config else None
+
+
+def pressure(writer, settings):
+    """Retrieve the pressure stall information of the cpu, memory and io
+
+    Writes one pressure point per resource, with the share of time (%) some
+    tasks (some_*) or all of them (full_*) were stalled on the resource
+    over the last 10, 60 and 300 secs, and the total stall time (µs,
+    counters setting: raw by default). The triggers setting registers PSI
+    triggers, reported as pressure_events points as soon as they fire.
+    Nothing is written on hosts without PSI.
+
+    :param writer: The InfluxDB writer to hand the points to
+    :param settings: A dictionary of the job settings
+    :return: None
+    """
+    reader = get_reader()
+    if reader is None:
+        return
+    update_watcher(writer, reader, settings)
+    sample = samples.read(reader.read)
+    counters_mode = settings["counters"] if "counters" in settings else "raw"
+    timestamp = samples.timestamp(sample.time)
+    records = []
+    for resource, values in sample.value.items():
+        fields = {name: value for name, value in values.items() if not name.endswith('_total')}
+        fields.update(rates.get_fields(
+                pressure_rates,
+                resource,
+                sample.time,
+                {name: value for name, value in values.items() if name.endswith('_total')},
+                counters_mode,
+        ))
+        records.append(
+                lineprotocol.Point(
+                        lineprotocol.get_series("pressure", ("resource", resource)),
+                        fields,
+                        timestamp,
+                )
+        )
+    if records:
+        writer.write_points(records)
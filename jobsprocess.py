@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+#
+# Standard library imports
+#
+import heapq
+import threading
+import time
+#
+# Third party imports
+#
+import psutil
+#
+# Project's imports
+#
+import lineprotocol
+import samples
+
+
+class ProcessTable:
+    """Cache of the psutil.Process objects of the running processes
+
+    The process objects are kept across runs, so the cpu usage of a process
+    is computed over the interval since the previous run. A process is
+    primed (its first cpu_percent() call) when it is first seen, and only
+    reported from the next run on. Processes that disappeared are dropped.
+    The processes are listed by psutil.process_iter, which keeps the same
+    object for a process across calls and a new one when its pid is reused.
+    """
+
+    def __init__(self):
+        """Creates an empty table"""
+        self.lock = threading.Lock()
+        self.processes = {}
+
+    def refresh(self):
+        """Synchronize the table with the running processes
+
+        :return: A set of the pids of the processes added by this refresh
+        """
+        processes = {}
+        added = set()
+        for process in psutil.process_iter():
+            pid = process.pid
+            if self.processes.get(pid) is not process:
+                try:
+                    process.cpu_percent(None)
+                except (psutil.NoSuchProcess, psutil.AccessDenied):
+                    continue
+                added.add(pid)
+            processes[pid] = process
+        self.processes = processes
+        return added
+
+    def sample(self):
+        """Read the cpu usage, resident memory and status of the processes
+
+        :return: A tuple of a list of (pid, name, cpu percent, rss) tuples
+                 and of a dictionary of statuses to process counts
+        """
+        with self.lock:
+            added = self.refresh()
+            results = []
+            statuses = {}
+            for pid, process in list(self.processes.items()):
+                try:
+                    with process.oneshot():
+                        status = process.status()
+                        statuses[status] = statuses.get(status, 0) + 1
+                        if pid in added:
+                            continue
+                        cpu_percent = process.cpu_percent(None)
+                        rss = process.memory_info().rss
+                        name = process.name()
+                except psutil.NoSuchProcess:
+                    del self.processes[pid]
+                    continue
+                except psutil.AccessDenied:
+                    continue
+                results.append((pid, name, cpu_percent, rss))
+            return results, statuses
+
+
+process_table = ProcessTable()
+
+
+def processes(writer, settings):
+    """Retrieve the processes counters
+
+    Writes the number of processes by status, and the cpu usage and
+    resident memory of the top processes by cpu (or rss). The number of
+    processes reported (top, default 10) and the sort key (sort_by: cpu or
+    rss) are read from the job settings. The top processes are tagged with
+    their name and their rank among the top processes of that name (1 for
+    the first), their pid being a field, so that short-lived processes do
+    not each create a series and processes sharing a name (e.g. nginx
+    workers) do not overwrite each other.
+
+    :param writer: The InfluxDB writer to hand the points to
+    :param settings: A dictionary of the job settings
+    :return: None
+    """
+    top = settings["top"] if "top" in settings else 10
+    sort_by = settings["sort_by"] if "sort_by" in settings else "cpu"
+    timestamp = samples.timestamp(time.monotonic())
+    results, statuses = process_table.sample()
+    counts = {"total": sum(statuses.values())}
+    counts.update(statuses)
+    records = [
+        lineprotocol.Point(
+                lineprotocol.get_series("processes"),
+                counts,
+                timestamp,
+        )
+    ]
+    key = (lambda result: result[3]) if sort_by == "rss" else (lambda result: result[2])
+    ranks = {}
+    for pid, name, cpu_percent, rss in heapq.nlargest(top, results, key=key):
+        rank = ranks[name] = ranks.get(name, 0) + 1
+        records.append(
+                lineprotocol.Point(
+                        lineprotocol.get_series("processes_top", ("process_name", name), ("rank", rank)),
+                        {
+                            "pid": pid,
+                            "cpu_percent": cpu_percent,
+                            "rss": rss,
+                        },
+                        timestamp,
+                )
+        )
+    writer.write_points(records)
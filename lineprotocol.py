@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+
+#
+# Standard library imports
+#
+import collections
+import numbers
+import platform
+import threading
+#
+# Third party imports
+#
+from influxdb import line_protocol
+#
+# Project's imports
+#
+import columns
+import helpers
+
+
+Point = collections.namedtuple('Point', ['series', 'fields', 'time'])
+Point.__doc__ = """A point of a series: a dictionary of fields and a timestamp (ns) or None"""
+
+Block = collections.namedtuple('Block', ['series', 'columns', 'time'])
+Block.__doc__ = """Points of several series sharing their field names and timestamp: a list of Series, a dictionary
+of field names to columns of values (one per series, None or NaN when missing) and a timestamp (ns) or None"""
+
+#
+# Timestamp precisions of the InfluxDB write API, and the number of
+# nanoseconds in one unit of each
+#
+PRECISIONS = {
+    'n': 1,
+    'u': 10 ** 3,
+    'ms': 10 ** 6,
+    's': 10 ** 9,
+    'm': 60 * 10 ** 9,
+    'h': 3600 * 10 ** 9,
+}
+
+
+def escape_key(key):
+    """Escape a measurement, a tag key, a tag value or a field key
+
+    :param key: The key to escape
+    :return: The escaped key
+    """
+    return str(key).replace(
+            "\\", "\\\\"
+    ).replace(
+            " ", "\\ "
+    ).replace(
+            ",", "\\,"
+    ).replace(
+            "=", "\\="
+    ).replace(
+            "\n", "\\n"
+    )
+
+
+field_keys = {}
+
+
+def escape_field_key(key):
+    """Escape a field key, caching the result
+
+    :param key: The field key
+    :return: The escaped field key
+    """
+    escaped = field_keys.get(key)
+    if escaped is None:
+        escaped = field_keys[key] = escape_key(key)
+    return escaped
+
+
+def format_value(value):
+    """Format a field value
+
+    :param value: The field value
+    :return: The formatted value
+    """
+    value_type = type(value)
+    if value_type is float:
+        return repr(value)
+    if value_type is int:
+        return '{}i'.format(value)
+    if value_type is bool:
+        return str(value)
+    if value_type is str:
+        return '"{}"'.format(value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+    if isinstance(value, numbers.Integral):
+        return '{}i'.format(int(value))
+    return repr(float(value))
+
+
+class Series:
+    """A measurement and its tag set, escaped once
+
+    The prefix of the lines of the series (measurement and sorted tags) is
+    computed when the series is created, so rendering a point only formats
+    its fields and timestamp.
+    """
+
+    def __init__(self, measurement, tags):
+        """Creates the series
+
+        :param measurement: The name of the measurement
+        :param tags: A dictionary of the tags
+        """
+        self.measurement = measurement
+        self.tags = tags
+        self.prefix = escape_key(measurement) + ''.join(
+                ',{}={}'.format(escape_key(key), escape_key(tags[key])) for key in sorted(tags) if tags[key] != ''
+        )
+
+    def render(self, fields, time=None):
+        """Render a point of the series to line protocol
+
+        Missing (None or NaN) values are left out, which InfluxDB would
+        reject.
+
+        :param fields: A dictionary of the fields
+        :param time: The timestamp of the point in the write precision, None to let InfluxDB stamp it
+        :return: A line-protocol string, None if the point has no fields left
+        """
+        line = ','.join(
+                escape_field_key(key) + '=' + format_value(value)
+                for key, value in fields.items() if value is not None and value == value
+        )
+        if not line:
+            return None
+        line = self.prefix + ' ' + line
+        if time is not None:
+            line += ' ' + str(int(time))
+        return line
+
+
+host_tags = None
+series_cache = {}
+series_lock = threading.Lock()
+
+
+def get_host_tags():
+    """Get the static tags of the host, probed once
+
+    :return: A dictionary of the host tags
+    """
+    global host_tags
+    if host_tags is None:
+        host_tags = {
+            "host_type": helpers.get_host_type(),
+            "host_name": platform.node(),
+        }
+    return host_tags
+
+
+def get_series(measurement, *tags):
+    """Get the series of a measurement of this host
+
+    The series are created once and cached, tagged with the host tags and
+    the given extra tags.
+
+    :param measurement: The name of the measurement
+    :param tags: Extra (key, value) tag pairs, e.g. ('cpu_num', 0)
+    :return: A Series object
+    """
+    key = (measurement,) + tags
+    series = series_cache.get(key)
+    if series is None:
+        with series_lock:
+            series = series_cache.get(key)
+            if series is None:
+                series_tags = dict(get_host_tags())
+                series_tags.update(tags)
+                series = series_cache[key] = Series(measurement, series_tags)
+    return series
+
+
+def forget_series(measurement, *tags):
+    """Drop a series from the cache
+
+    :param measurement: The name of the measurement
+    :param tags: Extra (key, value) tag pairs of the series
+    :return: None
+    """
+    with series_lock:
+        series_cache.pop((measurement,) + tags, None)
+
+
+def render_block(block, time):
+    """Render the points of a block to line protocol, straight from its columns
+
+    Missing values are left out, and so are the series left without fields.
+
+    :param block: A Block object
+    :param time: The timestamp of the points in the write precision, None to let InfluxDB stamp them
+    :return: A list of line-protocol strings
+    """
+    keys = [escape_field_key(name) + '=' for name in block.columns]
+    values = zip(*[columns.tolist(column) for column in block.columns.values()])
+    suffix = ' ' + str(int(time)) if time is not None else ''
+    lines = []
+    for series, row in zip(block.series, values):
+        fields = ','.join(
+                key + format_value(value) for key, value in zip(keys, row) if value is not None and value == value
+        )
+        if fields:
+            lines.append(series.prefix + ' ' + fields + suffix)
+    return lines
+
+
+def expand(points):
+    """Expand the blocks of a list of points to Point objects
+
+    :param points: A list of points
+    :return: A list of points without blocks
+    """
+    if not any(type(point) is Block for point in points):
+        return points
+    expanded = []
+    for point in points:
+        if type(point) is not Block:
+            expanded.append(point)
+            continue
+        names = list(point.columns)
+        values = zip(*[columns.tolist(column) for column in point.columns.values()])
+        for series, row in zip(point.series, values):
+            fields = {name: value for name, value in zip(names, row) if value is not None and value == value}
+            if fields:
+                expanded.append(Point(series, fields, point.time))
+    return expanded
+
+
+def count_points(points):
+    """Count the points of a list of points, blocks counting for their series
+
+    :param points: A list of points
+    :return: The number of points
+    """
+    return sum(len(point.series) if type(point) is Block else 1 for point in points)
+
+
+def split(points, size):
+    """Split a list of points after its first size points
+
+    Blocks are not split, so the head may hold a few more points.
+
+    :param points: A list of points
+    :param size: The number of points of the head
+    :return: A tuple of the head, of the rest of the list and of the number of points of the head
+    """
+    count = 0
+    for index, point in enumerate(points):
+        if count >= size:
+            return points[:index], points[index:], count
+        count += len(point.series) if type(point) is Block else 1
+    return points, [], count
+
+
+def render(points, default_time=None, precision='n'):
+    """Render points to line protocol
+
+    Points may be Point objects, Block objects or, for compatibility,
+    dictionaries in the format of the InfluxDB client. The points left
+    without fields, e.g. by change-only emission, are dropped.
+
+    :param points: A list of points
+    :param default_time: The timestamp (ns) of the points without one
+    :param precision: The precision of the rendered timestamps, one of PRECISIONS
+    :return: A list of line-protocol strings
+    """
+    divisor = PRECISIONS[precision]
+    lines = []
+    records = []
+    for point in points:
+        if type(point) is Point:
+            time = point.time if point.time is not None else default_time
+            if time is not None and divisor != 1:
+                time //= divisor
+            line = point.series.render(point.fields, time)
+            if line is not None:
+                lines.append(line)
+        elif type(point) is Block:
+            time = point.time if point.time is not None else default_time
+            if time is not None and divisor != 1:
+                time //= divisor
+            lines.extend(render_block(point, time))
+        elif default_time is not None and "time" not in point:
+            records.append(dict(point, time=default_time // divisor))
+        else:
+            records.append(point)
+    if records:
+        lines.extend(line_protocol.make_lines({"points": records}).splitlines())
+    return lines
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+
+#
+# Standard library imports
+#
+import collections
+import logging
+import os
+import threading
+
+
+CpuTimes = collections.namedtuple(
+        'CpuTimes',
+        ['user', 'nice', 'system', 'idle', 'iowait', 'irq', 'softirq', 'steal', 'guest', 'guest_nice'],
+)
+CpuStats = collections.namedtuple('CpuStats', ['ctx_switches', 'interrupts', 'soft_interrupts', 'syscalls'])
+VirtualMemory = collections.namedtuple('VirtualMemory', ['total', 'available', 'used', 'free'])
+NetIO = collections.namedtuple(
+        'NetIO',
+        ['bytes_sent', 'bytes_recv', 'packets_sent', 'packets_recv', 'errin', 'errout', 'dropin', 'dropout'],
+)
+
+
+class ProcFile:
+    """A /proc file kept open and re-read in place
+
+    The file is opened once and every read is a pread at offset 0 into the
+    same buffer, which is only grown when the content no longer fits.
+    """
+
+    def __init__(self, path, size=4096):
+        """Opens the file
+
+        :param path: The path name of the file
+        :param size: The initial size of the buffer
+        """
+        self.path = path
+        self.fd = os.open(path, os.O_RDONLY)
+        self.buffer = bytearray(size)
+        self.lock = threading.Lock()
+
+    def read(self):
+        """Re-read the file into the buffer
+
+        Must be called with the lock held.
+
+        :return: The number of bytes read
+        """
+        while True:
+            if hasattr(os, 'preadv'):
+                size = os.preadv(self.fd, [self.buffer], 0)
+            else:
+                data = os.pread(self.fd, len(self.buffer), 0)
+                size = len(data)
+                self.buffer[:size] = data
+            if size < len(self.buffer):
+                return size
+            self.buffer = bytearray(len(self.buffer) * 2)
+
+    def close(self):
+        """Close the file
+
+        :return: None
+        """
+        os.close(self.fd)
+
+
+def find_line(buffer, size, key):
+    """Find the line of a file starting with a key
+
+    :param buffer: The content of the file
+    :param size: The size of the content
+    :param key: The key starting the line
+    :return: A tuple of the offsets of the end of the key and of the end of the line, None if not found
+    """
+    if buffer.startswith(key):
+        start = 0
+    else:
+        start = buffer.find(b'\n' + key, 0, size)
+        if start < 0:
+            return None
+        start += 1
+    end = buffer.find(b'\n', start, size)
+    return start + len(key), end if end >= 0 else size
+
+
+def first_number(buffer, size, key):
+    """Get the first number of the line of a file starting with a key
+
+    :param buffer: The content of the file
+    :param size: The size of the content
+    :param key: The key starting the line
+    :return: The number, None if the line was not found
+    """
+    line = find_line(buffer, size, key)
+    if line is None:
+        return None
+    start, end = line
+    while buffer[start] == 0x20:
+        start += 1
+    space = buffer.find(b' ', start, end)
+    return int(buffer[start:space if space >= 0 else end])
+
+
+class ProcfsReader:
+    """Linux fast-path reader of the cpu, memory and network counters
+
+    Keeps /proc/stat, /proc/meminfo and /proc/net/dev open and parses only
+    the fields reported by the jobs. The values are returned in namedtuples
+    with the same field names and units as their psutil counterparts.
+    """
+
+    def __init__(self, procfs_path='/proc'):
+        """Opens the /proc files
+
+        :param procfs_path: The mount point of procfs
+        """
+        self.clock_ticks = os.sysconf('SC_CLK_TCK')
+        self.stat = ProcFile(os.path.join(procfs_path, 'stat'), size=16384)
+        self.meminfo = ProcFile(os.path.join(procfs_path, 'meminfo'))
+        self.net_dev = ProcFile(os.path.join(procfs_path, 'net', 'dev'))
+
+    def cpu_times_percpu(self):
+        """Get the cpu times of each cpu
+
+        :return: A list of CpuTimes namedtuples
+        """
+        results = []
+        padding = (0.0,) * len(CpuTimes._fields)
+        with self.stat.lock:
+            size = self.stat.read()
+            buffer = self.stat.buffer
+            #
+            # The cpu lines come first, the aggregated "cpu " line is skipped
+            #
+            start = buffer.find(b'\n', 0, size) + 1
+            while buffer.startswith(b'cpu', start):
+                end = buffer.find(b'\n', start, size)
+                if end < 0:
+                    end = size
+                values = buffer[start:end].split()[1:]
+                times = [int(value) / self.clock_ticks for value in values[:len(CpuTimes._fields)]]
+                results.append(CpuTimes(*(times + list(padding[len(times):]))))
+                start = end + 1
+        return results
+
+    def cpu_stats(self):
+        """Get the cpu statistics
+
+        :return: A CpuStats namedtuple
+        """
+        with self.stat.lock:
+            size = self.stat.read()
+            buffer = self.stat.buffer
+            return CpuStats(
+                    first_number(buffer, size, b'ctxt '),
+                    first_number(buffer, size, b'intr '),
+                    first_number(buffer, size, b'softirq ') or 0,
+                    0,
+            )
+
+    def virtual_memory(self):
+        """Get the system memory usage
+
+        :return: A VirtualMemory namedtuple, None if MemAvailable is not reported
+        """
+        with self.meminfo.lock:
+            size = self.meminfo.read()
+            buffer = self.meminfo.buffer
+            total = first_number(buffer, size, b'MemTotal:') * 1024
+            free = first_number(buffer, size, b'MemFree:') * 1024
+            available = first_number(buffer, size, b'MemAvailable:')
+        if not available:
+            return None
+        available *= 1024
+        if available > total:
+            available = free
+        return VirtualMemory(total, available, total - available, free)
+
+    def net_io_counters_pernic(self):
+        """Get the network io counters of each NIC
+
+        :return: A dictionary of NIC names to NetIO namedtuples
+        """
+        results = {}
+        with self.net_dev.lock:
+            size = self.net_dev.read()
+            buffer = self.net_dev.buffer
+            #
+            # Skip the two header lines
+            #
+            start = buffer.find(b'\n', buffer.find(b'\n', 0, size) + 1, size) + 1
+            while start < size:
+                end = buffer.find(b'\n', start, size)
+                if end < 0:
+                    end = size
+                colon = buffer.find(b':', start, end)
+                name = buffer[start:colon].strip().decode()
+                values = buffer[colon + 1:end].split()
+                results[name] = NetIO(
+                        int(values[8]),
+                        int(values[0]),
+                        int(values[9]),
+                        int(values[1]),
+                        int(values[2]),
+                        int(values[10]),
+                        int(values[3]),
+                        int(values[11]),
+                )
+                start = end + 1
+        return results
+
+    def close(self):
+        """Close the /proc files
+
+        :return: None
+        """
+        for proc_file in (self.stat, self.meminfo, self.net_dev):
+            proc_file.close()
+
+
+def get_reader():
+    """Get a /proc reader if the platform supports it
+
+    :return: A ProcfsReader object, None on platforms without a Linux procfs
+    """
+    logger = logging.getLogger()
+    if not hasattr(os, 'pread'):
+        logger.warning("No pread on this platform, falling back to psutil")
+        return None
+    try:
+        return ProcfsReader()
+    except OSError as e:
+        logger.warning("Could not open /proc files ({}), falling back to psutil".format(e))
+        return None
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+
+#
+# Standard library imports
+#
+import threading
+#
+# Project's imports
+#
+import columns
+
+
+COUNTERS_MODES = ('raw', 'rates', 'both')
+
+
+def counter_delta(previous, current):
+    """Compute the increase of a monotonic counter between two samples
+
+    A counter going backwards either wrapped around its 32 or 64 bits
+    maximum, or was reset (e.g. an interface going down and up). A wrap is
+    only assumed when it gives an increase of less than half the counter
+    range, anything else is taken as a reset.
+
+    :param previous: The previous value of the counter
+    :param current: The current value of the counter
+    :return: The increase of the counter, None if it was reset
+    """
+    if current >= previous:
+        return current - previous
+    for bits in (32, 64):
+        modulus = 2 ** bits
+        if previous < modulus:
+            delta = modulus - previous + current
+            return delta if delta < modulus // 2 else None
+    return None
+
+
+class RateEngine:
+    """Converts monotonic counters to per second rates
+
+    Keeps the previous sample of each series, identified by a key such as
+    its tags, and computes the rates of its counters over the interval
+    between two samples. Series not updated for expire seconds are dropped
+    so that the state stays bounded when series come and go.
+    """
+
+    def __init__(self, expire=300):
+        """Creates an empty rate engine
+
+        :param expire: Time (secs) after which a series not updated is dropped
+        """
+        self.expire = expire
+        self.lock = threading.Lock()
+        self.series = {}
+        self.last_sweep = None
+
+    def rates(self, key, sample_time, counters):
+        """Compute the rates of the counters of a series
+
+        The first sample of a series only primes it, and counters that were
+        reset since the previous sample are left out.
+
+        :param key: The key of the series
+        :param sample_time: The monotonic time (secs) the counters were read at
+        :param counters: A dictionary of counter names to values
+        :return: A dictionary of counter names to rates (per sec)
+        """
+        with self.lock:
+            previous = self.series.get(key)
+            self.series[key] = (sample_time, counters)
+            self.sweep(sample_time)
+        if previous is None:
+            return {}
+        previous_time, previous_counters = previous
+        elapsed = sample_time - previous_time
+        if elapsed <= 0:
+            return {}
+        rates = {}
+        for name, value in counters.items():
+            if name not in previous_counters:
+                continue
+            delta = counter_delta(previous_counters[name], value)
+            if delta is not None:
+                rates[name] = delta / elapsed
+        return rates
+
+    def sweep(self, now):
+        """Drop the series not updated for expire seconds
+
+        Must be called with the lock held.
+
+        :param now: The current monotonic time (secs)
+        :return: None
+        """
+        if self.last_sweep is None:
+            self.last_sweep = now
+        if now - self.last_sweep < self.expire:
+            return
+        self.last_sweep = now
+        expired = [key for key, (sample_time, counters) in self.series.items() if now - sample_time > self.expire]
+        for key in expired:
+            del self.series[key]
+
+    def forget(self, key):
+        """Drop the state of a series
+
+        :param key: The key of the series
+        :return: None
+        """
+        with self.lock:
+            self.series.pop(key, None)
+
+
+class ColumnRates:
+    """Converts columns of monotonic counters to per second rates
+
+    The columnar counterpart of RateEngine, for the entities (e.g. NICs) of
+    a table: keeps the previous counters of all the entities and computes
+    the rates of all of them at once. The rows of the previous counters are
+    matched with the current ones by key, entities seen for the first time
+    get no rates and entities that disappeared are forgotten.
+    """
+
+    def __init__(self):
+        """Creates an empty rate engine"""
+        self.lock = threading.Lock()
+        self.previous = None
+
+    def rates(self, sample_time, keys, counters):
+        """Compute the rates of columns of counters
+
+        :param sample_time: The monotonic time (secs) the counters were read at
+        :param keys: A list of the keys of the rows
+        :param counters: A dictionary of counter names to columns
+        :return: A dictionary of counter names to float columns of rates (NaN when unknown), empty on the first call
+        """
+        with self.lock:
+            previous, self.previous = self.previous, (sample_time, keys, counters)
+        if previous is None:
+            return {}
+        previous_time, previous_keys, previous_counters = previous
+        elapsed = sample_time - previous_time
+        if elapsed <= 0 or not previous_keys:
+            return {}
+        missing = None
+        if previous_keys != keys:
+            positions = {key: position for position, key in enumerate(previous_keys)}
+            positions = [positions.get(key, -1) for key in keys]
+        rates = {}
+        for name, column in counters.items():
+            if name not in previous_counters:
+                continue
+            previous_column = previous_counters[name]
+            if previous_keys != keys:
+                previous_column, missing = columns.take(previous_column, positions)
+            rates[name] = columns.counter_rates(previous_column, column, elapsed, missing)
+        return rates
+
+    def forget(self):
+        """Drop the previous counters
+
+        :return: None
+        """
+        with self.lock:
+            self.previous = None
+
+
+def get_fields(engine, key, sample_time, counters, mode):
+    """Build the fields of a point from counters, according to a counters mode
+
+    - raw: the counters only
+    - rates: the rates only, as <counter>_rate fields
+    - both: the counters and their rates
+
+    :param engine: A RateEngine object
+    :param key: The key of the series
+    :param sample_time: The monotonic time (secs) the counters were read at
+    :param counters: A dictionary of counter names to values
+    :param mode: The counters mode
+    :return: A dictionary of the fields, empty if there is nothing to write
+    """
+    if mode == 'raw':
+        return counters
+    rates = engine.rates(key, sample_time, counters)
+    fields = {"{}_rate".format(name): rate for name, rate in rates.items()}
+    if mode == 'both':
+        fields.update(counters)
+    return fields
+
+
+def get_column_fields(engine, sample_time, keys, counters, mode):
+    """Build the field columns of a table from columns of counters, according to a counters mode
+
+    The columnar counterpart of get_fields.
+
+    :param engine: A ColumnRates object
+    :param sample_time: The monotonic time (secs) the counters were read at
+    :param keys: A list of the keys of the rows
+    :param counters: A dictionary of counter names to columns
+    :param mode: The counters mode
+    :return: A dictionary of field names to columns, empty if there is nothing to write
+    """
+    if mode == 'raw':
+        return counters
+    rates = engine.rates(sample_time, keys, counters)
+    fields = {"{}_rate".format(name): rate for name, rate in rates.items()}
+    if mode == 'both':
+        fields.update(counters)
+    return fields
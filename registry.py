@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+#
+# Standard library imports
+#
+import importlib
+import logging
+import threading
+
+
+#
+# Declarative map of the built-in jobs: job names to module:function
+# references. The modules are only imported when one of their jobs is
+# configured.
+#
+BUILTIN_JOBS = {
+    'cpu_times': 'jobscpu:cpu_times',
+    'cpu_times_percpu': 'jobscpu:cpu_times_percpu',
+    'cpu_percent': 'jobscpu:cpu_percent',
+    'cpu_percent_percpu': 'jobscpu:cpu_percent_percpu',
+    'cpu_times_percent': 'jobscpu:cpu_times_percent',
+    'cpu_times_percent_percpu': 'jobscpu:cpu_times_percent_percpu',
+    'cpu_count': 'jobscpu:cpu_count',
+    'cpu_stats': 'jobscpu:cpu_stats',
+    'cpu_freq': 'jobscpu:cpu_freq',
+    'cpu_freq_percpu': 'jobscpu:cpu_freq_percpu',
+    'network_io_counters': 'jobsnetwork:network_io_counters',
+    'network_io_counters_pernic': 'jobsnetwork:network_io_counters_pernic',
+    'memory_virtual_memory': 'jobsmemory:memory_virtual_memory',
+    'disk_io_counters': 'jobsdisk:disk_io_counters',
+    'disk_io_counters_perdisk': 'jobsdisk:disk_io_counters_perdisk',
+    'disk_usage': 'jobsdisk:disk_usage',
+    'processes': 'jobsprocess:processes',
+    'pressure': 'jobspressure:pressure',
+    'cgroups': 'jobscgroup:cgroups',
+}
+
+#
+# Entry point group third-party packages register their jobs in, e.g. in
+# their pyproject.toml:
+#
+#   [project.entry-points."sysprobe.jobs"]
+#   nginx_status = "sysprobe_nginx.jobs:nginx_status"
+#
+ENTRY_POINT_GROUP = 'sysprobe.jobs'
+
+plugin_jobs = None
+loaded_jobs = {}
+registry_lock = threading.Lock()
+
+
+def get_plugin_jobs():
+    """Get the jobs registered by third-party packages
+
+    Reads the metadata of the installed packages once, nothing is imported.
+    Jobs shadowing a built-in job are ignored.
+
+    :return: A dictionary of job names to module:function references
+    """
+    global plugin_jobs
+    with registry_lock:
+        if plugin_jobs is None:
+            #
+            # Imported on demand: importlib.metadata alone weighs more on the
+            # startup than most collectors
+            #
+            import importlib.metadata
+            logger = logging.getLogger()
+            entry_points = importlib.metadata.entry_points()
+            if hasattr(entry_points, 'select'):
+                group = entry_points.select(group=ENTRY_POINT_GROUP)
+            else:
+                group = entry_points.get(ENTRY_POINT_GROUP, [])
+            plugin_jobs = {}
+            for entry_point in group:
+                if entry_point.name in BUILTIN_JOBS:
+                    logger.warning("Job {} of {} shadows a built-in job, ignoring it".format(
+                            entry_point.name, entry_point.value))
+                    continue
+                plugin_jobs[entry_point.name] = entry_point.value
+        return plugin_jobs
+
+
+def get_job_specs():
+    """Get all the available jobs, without importing them
+
+    :return: A dictionary of job names to module:function references
+    """
+    job_specs = dict(get_plugin_jobs())
+    job_specs.update(BUILTIN_JOBS)
+    return job_specs
+
+
+def get_job_reference(job_name):
+    """Get the module:function reference of a job
+
+    The installed packages are only searched for jobs that are not built-in.
+
+    :param job_name: The name of the job
+    :return: The module:function reference, None if the job is unknown
+    """
+    if job_name in BUILTIN_JOBS:
+        return BUILTIN_JOBS[job_name]
+    return get_plugin_jobs().get(job_name)
+
+
+def load_job(job_name):
+    """Import the function performing a job
+
+    :param job_name: The name of the job
+    :return: The job function, None if the job is unknown or can not be imported
+    """
+    with registry_lock:
+        if job_name in loaded_jobs:
+            return loaded_jobs[job_name]
+    reference = get_job_reference(job_name)
+    if reference is None:
+        return None
+    module_name, _, function_name = reference.partition(':')
+    try:
+        job = getattr(importlib.import_module(module_name), function_name)
+    except (ImportError, AttributeError):
+        logging.getLogger().exception("Could not load job {} from {}".format(job_name, reference))
+        return None
+    with registry_lock:
+        loaded_jobs[job_name] = job
+    return job
+
+
+def get_jobs(job_names):
+    """Import the functions performing the given jobs
+
+    Only the modules of these jobs are imported.
+
+    :param job_names: An iterable of job names
+    :return: A dictionary of the names of the jobs that could be loaded to job functions
+    """
+    jobs = {}
+    for job_name in job_names:
+        job = load_job(job_name)
+        if job is not None:
+            jobs[job_name] = job
+    return jobs
@@ -0,0 +1,393 @@
+# -*- coding: utf-8 -*-
+
+#
+# Standard library imports
+#
+import collections
+import logging
+import threading
+import time
+#
+# Third party imports
+#
+import psutil
+#
+# Project's imports
+#
+import columns
+import procfs
+
+
+Sample = collections.namedtuple('Sample', ['time', 'value'])
+Sample.__doc__ = """A value read from the system and the monotonic time it was read at"""
+
+
+class SampleCache:
+    """Short-lived cache of the samples read from the system
+
+    Jobs firing on the same scheduler tick ask the cache for the same
+    source; the first one reads it from the system and the others reuse
+    that sample as long as it is younger than ttl seconds. Reads of a given
+    source are serialized, so concurrent jobs wait for the sample being
+    read instead of reading it again.
+    """
+
+    def __init__(self, ttl=0.2):
+        """Creates an empty cache
+
+        :param ttl: Maximum age (secs) of a cached sample
+        """
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.source_locks = {}
+        self.entries = {}
+
+    def get(self, source, loader):
+        """Get a sample of a source
+
+        :param source: The name of the source
+        :param loader: A function returning a new Sample of the source
+        :return: A Sample object
+        """
+        with self.lock:
+            source_lock = self.source_locks.setdefault(source, threading.Lock())
+        with source_lock:
+            sample = self.entries.get(source)
+            if sample is not None and time.monotonic() - sample.time < self.ttl:
+                return sample
+            sample = loader()
+            self.entries[source] = sample
+            return sample
+
+
+class WallClock:
+    """Maps the monotonic times of the samples to wall-clock timestamps
+
+    The wall clock is read once along with the monotonic clock, as an
+    anchor, and the timestamps are derived from the monotonic times of the
+    samples. All the points of a sample therefore share one timestamp,
+    taken when the sample was read rather than when the points reach
+    InfluxDB, and the timestamps do not jump with small clock adjustments.
+    The anchor is moved when the wall clock was set more than max_drift
+    seconds away from it.
+    """
+
+    def __init__(self, max_drift=1):
+        """Creates the clock and anchors it
+
+        :param max_drift: Drift (secs) of the wall clock moving the anchor
+        """
+        self.max_drift = int(max_drift * 10 ** 9)
+        self.anchor = (time.time_ns(), time.monotonic_ns())
+
+    def timestamp(self, sample_time):
+        """Get the wall-clock timestamp of a monotonic time
+
+        :param sample_time: The monotonic time (secs)
+        :return: The wall-clock timestamp (ns)
+        """
+        wall_anchor, monotonic_anchor = self.anchor
+        return wall_anchor + int(sample_time * 10 ** 9) - monotonic_anchor
+
+    def check(self):
+        """Move the anchor if the wall clock was set since it was taken
+
+        :return: None
+        """
+        wall_anchor, monotonic_anchor = self.anchor
+        monotonic_now = time.monotonic_ns()
+        wall_now = time.time_ns()
+        drift = wall_now - (wall_anchor + monotonic_now - monotonic_anchor)
+        if abs(drift) > self.max_drift:
+            logging.getLogger().warning("Wall clock moved by {:.3f} secs, moving the timestamps anchor".format(
+                    drift / 10 ** 9))
+            self.anchor = (wall_now, monotonic_now)
+
+
+cache = SampleCache()
+clock = WallClock()
+procfs_reader = None
+BACKENDS = ('psutil', 'procfs')
+
+
+def configure(collectors_config):
+    """Configure the sampling layer
+
+    :param collectors_config: A dictionary of the collectors configuration
+    :return: None
+    """
+    global procfs_reader
+    cache.ttl = collectors_config["ttl"] if "ttl" in collectors_config else 0.2
+    backend = collectors_config["backend"] if "backend" in collectors_config else "psutil"
+    if backend == "procfs" and psutil.LINUX:
+        procfs_reader = procfs.get_reader()
+    elif backend == "procfs":
+        logging.getLogger().warning("The procfs backend is only available on Linux, falling back to psutil")
+
+
+def read(function, *args, **kwargs):
+    """Read a new sample from the system
+
+    :param function: The function reading the value
+    :param args: The positional arguments of the function
+    :param kwargs: The keyword arguments of the function
+    :return: A Sample object
+    """
+    clock.check()
+    sample_time = time.monotonic()
+    return Sample(sample_time, function(*args, **kwargs))
+
+
+def timestamp(sample_time):
+    """Get the wall-clock timestamp of the points of a sample
+
+    :param sample_time: The monotonic time (secs) of the sample, e.g. Sample.time
+    :return: The timestamp (ns)
+    """
+    return clock.timestamp(sample_time)
+
+
+def derive(sample, function):
+    """Derive a sample from another one, keeping its time
+
+    :param sample: A Sample object
+    :param function: The function computing the derived value
+    :return: A Sample object
+    """
+    return Sample(sample.time, function(sample.value))
+
+
+def sum_tuples(tuples):
+    """Sum a sequence of namedtuples field by field
+
+    :param tuples: A non empty sequence of namedtuples of the same type
+    :return: A namedtuple of the sums
+    """
+    return type(tuples[0])(*map(sum, zip(*tuples)))
+
+
+def cpu_times_percpu():
+    """Get the cpu times of each cpu
+
+    :return: A Sample of a list of psutil cpu times namedtuples
+    """
+    if procfs_reader is not None:
+        return cache.get('cpu_times_percpu', lambda: read(procfs_reader.cpu_times_percpu))
+    return cache.get('cpu_times_percpu', lambda: read(psutil.cpu_times, percpu=True))
+
+
+def cpu_times_percpu_table():
+    """Get the cpu times of each cpu in columns
+
+    :return: A Sample of a columns.Table of the cpu times, keyed by cpu number
+    """
+    def to_table(results):
+        fields = results[0]._fields if results else procfs.CpuTimes._fields
+        return columns.from_rows(list(range(len(results))), results, fields)
+    return cache.get('cpu_times_percpu_table', lambda: derive(cpu_times_percpu(), to_table))
+
+
+def cpu_times():
+    """Get the system wide cpu times, summed from the per cpu sample
+
+    :return: A Sample of a psutil cpu times namedtuple
+    """
+    return cache.get('cpu_times', lambda: derive(cpu_times_percpu(), sum_tuples))
+
+
+def cpu_stats():
+    """Get the cpu statistics
+
+    :return: A Sample of a psutil cpu stats namedtuple
+    """
+    if procfs_reader is not None:
+        return cache.get('cpu_stats', lambda: read(procfs_reader.cpu_stats))
+    return cache.get('cpu_stats', lambda: read(psutil.cpu_stats))
+
+
+def virtual_memory():
+    """Get the system memory usage
+
+    :return: A Sample of a psutil virtual memory namedtuple
+    """
+    def loader():
+        if procfs_reader is not None:
+            sample = read(procfs_reader.virtual_memory)
+            if sample.value is not None:
+                return sample
+        return read(psutil.virtual_memory)
+    return cache.get('virtual_memory', loader)
+
+
+def disk_io_counters():
+    """Get the system wide disk io counters
+
+    :return: A Sample of a psutil disk io namedtuple, or of None without disks
+    """
+    return cache.get('disk_io_counters', lambda: read(psutil.disk_io_counters, perdisk=False))
+
+
+def disk_io_counters_perdisk():
+    """Get the disk io counters of each disk
+
+    :return: A Sample of a dictionary of disk names to psutil disk io namedtuples
+    """
+    return cache.get('disk_io_counters_perdisk', lambda: read(psutil.disk_io_counters, perdisk=True))
+
+
+def net_io_counters_pernic():
+    """Get the network io counters of each NIC
+
+    :return: A Sample of a dictionary of NIC names to psutil network io namedtuples
+    """
+    if procfs_reader is not None:
+        return cache.get('net_io_counters_pernic', lambda: read(procfs_reader.net_io_counters_pernic))
+    return cache.get('net_io_counters_pernic', lambda: read(psutil.net_io_counters, pernic=True))
+
+
+def net_io_counters_pernic_table():
+    """Get the network io counters of each NIC in columns
+
+    :return: A Sample of a columns.Table of the network io counters, keyed by NIC name
+    """
+    def to_table(nics):
+        results = list(nics.values())
+        fields = results[0]._fields if results else procfs.NetIO._fields
+        return columns.from_rows(list(nics), results, fields, counters=True)
+    return cache.get('net_io_counters_pernic_table', lambda: derive(net_io_counters_pernic(), to_table))
+
+
+def net_io_counters():
+    """Get the system wide network io counters, summed from the per NIC sample
+
+    :return: A Sample of a psutil network io namedtuple
+    """
+    return cache.get('net_io_counters', lambda: derive(net_io_counters_pernic(), lambda nics: sum_tuples(list(nics.values()))))
+
+
+class PreviousSample:
+    """Holder of the previous sample seen by a job
+
+    Lets a job compute values over the full interval between two of its
+    runs instead of sleeping between two reads.
+    """
+
+    def __init__(self):
+        """Creates an empty holder"""
+        self.lock = threading.Lock()
+        self.sample = None
+
+    def swap(self, sample):
+        """Store a new sample and get the previous one
+
+        :param sample: The new sample
+        :return: The previous sample, None on the first call
+        """
+        with self.lock:
+            previous, self.sample = self.sample, sample
+            return previous
+
+
+def cpu_total_time(times):
+    """Get the total of cpu times
+
+    :param times: A psutil cpu times namedtuple
+    :return: The total time (secs)
+    """
+    total = sum(times)
+    if psutil.LINUX:
+        #
+        # guest and guest_nice are already accounted in user and nice
+        #
+        total -= getattr(times, 'guest', 0)
+        total -= getattr(times, 'guest_nice', 0)
+    return total
+
+
+def cpu_busy_time(times):
+    """Get the busy part of cpu times
+
+    :param times: A psutil cpu times namedtuple
+    :return: The busy time (secs)
+    """
+    return cpu_total_time(times) - times.idle - getattr(times, 'iowait', 0)
+
+
+def cpu_percent(previous, current):
+    """Compute the cpu usage between two samples
+
+    :param previous: The previous psutil cpu times namedtuple
+    :param current: The current psutil cpu times namedtuple
+    :return: The cpu usage in percent
+    """
+    total = cpu_total_time(current) - cpu_total_time(previous)
+    busy = cpu_busy_time(current) - cpu_busy_time(previous)
+    if total <= 0 or busy <= 0:
+        return 0.0
+    return round(min(busy / total * 100, 100.0), 1)
+
+
+def cpu_times_percent(previous, current):
+    """Compute the percentage of each cpu time between two samples
+
+    :param previous: The previous psutil cpu times namedtuple
+    :param current: The current psutil cpu times namedtuple
+    :return: A namedtuple of the cpu times in percent
+    """
+    total = cpu_total_time(current) - cpu_total_time(previous)
+    percents = []
+    for before, after in zip(previous, current):
+        percent = (after - before) / total * 100 if total > 0 else 0.0
+        percents.append(round(min(max(percent, 0.0), 100.0), 1))
+    return type(current)(*percents)
+
+
+def cpu_total_time_columns(table):
+    """Get the totals of the cpu times of a table, see cpu_total_time
+
+    :param table: A columns.Table of cpu times
+    :return: A column of the total times (secs)
+    """
+    names = list(table.columns)
+    if psutil.LINUX:
+        names = [name for name in names if name not in ('guest', 'guest_nice')]
+    return columns.total([table.columns[name] for name in names])
+
+
+def cpu_busy_time_columns(table):
+    """Get the busy parts of the cpu times of a table, see cpu_busy_time
+
+    :param table: A columns.Table of cpu times
+    :return: A column of the busy times (secs)
+    """
+    names = [name for name in table.columns if name not in ('idle', 'iowait')]
+    if psutil.LINUX:
+        names = [name for name in names if name not in ('guest', 'guest_nice')]
+    return columns.total([table.columns[name] for name in names])
+
+
+def cpu_percent_columns(previous, current):
+    """Compute the usage of every cpu between two tables, see cpu_percent
+
+    :param previous: The previous columns.Table of cpu times
+    :param current: The current columns.Table of cpu times, of the same cpus
+    :return: A column of the cpu usages in percent
+    """
+    total = columns.subtract(cpu_total_time_columns(current), cpu_total_time_columns(previous))
+    busy = columns.subtract(cpu_busy_time_columns(current), cpu_busy_time_columns(previous))
+    return columns.percent(busy, total)
+
+
+def cpu_times_percent_columns(previous, current, names):
+    """Compute the percentage of cpu times of every cpu between two tables, see cpu_times_percent
+
+    :param previous: The previous columns.Table of cpu times
+    :param current: The current columns.Table of cpu times, of the same cpus
+    :param names: The names of the cpu times to compute
+    :return: A dictionary of the cpu time names to columns of percentages
+    """
+    total = columns.subtract(cpu_total_time_columns(current), cpu_total_time_columns(previous))
+    return {
+        name: columns.percent(columns.subtract(current.columns[name], previous.columns[name]), total)
+        for name in names
+    }
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+#
+# Standard library imports
+#
+import heapq
+import itertools
+import logging
+import math
+import threading
+import time
+#
+# Project's imports
+#
+import telemetry
+
+
+class ScheduledJob:
+    """A function called at a fixed interval by the scheduler"""
+
+    def __init__(self, interval, function, args, name=None):
+        """Creates the scheduled job
+
+        :param interval: The interval (secs) between two calls
+        :param function: The function to call
+        :param args: A tuple of the arguments of the function
+        :param name: The name of the job in the logs, the name of the function by default
+        """
+        self.interval = interval
+        self.function = function
+        self.args = args
+        self.name = name if name is not None else function.__name__
+        self.deadline = None
+        self.skipped = 0
+        self.cancelled = False
+
+
+class Scheduler:
+    """Drift-free, sleep-based scheduler
+
+    The next fire times of the jobs are kept in a heap on the monotonic
+    clock and the scheduler sleeps until the earliest one. The first tick of
+    a job is aligned on a wall-clock boundary of its interval (a 10 secs job
+    fires at :00, :10, ...), and the following ticks are computed from the
+    previous deadline rather than from the time the job actually ran, so
+    they do not drift. Ticks that are already in the past when the
+    scheduler wakes up are skipped and counted instead of being fired late.
+    """
+
+    def __init__(self):
+        """Creates an empty scheduler"""
+        self.heap = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.stopping = False
+
+    def every(self, interval, function, *args, name=None):
+        """Schedule a function to be called every interval seconds
+
+        :param interval: The interval (secs) between two calls
+        :param function: The function to call
+        :param args: The arguments of the function
+        :param name: The name of the job in the logs, the name of the function by default
+        :return: A ScheduledJob object
+        """
+        job = ScheduledJob(interval, function, args, name)
+        wall_now = time.time()
+        mono_now = time.monotonic()
+        wall_deadline = math.ceil(wall_now / interval) * interval
+        job.deadline = mono_now + (wall_deadline - wall_now)
+        with self.condition:
+            heapq.heappush(self.heap, (job.deadline, next(self.counter), job))
+            self.condition.notify()
+        return job
+
+    def cancel(self, job):
+        """Cancel a scheduled job
+
+        :param job: A ScheduledJob object
+        :return: None
+        """
+        with self.condition:
+            job.cancelled = True
+            self.condition.notify()
+
+    def next_due(self):
+        """Wait for the earliest job to be due and take it from the heap
+
+        :return: A ScheduledJob object, or None when the scheduler is stopped
+        """
+        with self.condition:
+            while not self.stopping:
+                if not self.heap:
+                    self.condition.wait()
+                    continue
+                deadline, seq, job = self.heap[0]
+                if job.cancelled:
+                    heapq.heappop(self.heap)
+                    continue
+                timeout = deadline - time.monotonic()
+                if timeout > 0:
+                    self.condition.wait(timeout)
+                    continue
+                heapq.heappop(self.heap)
+                self.reschedule(job)
+                return job
+            return None
+
+    def reschedule(self, job):
+        """Push the next tick of a job, skipping the ticks already missed
+
+        Must be called with the lock held.
+
+        :param job: A ScheduledJob object
+        :return: None
+        """
+        logger = logging.getLogger()
+        now = time.monotonic()
+        missed = math.floor((now - job.deadline) / job.interval)
+        if missed > 0:
+            job.skipped += missed
+            logger.warning("Scheduler late by {:.3f} secs, skipped {} ticks of {}".format(
+                    now - job.deadline, missed, job.name))
+            if telemetry.enabled:
+                telemetry.count("scheduler", "ticks_missed", missed)
+        job.deadline += job.interval * (missed + 1)
+        heapq.heappush(self.heap, (job.deadline, next(self.counter), job))
+
+    def run(self):
+        """Run the scheduled jobs until the scheduler is stopped
+
+        :return: None
+        """
+        logger = logging.getLogger()
+        while True:
+            job = self.next_due()
+            if job is None:
+                break
+            try:
+                job.function(*job.args)
+            except Exception:
+                logger.exception("Scheduled call to {} failed".format(job.name))
+
+    def stop(self):
+        """Stop the scheduler
+
+        :return: None
+        """
+        with self.condition:
+            self.stopping = True
+            self.condition.notify()
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+#
+# Standard library imports
+#
+import collections
+import logging
+import os
+import threading
+
+
+class Spool:
+    """Append-only, segment-rotated on-disk spool of line-protocol points
+
+    The spool is a directory of segment files holding one encoded point per
+    line. Points are appended to the newest segment, which is rotated once
+    it reaches segment_bytes. When the spool grows over max_bytes, the
+    oldest segments are evicted. Points are read back oldest first with
+    peek() and removed with commit() once they have been written.
+    """
+
+    suffix = '.spool'
+
+    def __init__(self, path, max_bytes=100 * 1024 * 1024, segment_bytes=4 * 1024 * 1024):
+        """Opens the spool, picking up the segments left by a previous run
+
+        :param path: The directory holding the segment files
+        :param max_bytes: Maximum size of the spool on disk
+        :param segment_bytes: Size at which the current segment is rotated
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.lock = threading.Lock()
+        #
+        # Held from peek() to commit() by the replayer, so that the writer
+        # chains sharing the spool across a reload do not replay the same
+        # points
+        #
+        self.replay_lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self.segments = collections.deque()
+        for name in sorted(os.listdir(path)):
+            if name.endswith(self.suffix):
+                seq = int(name[:-len(self.suffix)])
+                self.segments.append([seq, os.path.getsize(self.segment_path(seq))])
+        self.total_bytes = sum(size for seq, size in self.segments)
+        self.next_seq = self.segments[-1][0] + 1 if self.segments else 0
+        self.active = None
+        self.read_offset = 0
+        self.peeked_offset = 0
+
+    def __len__(self):
+        """Size in bytes of the points waiting in the spool
+
+        :return: The number of bytes not yet replayed
+        """
+        with self.lock:
+            return self.total_bytes - self.read_offset
+
+    def segment_path(self, seq):
+        """Get the file name of a segment
+
+        :param seq: The sequence number of the segment
+        :return: The path name of the segment file
+        """
+        return os.path.join(self.path, '{:016d}{}'.format(seq, self.suffix))
+
+    def append(self, lines):
+        """Append points to the spool
+
+        :param lines: A list of line-protocol strings
+        :return: None
+        """
+        data = ''.join(line + '\n' for line in lines).encode('utf-8')
+        with self.lock:
+            if self.active is None:
+                self.active = open(self.segment_path(self.next_seq), 'ab')
+                self.segments.append([self.next_seq, 0])
+                self.next_seq += 1
+            self.active.write(data)
+            self.active.flush()
+            self.segments[-1][1] += len(data)
+            self.total_bytes += len(data)
+            if self.segments[-1][1] >= self.segment_bytes:
+                self.active.close()
+                self.active = None
+            self.evict()
+
+    def evict(self):
+        """Remove the oldest segments while the spool is over its size cap
+
+        Must be called with the lock held.
+
+        :return: None
+        """
+        logger = logging.getLogger()
+        while self.total_bytes > self.max_bytes and len(self.segments) > 1:
+            seq, size = self.segments.popleft()
+            os.remove(self.segment_path(seq))
+            self.total_bytes -= size
+            self.read_offset = 0
+            self.peeked_offset = 0
+            logger.warning("Spool over {} bytes, evicted segment {} ({} bytes)".format(self.max_bytes, seq, size))
+
+    def peek(self, max_points):
+        """Read the oldest points of the spool without removing them
+
+        :param max_points: Maximum number of points to read
+        :return: A list of line-protocol strings
+        """
+        lines = []
+        with self.lock:
+            if not self.segments:
+                return lines
+            seq = self.segments[0][0]
+            with open(self.segment_path(seq), 'rb') as f:
+                f.seek(self.read_offset)
+                offset = self.read_offset
+                while len(lines) < max_points:
+                    line = f.readline()
+                    if not line.endswith(b'\n'):
+                        break
+                    offset += len(line)
+                    lines.append(line[:-1].decode('utf-8'))
+            seq, size = self.segments[0]
+            if not lines and offset < size and not (len(self.segments) == 1 and self.active is not None):
+                #
+                # Torn write left by a crash: skip the tail of the segment
+                #
+                offset = size
+            self.peeked_offset = offset
+        return lines
+
+    def commit(self):
+        """Remove the points returned by the last peek()
+
+        :return: None
+        """
+        with self.lock:
+            if not self.segments:
+                return
+            self.read_offset = self.peeked_offset
+            seq, size = self.segments[0]
+            if self.read_offset < size:
+                return
+            if len(self.segments) == 1 and self.active is not None:
+                self.active.close()
+                self.active = None
+            self.segments.popleft()
+            os.remove(self.segment_path(seq))
+            self.total_bytes -= size
+            self.read_offset = 0
+            self.peeked_offset = 0
+
+    def close(self):
+        """Close the segment being written
+
+        :return: None
+        """
+        with self.lock:
+            if self.active is not None:
+                self.active.close()
+                self.active = None
@@ -6,42 +6,303 @@
 #
 import logging
 import logging.config
-#
-# Third party imports
-#
-import schedule
+import signal
+import threading
 #
 # Project's imports
 #
+import aggregation
+import dedup
 import helpers
+import registry
+import samples
+import scheduler
+import telemetry
+import workers
+import writers
 
 
-def main():
-    """Entry point of the SysProbe application
+class Agent:
+    """The jobs of the agent and the writer chain they write to
 
-    :return: None
+    The configuration can be reloaded while the agent runs (on SIGHUP): the
+    jobs, influxdb and loggers sections are compared with the running
+    configuration, and only the jobs that were added, removed or changed
+    are rescheduled. The state of the collectors is kept, and the writer
+    chain is only replaced when the InfluxDB settings changed. The other
+    sections need a restart.
     """
-    flags = helpers.parser_create()
-    config_data = helpers.get_config(flags.config_file)
-    influxdb_config = helpers.get_influxdb_config(config_data)
-    jobs_config = helpers.get_jobs_config(config_data)
-    loggers_config = helpers.get_loggers_config(config_data)
-    helpers.loggers_configure(loggers_config)
-    logger = logging.getLogger()
-
-    available_jobs = helpers.get_available_jobs()
-    for job, interval in jobs_config.items():
-        if job in available_jobs:
-            job = available_jobs[job]
-            schedule.every(interval).seconds.do(helpers.run_threaded, job, influxdb_config)
+
+    RESTART_SECTIONS = ('workers', 'collectors', 'telemetry')
+
+    def __init__(self, config_file, engine):
+        """Creates the agent
+
+        :param config_file: The path name of the yml configuration file
+        :param engine: The runtime running the jobs, threads or asyncio
+        """
+        self.config_file = config_file
+        self.engine = engine
+        self.reload_lock = threading.Lock()
+        self.jobs = {}
+        self.influxdb_config = None
+        self.loggers_config = None
+        self.restart_sections = None
+        self.writer = None
+        self.pool = None
+        self.job_scheduler = None
+        self.default_overrun = None
+
+    def start(self):
+        """Load the configuration and schedule the jobs
+
+        :return: None
+        """
+        config_data = helpers.get_config(self.config_file)
+        self.influxdb_config = helpers.get_influxdb_config(config_data)
+        jobs_config = helpers.get_jobs_config(config_data)
+        workers_config = helpers.get_workers_config(config_data)
+        collectors_config = helpers.get_collectors_config(config_data)
+        telemetry_config = helpers.get_telemetry_config(config_data)
+        self.loggers_config = helpers.get_loggers_config(config_data)
+        helpers.loggers_configure(self.loggers_config)
+        self.restart_sections = {
+            section: config_data[section] if section in config_data else None
+            for section in self.RESTART_SECTIONS
+        }
+        samples.configure(collectors_config)
+        telemetry.configure(telemetry_config)
+        if self.engine == 'asyncio':
+            #
+            # Imported on demand, as asyncio weighs on the startup of the agent
+            #
+            import asyncengine
+            self.writer = asyncengine.AsyncInfluxDBWriter(self.influxdb_config)
+            pool_size = workers_config["pool_size"] if "pool_size" in workers_config else 4
+            self.job_scheduler = asyncengine.AsyncEngine(pool_size=pool_size)
         else:
-            logger.warning('Unknown job name: {}'.format(job))
+            self.writer = writers.ReloadableWriter(writers.get_writer(self.influxdb_config))
+            self.pool = workers.get_worker_pool(workers_config)
+            self.job_scheduler = scheduler.Scheduler()
+        self.default_overrun = workers_config["overrun"] if "overrun" in workers_config else "skip"
+
+        for job_name, job_config in jobs_config.items():
+            self.add_job(job_name, job_config)
+
+        if telemetry.enabled:
+            interval = telemetry_config["interval"] if "interval" in telemetry_config else 60
+            self.schedule(interval, 'sysprobe_internal', telemetry.sysprobe_internal, (self.writer, {}), 'skip')
+
+    def schedule(self, interval, job_name, job, args, overrun):
+        """Schedule a job on the engine
+
+        :param interval: The interval (secs) between two runs
+        :param job_name: The name of the job
+        :param job: The function performing the job
+        :param args: A tuple of the arguments of the job function
+        :param overrun: The overrun policy of the job
+        :return: The handle of the scheduled job, to cancel it
+        """
+        if self.engine == 'asyncio':
+            return self.job_scheduler.every(interval, job_name, job, args, overrun)
+        return self.job_scheduler.every(interval, self.pool.submit, job_name, job, args, overrun, name=job_name)
+
+    def build_job(self, job_name, job_config):
+        """Load a configured job and build its writer stages, without scheduling it
+
+        :param job_name: The name of the job
+        :param job_config: The configuration of the job
+        :return: A tuple of the job function, its settings, its interval, its overrun policy, its writer and its
+        aggregator, None if the job can not be loaded
+        """
+        logger = logging.getLogger()
+        if registry.get_job_reference(job_name) is None:
+            logger.warning('Unknown job name: {}'.format(job_name))
+            return None
+        job = registry.load_job(job_name)
+        if job is None:
+            return None
+        settings = helpers.get_job_settings(job_config)
+        interval = settings["interval"]
+        overrun = settings["overrun"] if "overrun" in settings else self.default_overrun
+        job_writer = self.writer
+        aggregator = None
+        if "dedup" in settings:
+            job_writer = dedup.Deduplicator(job_writer, settings["dedup"])
+        if "aggregate" in settings:
+            job_writer = aggregator = aggregation.Aggregator(job_writer, settings["aggregate"])
+        return job, settings, interval, overrun, job_writer, aggregator
+
+    def schedule_job(self, job_name, job_config, built):
+        """Schedule a job built by build_job
+
+        :param job_name: The name of the job
+        :param job_config: The configuration of the job
+        :param built: The tuple returned by build_job
+        :return: None
+        """
+        job, settings, interval, overrun, job_writer, aggregator = built
+        handle = self.schedule(interval, job_name, job, (job_writer, settings), overrun)
+        self.jobs[job_name] = (job_config, handle, aggregator)
+
+    def add_job(self, job_name, job_config):
+        """Schedule a configured job
 
-    while True:
+        :param job_name: The name of the job
+        :param job_config: The configuration of the job
+        :return: None
+        """
+        built = self.build_job(job_name, job_config)
+        if built is not None:
+            self.schedule_job(job_name, job_config, built)
+
+    def remove_job(self, job_name):
+        """Cancel a scheduled job, writing its aggregates in progress
+
+        :param job_name: The name of the job
+        :return: None
+        """
+        job_config, handle, aggregator = self.jobs.pop(job_name)
+        self.job_scheduler.cancel(handle)
+        if aggregator is not None:
+            aggregator.flush()
+
+    def flush_aggregators(self):
+        """Write the aggregates in progress of the scheduled jobs
+
+        :return: None
+        """
+        with self.reload_lock:
+            for job_config, handle, aggregator in self.jobs.values():
+                if aggregator is not None:
+                    aggregator.flush()
+
+    def reload(self):
+        """Reload the configuration file, applying what changed
+
+        A configuration that can not be loaded, or whose jobs, writer or
+        loggers can not be set up, is ignored and the agent keeps running
+        with the current one.
+
+        :return: None
+        """
+        logger = logging.getLogger()
+        with self.reload_lock:
+            logger.info("Reloading {}".format(self.config_file))
+            #
+            # The helpers stop the application on invalid configurations
+            #
+            try:
+                config_data = helpers.get_config(self.config_file)
+                influxdb_config = helpers.get_influxdb_config(config_data)
+                jobs_config = helpers.get_jobs_config(config_data)
+                loggers_config = helpers.get_loggers_config(config_data)
+                for job_config in jobs_config.values():
+                    helpers.get_job_settings(job_config)
+                removed = [job_name for job_name in self.jobs if job_name not in jobs_config]
+                changed = [
+                    job_name for job_name in self.jobs
+                    if job_name in jobs_config and jobs_config[job_name] != self.jobs[job_name][0]
+                ]
+                added = [job_name for job_name in jobs_config if job_name not in self.jobs]
+                built = {job_name: self.build_job(job_name, jobs_config[job_name]) for job_name in changed + added}
+            except SystemExit:
+                logger.error("Invalid configuration in {}, keeping the current one".format(self.config_file))
+                return
+            except Exception:
+                logger.exception("Could not reload {}, keeping the current configuration".format(
+                        self.config_file))
+                return
+            #
+            # The new jobs and writer are built before anything is applied,
+            # and the loggers, which may still be rejected, are applied first,
+            # so that a failed reload leaves the agent as it was
+            #
+            writer = None
+            if influxdb_config != self.influxdb_config:
+                if self.engine == 'asyncio':
+                    logger.warning("Changes to the influxdb section need a restart with the asyncio engine")
+                else:
+                    try:
+                        writer = writers.get_writer(influxdb_config, self.writer)
+                    except Exception:
+                        logger.exception("Could not build the writer with the new InfluxDB settings, keeping the "
+                                         "current configuration")
+                        return
+            if loggers_config != self.loggers_config:
+                try:
+                    helpers.loggers_configure(loggers_config)
+                except SystemExit:
+                    logger.error("Invalid loggers configuration in {}, keeping the current configuration".format(
+                            self.config_file))
+                    if writer is not None:
+                        writer.close()
+                    return
+                self.loggers_config = loggers_config
+                logger = logging.getLogger()
+                logger.info("Reloaded the loggers configuration")
+            for section in self.RESTART_SECTIONS:
+                if (config_data[section] if section in config_data else None) != self.restart_sections[section]:
+                    logger.warning("Changes to the {} section need a restart".format(section))
+            if writer is not None:
+                self.writer.replace(writer)
+                self.influxdb_config = influxdb_config
+                logger.info("Replaced the writer with the new InfluxDB settings")
+            for job_name in removed + changed:
+                self.remove_job(job_name)
+            for job_name in changed + added:
+                if built[job_name] is not None:
+                    self.schedule_job(job_name, jobs_config[job_name], built[job_name])
+            logger.info("Reloaded {}: {} jobs added, {} removed, {} changed".format(
+                    self.config_file, len(added), len(removed), len(changed)))
+
+    def request_reload(self, signum, frame):
+        """SIGHUP handler: reload the configuration in a thread of its own
+
+        The handler interrupts the scheduler, so the reload must not run in
+        it.
+
+        :param signum: The signal number
+        :param frame: The current stack frame
+        :return: None
+        """
+        threading.Thread(target=self.reload, name='sysprobe-reload', daemon=True).start()
+
+    def run(self):
+        """Run the jobs until interrupted, then shut down
+
+        :return: None
+        """
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, self.request_reload)
+        if self.engine == 'asyncio':
+            #
+            # The engine shuts the executor and the writer down itself, on its
+            # event loop
+            #
+            try:
+                self.job_scheduler.run(self.writer, self.flush_aggregators)
+            except KeyboardInterrupt:
+                pass
+            return
         try:
-            schedule.run_pending()
+            self.job_scheduler.run()
         except KeyboardInterrupt:
-            break
+            pass
+        self.pool.shutdown()
+        self.flush_aggregators()
+        self.writer.close()
+
+
+def main():
+    """Entry point of the SysProbe application
+
+    :return: None
+    """
+    flags = helpers.parser_create()
+    agent = Agent(flags.config_file, flags.engine)
+    agent.start()
+    agent.run()
 
 
 if __name__ == '__main__':
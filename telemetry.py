@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+
+#
+# Standard library imports
+#
+import bisect
+import threading
+import time
+#
+# Third party imports
+#
+import psutil
+#
+# Project's imports
+#
+import lineprotocol
+import samples
+
+
+#
+# Call sites check this flag before measuring anything, so that telemetry
+# costs a single attribute lookup when it is disabled
+#
+enabled = False
+
+
+DURATION_BOUNDS = (
+    0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5,
+    1, 2.5, 5, 10,
+)
+SIZE_BOUNDS = (1, 10, 100, 500, 1000, 2500, 5000, 10000, 50000)
+
+
+class Histogram:
+    """Fixed-bucket histogram
+
+    Quantiles are estimated as the upper bound of the bucket holding them,
+    which is plenty for telling a 2 ms collection from a 200 ms one.
+    """
+
+    def __init__(self, bounds=DURATION_BOUNDS):
+        """Creates an empty histogram
+
+        :param bounds: A sorted tuple of the upper bounds of the buckets
+        """
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, value):
+        """Add a value
+
+        :param value: The value
+        :return: None
+        """
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, p):
+        """Estimate a quantile
+
+        :param p: The quantile, between 0 and 1
+        :return: The estimated quantile
+        """
+        rank = p * self.count
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return self.max
+
+    def fields(self, name):
+        """Get the fields describing the histogram
+
+        :param name: The name of the histogram
+        :return: A dictionary of <name>_<statistic> fields
+        """
+        #
+        # The statistics are always written as floats, so that the type of
+        # a field does not change with the bucket a value falls in
+        #
+        return {
+            "{}_count".format(name): self.count,
+            "{}_sum".format(name): float(self.total),
+            "{}_max".format(name): float(self.max),
+            "{}_p50".format(name): float(self.quantile(0.5)),
+            "{}_p95".format(name): float(self.quantile(0.95)),
+            "{}_p99".format(name): float(self.quantile(0.99)),
+        }
+
+
+class Recorder:
+    """Store of the agent's own metrics between two emissions
+
+    The metrics are kept per component (a job name, writer, scheduler...)
+    and reset each time they are collected.
+    """
+
+    def __init__(self):
+        """Creates an empty recorder"""
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.process = psutil.Process()
+        self.process.cpu_percent(None)
+
+    def observe(self, component, name, value, bounds=DURATION_BOUNDS):
+        """Add a value to a histogram
+
+        :param component: The name of the component
+        :param name: The name of the histogram
+        :param value: The value
+        :param bounds: The bucket bounds of the histogram, when it is created
+        :return: None
+        """
+        with self.lock:
+            histogram = self.histograms.get((component, name))
+            if histogram is None:
+                histogram = self.histograms[(component, name)] = Histogram(bounds)
+            histogram.add(value)
+
+    def count(self, component, name, increment=1):
+        """Increment a counter
+
+        :param component: The name of the component
+        :param name: The name of the counter
+        :param increment: The increment
+        :return: None
+        """
+        with self.lock:
+            key = (component, name)
+            self.counters[key] = self.counters.get(key, 0) + increment
+
+    def gauge(self, component, name, function):
+        """Register a gauge, read when the metrics are collected
+
+        :param component: The name of the component
+        :param name: The name of the gauge
+        :param function: A function returning the value of the gauge
+        :return: None
+        """
+        with self.lock:
+            self.gauges[(component, name)] = function
+
+    def collect(self):
+        """Collect the metrics and reset them
+
+        :return: A dictionary of component names to dictionaries of fields
+        """
+        with self.lock:
+            histograms, self.histograms = self.histograms, {}
+            counters, self.counters = self.counters, {}
+            gauges = dict(self.gauges)
+        components = {}
+        for (component, name), histogram in histograms.items():
+            components.setdefault(component, {}).update(histogram.fields(name))
+        for (component, name), value in counters.items():
+            components.setdefault(component, {})[name] = value
+        for (component, name), function in gauges.items():
+            components.setdefault(component, {})[name] = function()
+        with self.process.oneshot():
+            components.setdefault("agent", {}).update({
+                "cpu_percent": self.process.cpu_percent(None),
+                "rss": self.process.memory_info().rss,
+                "num_threads": self.process.num_threads(),
+            })
+        return components
+
+
+recorder = None
+
+
+def configure(telemetry_config):
+    """Enable or disable the telemetry
+
+    :param telemetry_config: A dictionary of the telemetry configuration
+    :return: None
+    """
+    global enabled, recorder
+    enabled = telemetry_config["enabled"] if "enabled" in telemetry_config else False
+    recorder = Recorder() if enabled else None
+
+
+def observe(component, name, value, bounds=DURATION_BOUNDS):
+    """Add a value to a histogram, see Recorder.observe
+
+    :param component: The name of the component
+    :param name: The name of the histogram
+    :param value: The value
+    :param bounds: The bucket bounds of the histogram, when it is created
+    :return: None
+    """
+    recorder.observe(component, name, value, bounds)
+
+
+def count(component, name, increment=1):
+    """Increment a counter, see Recorder.count
+
+    :param component: The name of the component
+    :param name: The name of the counter
+    :param increment: The increment
+    :return: None
+    """
+    recorder.count(component, name, increment)
+
+
+def gauge(component, name, function):
+    """Register a gauge, see Recorder.gauge
+
+    :param component: The name of the component
+    :param name: The name of the gauge
+    :param function: A function returning the value of the gauge
+    :return: None
+    """
+    recorder.gauge(component, name, function)
+
+
+def sysprobe_internal(writer, settings):
+    """Write the agent's own metrics
+
+    Writes one sysprobe_internal point per component, tagged with the
+    component name: the jobs (collect durations, skipped runs...), the
+    writer (batch sizes, serialize and write durations, failures by
+    exception type, queue depth...) and the agent itself (cpu, rss).
+
+    :param writer: The InfluxDB writer to hand the points to
+    :param settings: A dictionary of the job settings
+    :return: None
+    """
+    if recorder is None:
+        return
+    timestamp = samples.timestamp(time.monotonic())
+    records = []
+    for component, fields in recorder.collect().items():
+        records.append(
+                lineprotocol.Point(
+                        lineprotocol.get_series("sysprobe_internal", ("component", component)),
+                        fields,
+                        timestamp,
+                )
+        )
+    writer.write_points(records)
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+
+#
+# Standard library imports
+#
+import os
+import shutil
+import sys
+#
+# Third party imports
+#
+import pytest
+#
+# Project's imports
+#
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import filters  # noqa: E402
+import inotify  # noqa: E402
+import jobscgroup  # noqa: E402
+import lineprotocol  # noqa: E402
+import rates  # noqa: E402
+import samples  # noqa: E402
+
+
+def make_cgroup(root, name, usage=0, memory=0, rbytes=0, files=('cpu.stat', 'memory.current', 'io.stat')):
+    """Write a cgroup of a fake cgroup v2 hierarchy
+
+    :param root: The directory of the fake hierarchy
+    :param name: The name of the cgroup, / being the root cgroup
+    :param usage: The usage_usec value of cpu.stat
+    :param memory: The value of memory.current
+    :param rbytes: The rbytes value of io.stat
+    :param files: The files of the cgroup, those of its controllers
+    :return: The path name of the directory of the cgroup
+    """
+    path = str(root) if name == '/' else str(root) + name
+    os.makedirs(path, exist_ok=True)
+    contents = {
+        'cpu.stat': "usage_usec {}\nuser_usec {}\nsystem_usec {}\nnr_periods 0\nnr_throttled 0\n"
+                    "throttled_usec 0\n".format(usage, usage // 2, usage - usage // 2),
+        'memory.current': "{}\n".format(memory),
+        'io.stat': "8:0 rbytes={} wbytes=0 rios=1 wios=0 dbytes=0 dios=0\n"
+                   "8:16 rbytes={} wbytes=0 rios=1 wios=0 dbytes=0 dios=0\n".format(rbytes, rbytes),
+    }
+    for name in files:
+        with open(os.path.join(path, name), 'w') as f:
+            f.write(contents[name])
+    return path
+
+
+def make_tree(root, max_depth=None):
+    """Build the cache of a fake hierarchy
+
+    :param root: The directory of the fake hierarchy
+    :param max_depth: The depth of the deepest cgroups reported, None for no limit
+    :return: A CgroupTree object
+    """
+    return jobscgroup.CgroupTree(str(root), filters.NameFilter(), max_depth)
+
+
+class Writer:
+    """Writer keeping the points handed to it"""
+
+    def __init__(self):
+        self.points = []
+
+    def write_points(self, points):
+        self.points.extend(lineprotocol.expand(points))
+
+    def fields(self):
+        """Get the fields of the points written, by cgroup
+
+        :return: A dictionary of cgroup names to dictionaries of fields
+        """
+        return {point.series.tags['cgroup']: point.fields for point in self.points}
+
+
+@pytest.fixture
+def job(monkeypatch):
+    """Run the cgroups job with a fresh cache, at the monotonic times given"""
+    monkeypatch.setattr(jobscgroup, 'cgroups_rates', rates.ColumnRates())
+    monkeypatch.setattr(jobscgroup, 'cgroup_tree', None)
+    monkeypatch.setattr(jobscgroup, 'cgroup_tree_config', None)
+
+    def run(settings, sample_time):
+        monkeypatch.setattr(samples, 'read', lambda function: samples.Sample(sample_time, function()))
+        writer = Writer()
+        jobscgroup.cgroups(writer, settings)
+        return writer.fields()
+
+    yield run
+    if jobscgroup.cgroup_tree is not None:
+        jobscgroup.cgroup_tree.close()
+
+
+needs_inotify = pytest.mark.skipif(inotify.get_libc() is None, reason="inotify is Linux only")
+
+
+def test_parse_cpu_stat():
+    values = jobscgroup.parse_cpu_stat(b"usage_usec 30\nuser_usec 20\nsystem_usec 10\n")
+    assert values == (30, 20, 10, 0, 0, 0)
+
+
+def test_parse_io_stat():
+    values = jobscgroup.parse_io_stat(b"8:0 rbytes=1 wbytes=2 rios=3 wios=4\n8:16 rbytes=10 wbytes=20 rios=30 wios=40\n")
+    assert values == (11, 22, 33, 44)
+
+
+def test_walk(tmp_path):
+    make_cgroup(tmp_path, '/')
+    make_cgroup(tmp_path, '/system.slice')
+    make_cgroup(tmp_path, '/system.slice/docker-1.scope')
+    make_cgroup(tmp_path, '/system.slice/docker-1.scope/init')
+    tree = make_tree(tmp_path)
+    names = sorted(tree.cgroups)
+    tree.close()
+    assert names == ['/', '/system.slice', '/system.slice/docker-1.scope', '/system.slice/docker-1.scope/init']
+
+
+def test_walk_max_depth(tmp_path):
+    make_cgroup(tmp_path, '/')
+    make_cgroup(tmp_path, '/system.slice')
+    make_cgroup(tmp_path, '/system.slice/docker-1.scope')
+    tree = make_tree(tmp_path, max_depth=1)
+    names = sorted(tree.cgroups)
+    watched = sorted(tree.watches.values())
+    watching = tree.inotify is not None
+    tree.close()
+    assert names == ['/', '/system.slice']
+    #
+    # The cgroups at the maximum depth are not watched
+    #
+    assert watched == (['/'] if watching else [])
+
+
+@needs_inotify
+def test_inotify_add_remove(tmp_path):
+    make_cgroup(tmp_path, '/')
+    make_cgroup(tmp_path, '/a')
+    tree = make_tree(tmp_path)
+    assert tree.inotify is not None
+    assert tree.refresh(0) == []
+    make_cgroup(tmp_path, '/b')
+    make_cgroup(tmp_path, '/b/c')
+    assert tree.refresh(0) == []
+    assert sorted(tree.cgroups) == ['/', '/a', '/b', '/b/c']
+    #
+    # The cgroups created below a new cgroup are watched too
+    #
+    make_cgroup(tmp_path, '/b/c/d')
+    tree.refresh(0)
+    assert '/b/c/d' in tree.cgroups
+    shutil.rmtree(os.path.join(str(tmp_path), 'b'))
+    removed = tree.refresh(0)
+    names = sorted(tree.cgroups)
+    tree.close()
+    assert '/b' in removed
+    assert names == ['/', '/a']
+
+
+def test_rescan_without_inotify(tmp_path, monkeypatch):
+    def no_inotify():
+        raise OSError("inotify is not available")
+
+    monkeypatch.setattr(inotify, 'Inotify', no_inotify)
+    make_cgroup(tmp_path, '/')
+    make_cgroup(tmp_path, '/a')
+    with open(os.path.join(str(tmp_path), 'cgroup.stat'), 'w') as f:
+        f.write("nr_descendants 1\nnr_dying_descendants 0\n")
+    tree = make_tree(tmp_path)
+    assert tree.inotify is None
+    make_cgroup(tmp_path, '/b')
+    #
+    # Not walked again while the number of cgroups is unchanged
+    #
+    assert tree.refresh(1) == []
+    assert '/b' not in tree.cgroups
+    with open(os.path.join(str(tmp_path), 'cgroup.stat'), 'w') as f:
+        f.write("nr_descendants 2\nnr_dying_descendants 0\n")
+    tree.refresh(2)
+    assert '/b' in tree.cgroups
+    shutil.rmtree(os.path.join(str(tmp_path), 'a'))
+    removed = tree.refresh(tree.scanned + tree.rescan)
+    names = sorted(tree.cgroups)
+    tree.close()
+    assert removed == ['/a']
+    assert names == ['/', '/b']
+
+
+def test_rates(tmp_path, job):
+    settings = {"path": str(tmp_path)}
+    make_cgroup(tmp_path, '/')
+    make_cgroup(tmp_path, '/a', usage=1000000, memory=4096, rbytes=100)
+    #
+    # No rates on the first run
+    #
+    assert job(settings, 10.0) == {}
+    make_cgroup(tmp_path, '/a', usage=1500000, memory=8192, rbytes=600)
+    fields = job(settings, 12.0)['/a']
+    assert fields['cpu_usage_usec_rate'] == pytest.approx(250000)
+    assert fields['cpu_user_usec_rate'] == pytest.approx(125000)
+    assert fields['cpu_percent'] == pytest.approx(25.0)
+    assert fields['io_rbytes_rate'] == pytest.approx(500)
+    assert fields['io_rios_rate'] == pytest.approx(0)
+    assert fields['memory_current'] == 8192
+    assert 'cpu_usage_usec' not in fields
+
+
+def test_raw_counters(tmp_path, job):
+    settings = {"path": str(tmp_path), "counters": "raw"}
+    make_cgroup(tmp_path, '/')
+    make_cgroup(tmp_path, '/a', usage=1000000, memory=4096, rbytes=100)
+    fields = job(settings, 10.0)['/a']
+    assert fields['cpu_usage_usec'] == 1000000
+    assert fields['io_rbytes'] == 200
+    assert fields['memory_current'] == 4096
+    assert 'cpu_percent' not in fields
+
+
+def test_missing_controller(tmp_path, job):
+    settings = {"path": str(tmp_path), "counters": "both"}
+    make_cgroup(tmp_path, '/')
+    make_cgroup(tmp_path, '/cpu_only', usage=1000, files=('cpu.stat',))
+    make_cgroup(tmp_path, '/memory_only', memory=4096, files=('memory.current',))
+    job(settings, 10.0)
+    make_cgroup(tmp_path, '/cpu_only', usage=2000, files=('cpu.stat',))
+    points = job(settings, 11.0)
+    cpu_only = points['/cpu_only']
+    assert cpu_only['cpu_usage_usec'] == 2000
+    assert cpu_only['cpu_usage_usec_rate'] == pytest.approx(1000)
+    assert 'cpu_percent' in cpu_only
+    assert not [name for name in cpu_only if name.startswith(('memory_', 'io_'))]
+    assert sorted(points['/memory_only']) == ['memory_current']
+    assert points['/memory_only']['memory_current'] == 4096
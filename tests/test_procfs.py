@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+
+#
+# Standard library imports
+#
+import os
+import sys
+#
+# Third party imports
+#
+import psutil
+import pytest
+#
+# Project's imports
+#
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import procfs  # noqa: E402
+
+
+STAT = b"""cpu  1000 20 300 40000 50 6 7 8 9 10
+cpu0 600 10 200 20000 25 3 4 5 6 7
+cpu1 400 10 100 20000 25 3 3 3 3 3
+intr 123456 10 20 30
+ctxt 987654
+btime 1700000000
+processes 4242
+procs_running 2
+procs_blocked 0
+softirq 55555 1 2 3
+"""
+
+MEMINFO = b"""MemTotal:       16000000 kB
+MemFree:         2000000 kB
+MemAvailable:    8000000 kB
+Buffers:          100000 kB
+Cached:          5000000 kB
+"""
+
+NET_DEV = b"""Inter-|   Receive                                                |  Transmit
+ face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed
+    lo: 1000 10 0 0 0 0 0 0 1000 10 0 0 0 0 0 0
+  eth0: 123456789 1000 1 2 0 0 0 5 987654321 2000 3 4 0 0 0 0
+"""
+
+
+def make_procfs(path, stat=STAT, meminfo=MEMINFO, net_dev=NET_DEV):
+    """Write a fake procfs holding the files read by ProcfsReader
+
+    :param path: The directory of the fake procfs
+    :param stat: The content of the stat file
+    :param meminfo: The content of the meminfo file
+    :param net_dev: The content of the net/dev file
+    :return: A ProcfsReader object reading the fake procfs
+    """
+    os.makedirs(os.path.join(str(path), 'net'))
+    for name, content in (('stat', stat), ('meminfo', meminfo), (os.path.join('net', 'dev'), net_dev)):
+        with open(os.path.join(str(path), name), 'wb') as f:
+            f.write(content)
+    return procfs.ProcfsReader(str(path))
+
+
+def test_parse_cpu_times_percpu(tmp_path):
+    reader = make_procfs(tmp_path)
+    ticks = reader.clock_ticks
+    times = reader.cpu_times_percpu()
+    reader.close()
+    assert len(times) == 2
+    assert times[0] == procfs.CpuTimes(*(value / ticks for value in (600, 10, 200, 20000, 25, 3, 4, 5, 6, 7)))
+    assert times[1].user == 400 / ticks
+    assert times[1].guest_nice == 3 / ticks
+
+
+def test_parse_cpu_times_percpu_old_kernel(tmp_path):
+    #
+    # Kernels before 2.6.33 report neither guest nor guest_nice
+    #
+    reader = make_procfs(tmp_path, stat=b"cpu  1 2 3 4 5 6 7 8\ncpu0 1 2 3 4 5 6 7 8\nctxt 1\nintr 2\n")
+    times = reader.cpu_times_percpu()
+    reader.close()
+    assert len(times) == 1
+    assert times[0].steal == 8 / reader.clock_ticks
+    assert times[0].guest == 0.0
+    assert times[0].guest_nice == 0.0
+
+
+def test_parse_cpu_stats(tmp_path):
+    reader = make_procfs(tmp_path)
+    stats = reader.cpu_stats()
+    reader.close()
+    assert stats == procfs.CpuStats(ctx_switches=987654, interrupts=123456, soft_interrupts=55555, syscalls=0)
+
+
+def test_parse_virtual_memory(tmp_path):
+    reader = make_procfs(tmp_path)
+    memory = reader.virtual_memory()
+    reader.close()
+    assert memory == procfs.VirtualMemory(
+            total=16000000 * 1024,
+            available=8000000 * 1024,
+            used=8000000 * 1024,
+            free=2000000 * 1024,
+    )
+
+
+def test_parse_virtual_memory_without_available(tmp_path):
+    reader = make_procfs(tmp_path, meminfo=b"MemTotal: 1000 kB\nMemFree: 500 kB\n")
+    assert reader.virtual_memory() is None
+    reader.close()
+
+
+def test_parse_net_io_counters_pernic(tmp_path):
+    reader = make_procfs(tmp_path)
+    nics = reader.net_io_counters_pernic()
+    reader.close()
+    assert sorted(nics) == ['eth0', 'lo']
+    assert nics['eth0'] == procfs.NetIO(
+            bytes_sent=987654321,
+            bytes_recv=123456789,
+            packets_sent=2000,
+            packets_recv=1000,
+            errin=1,
+            errout=3,
+            dropin=2,
+            dropout=4,
+    )
+
+
+def test_parse_grown_file(tmp_path):
+    #
+    # Content larger than the initial buffer: the buffer is grown
+    #
+    stat = b"cpu  1 1 1 1 1 1 1 1 1 1\n" + b"".join(
+            "cpu{} {} 1 1 1 1 1 1 1 1 1\n".format(cpu, cpu).encode('ascii') for cpu in range(1024)
+    ) + b"ctxt 1\nintr 2\n"
+    net_dev = NET_DEV + b"".join(
+            "  veth{}: {} 1 0 0 0 0 0 0 2 2 0 0 0 0 0 0\n".format(nic, nic).encode('ascii') for nic in range(256)
+    )
+    reader = make_procfs(tmp_path, stat=stat, net_dev=net_dev)
+    times = reader.cpu_times_percpu()
+    stats = reader.cpu_stats()
+    nics = reader.net_io_counters_pernic()
+    reader.close()
+    assert len(times) == 1024
+    assert times[1023].user == 1023 / reader.clock_ticks
+    assert stats.ctx_switches == 1
+    assert stats.interrupts == 2
+    assert len(nics) == 258
+    assert nics['veth255'].bytes_recv == 255
+
+
+linux_only = pytest.mark.skipif(not sys.platform.startswith('linux'), reason="procfs is Linux only")
+
+
+@pytest.fixture
+def reader():
+    reader = procfs.ProcfsReader()
+    yield reader
+    reader.close()
+
+
+def assert_between(before, value, after):
+    """Assert that the counters read between two psutil reads lie between their values
+
+    :param before: The namedtuple read by psutil before
+    :param value: The namedtuple read by ProcfsReader
+    :param after: The namedtuple read by psutil after
+    :return: None
+    """
+    for field in value._fields:
+        assert getattr(before, field) <= getattr(value, field) <= getattr(after, field), field
+
+
+@linux_only
+def test_parity_cpu_times_percpu(reader):
+    before = psutil.cpu_times(percpu=True)
+    times = reader.cpu_times_percpu()
+    after = psutil.cpu_times(percpu=True)
+    assert len(times) == len(before) == len(after)
+    for cpu_before, cpu_times, cpu_after in zip(before, times, after):
+        assert_between(cpu_before, cpu_times, cpu_after)
+
+
+@linux_only
+def test_parity_cpu_stats(reader):
+    before = psutil.cpu_stats()
+    stats = reader.cpu_stats()
+    after = psutil.cpu_stats()
+    assert_between(before, stats, after)
+
+
+@linux_only
+def test_parity_virtual_memory(reader):
+    memory = reader.virtual_memory()
+    reference = psutil.virtual_memory()
+    assert memory.total == reference.total
+    assert memory.available == pytest.approx(reference.available, rel=0.05)
+    assert memory.free == pytest.approx(reference.free, rel=0.05)
+
+
+@linux_only
+def test_parity_net_io_counters_pernic(reader):
+    before = psutil.net_io_counters(pernic=True)
+    nics = reader.net_io_counters_pernic()
+    after = psutil.net_io_counters(pernic=True)
+    assert sorted(nics) == sorted(before)
+    for nic, counters in nics.items():
+        assert_between(before[nic], counters, after[nic])
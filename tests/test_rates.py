@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+#
+# Standard library imports
+#
+import math
+import os
+import sys
+#
+# Third party imports
+#
+import pytest
+#
+# Project's imports
+#
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import columns  # noqa: E402
+import rates  # noqa: E402
+
+
+def test_counter_delta_increase():
+    assert rates.counter_delta(100, 250) == 150
+    assert rates.counter_delta(100, 100) == 0
+
+
+def test_counter_delta_wrap_32_bits():
+    assert rates.counter_delta(2 ** 32 - 10, 5) == 15
+
+
+def test_counter_delta_wrap_64_bits():
+    assert rates.counter_delta(2 ** 64 - 10, 5) == 15
+
+
+def test_counter_delta_reset():
+    #
+    # Back to a small value from far below the wrap point: a reset
+    #
+    assert rates.counter_delta(1000000, 10) is None
+    assert rates.counter_delta(2 ** 40, 10) is None
+
+
+def test_rate_engine_first_sample():
+    engine = rates.RateEngine()
+    assert engine.rates('eth0', 10.0, {'bytes_recv': 1000}) == {}
+
+
+def test_rate_engine_rates():
+    engine = rates.RateEngine()
+    engine.rates('eth0', 10.0, {'bytes_recv': 1000, 'bytes_sent': 2 ** 32 - 100})
+    values = engine.rates('eth0', 12.0, {'bytes_recv': 3000, 'bytes_sent': 100})
+    assert values == {'bytes_recv': 1000.0, 'bytes_sent': 100.0}
+
+
+def test_rate_engine_reset():
+    engine = rates.RateEngine()
+    engine.rates('eth0', 10.0, {'bytes_recv': 1000000, 'bytes_sent': 1000})
+    values = engine.rates('eth0', 11.0, {'bytes_recv': 10, 'bytes_sent': 2000})
+    assert values == {'bytes_sent': 1000.0}
+    #
+    # The rates start again from the value after the reset
+    #
+    assert engine.rates('eth0', 12.0, {'bytes_recv': 110, 'bytes_sent': 2000}) == {
+        'bytes_recv': 100.0,
+        'bytes_sent': 0.0,
+    }
+
+
+def test_rate_engine_expire():
+    engine = rates.RateEngine(expire=60)
+    engine.rates('eth0', 0.0, {'bytes_recv': 0})
+    engine.rates('eth1', 100.0, {'bytes_recv': 0})
+    assert 'eth0' not in engine.series
+    assert engine.rates('eth0', 101.0, {'bytes_recv': 100}) == {}
+
+
+@pytest.fixture(params=['numpy', 'array'])
+def backend(request, monkeypatch):
+    """Run a test with NumPy columns, then with array.array columns"""
+    if request.param == 'numpy' and columns.get_numpy() is None:
+        pytest.skip("NumPy is not installed")
+    if request.param == 'array':
+        monkeypatch.setattr(columns, 'get_numpy', lambda: None)
+    return request.param
+
+
+def column_rates(engine, sample_time, nics):
+    """Compute the rates of the bytes_recv counters of NICs
+
+    :param engine: A ColumnRates object
+    :param sample_time: The monotonic time (secs) of the counters
+    :param nics: A dictionary of NIC names to bytes_recv counters
+    :return: A dictionary of NIC names to rates, None for NaN, empty without rates
+    """
+    table = columns.from_rows(list(nics), [(value,) for value in nics.values()], ['bytes_recv'], counters=True)
+    values = engine.rates(sample_time, table.keys, table.columns)
+    if not values:
+        return {}
+    return {
+        key: None if math.isnan(rate) else rate
+        for key, rate in zip(table.keys, columns.tolist(values['bytes_recv']))
+    }
+
+
+def test_column_rates_first_sample(backend):
+    engine = rates.ColumnRates()
+    assert column_rates(engine, 10.0, {'eth0': 1000, 'eth1': 2000}) == {}
+
+
+def test_column_rates_wrap_and_reset(backend):
+    engine = rates.ColumnRates()
+    column_rates(engine, 10.0, {'eth0': 1000, 'eth1': 2 ** 32 - 100, 'eth2': 2 ** 64 - 100, 'eth3': 1000000})
+    values = column_rates(engine, 12.0, {'eth0': 3000, 'eth1': 100, 'eth2': 100, 'eth3': 10})
+    assert values == {'eth0': 1000.0, 'eth1': 100.0, 'eth2': 100.0, 'eth3': None}
+
+
+def test_column_rates_nics_changed(backend):
+    engine = rates.ColumnRates()
+    column_rates(engine, 10.0, {'eth0': 1000, 'eth1': 2000, 'veth0': 500})
+    #
+    # veth0 is gone, veth1 is new and the NICs are listed in another order
+    #
+    values = column_rates(engine, 11.0, {'veth1': 100, 'eth1': 2500, 'eth0': 1100})
+    assert values == {'veth1': None, 'eth1': 500.0, 'eth0': 100.0}
+    values = column_rates(engine, 12.0, {'veth1': 300, 'eth1': 2500, 'eth0': 1100})
+    assert values == {'veth1': 200.0, 'eth1': 0.0, 'eth0': 0.0}
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+#
+# Standard library imports
+#
+import os
+import sys
+#
+# Third party imports
+#
+import pytest
+#
+# Project's imports
+#
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import scheduler  # noqa: E402
+
+
+class Clock:
+    """Fake wall and monotonic clocks, only moving when advanced"""
+
+    def __init__(self, wall, mono):
+        self.wall = wall
+        self.mono = mono
+
+    def time(self):
+        return self.wall
+
+    def monotonic(self):
+        return self.mono
+
+    def advance(self, secs):
+        self.wall += secs
+        self.mono += secs
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Run the scheduler on a fake clock, 3.5 secs past a 10 secs boundary of the wall clock"""
+    clock = Clock(1700000003.5, 500.0)
+    monkeypatch.setattr(scheduler, 'time', clock)
+    return clock
+
+
+def job():
+    pass
+
+
+def test_first_tick_aligned(clock):
+    jobs = scheduler.Scheduler()
+    ten = jobs.every(10, job)
+    five = jobs.every(5, job)
+    sixty = jobs.every(60, job)
+    #
+    # Wall-clock boundaries: 1700000010, 1700000005 and 1700000040
+    #
+    assert ten.deadline == pytest.approx(506.5)
+    assert five.deadline == pytest.approx(501.5)
+    assert sixty.deadline == pytest.approx(536.5)
+
+
+def test_ticks_do_not_drift(clock):
+    jobs = scheduler.Scheduler()
+    ten = jobs.every(10, job)
+    clock.advance(6.5)
+    assert jobs.next_due() is ten
+    #
+    # Taken late, the job keeps its deadlines
+    #
+    clock.advance(10.7)
+    assert jobs.next_due() is ten
+    assert ten.deadline == pytest.approx(526.5)
+    assert ten.skipped == 0
+
+
+def test_missed_ticks_skipped(clock):
+    jobs = scheduler.Scheduler()
+    ten = jobs.every(10, job)
+    clock.advance(6.5)
+    assert jobs.next_due() is ten
+    #
+    # Woken up 25 secs after the deadline of 516.5: the ticks of 516.5 and
+    # 526.5 are skipped, the job fires once and is due again at 546.5
+    #
+    clock.advance(35)
+    assert jobs.next_due() is ten
+    assert ten.skipped == 2
+    assert ten.deadline == pytest.approx(546.5)
+    assert len(jobs.heap) == 1
+    clock.advance(5)
+    assert jobs.next_due() is ten
+    assert ten.skipped == 2
+
+
+def test_cancel(clock):
+    jobs = scheduler.Scheduler()
+    ten = jobs.every(10, job)
+    five = jobs.every(5, job)
+    jobs.cancel(five)
+    clock.advance(6.5)
+    assert jobs.next_due() is ten
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+#
+# Standard library imports
+#
+import os
+import sys
+#
+# Project's imports
+#
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import spool  # noqa: E402
+
+
+def make_lines(first, count):
+    """Make line-protocol points of 10 bytes each, newline included
+
+    :param first: The number of the first point
+    :param count: The number of points
+    :return: A list of line-protocol strings
+    """
+    return ['m v={:04d}i'.format(number) for number in range(first, first + count)]
+
+
+def segment_files(path):
+    """List the segment files of a spool directory
+
+    :param path: The spool directory
+    :return: A sorted list of the file names
+    """
+    return sorted(name for name in os.listdir(str(path)) if name.endswith(spool.Spool.suffix))
+
+
+def drain(spooled, max_points=1000):
+    """Read back and remove all the points of a spool, as the replayer does
+
+    :param spooled: A Spool object
+    :param max_points: The number of points read by each peek
+    :return: A list of the points read
+    """
+    lines = []
+    while len(spooled):
+        batch = spooled.peek(max_points)
+        spooled.commit()
+        lines.extend(batch)
+    return lines
+
+
+def test_append_peek_commit(tmp_path):
+    spooled = spool.Spool(str(tmp_path))
+    spooled.append(make_lines(0, 3))
+    assert len(spooled) == 30
+    assert spooled.peek(2) == make_lines(0, 2)
+    #
+    # Nothing is removed before commit
+    #
+    assert spooled.peek(2) == make_lines(0, 2)
+    spooled.commit()
+    assert len(spooled) == 10
+    assert spooled.peek(10) == make_lines(2, 1)
+    spooled.commit()
+    assert len(spooled) == 0
+    assert segment_files(tmp_path) == []
+    spooled.close()
+
+
+def test_segment_rotation(tmp_path):
+    spooled = spool.Spool(str(tmp_path), segment_bytes=40)
+    for number in range(10):
+        spooled.append(make_lines(number, 1))
+    spooled.close()
+    assert segment_files(tmp_path) == ['{:016d}.spool'.format(seq) for seq in range(3)]
+    assert [os.path.getsize(os.path.join(str(tmp_path), name)) for name in segment_files(tmp_path)] == [40, 40, 20]
+
+
+def test_peek_commit_across_segments(tmp_path):
+    spooled = spool.Spool(str(tmp_path), segment_bytes=40)
+    spooled.append(make_lines(0, 4))
+    spooled.append(make_lines(4, 4))
+    spooled.append(make_lines(8, 2))
+    #
+    # A peek does not read past the oldest segment
+    #
+    assert spooled.peek(6) == make_lines(0, 4)
+    spooled.commit()
+    assert len(segment_files(tmp_path)) == 2
+    assert spooled.peek(3) == make_lines(4, 3)
+    spooled.commit()
+    assert drain(spooled) == make_lines(7, 3)
+    assert segment_files(tmp_path) == []
+    spooled.close()
+
+
+def test_evict_oldest_first(tmp_path):
+    spooled = spool.Spool(str(tmp_path), max_bytes=100, segment_bytes=40)
+    for number in range(0, 14, 2):
+        spooled.append(make_lines(number, 2))
+    #
+    # 140 bytes in segments of 40, 40, 40 and 20 bytes: the first one is
+    # evicted
+    #
+    assert len(spooled) == 100
+    assert segment_files(tmp_path) == ['{:016d}.spool'.format(seq) for seq in range(1, 4)]
+    assert drain(spooled) == make_lines(4, 10)
+    spooled.close()
+
+
+def test_evict_resets_read_offset(tmp_path):
+    spooled = spool.Spool(str(tmp_path), max_bytes=100, segment_bytes=40)
+    spooled.append(make_lines(0, 4))
+    assert spooled.peek(2) == make_lines(0, 2)
+    spooled.commit()
+    #
+    # The segment partly replayed is evicted: the replay starts again at
+    # the beginning of the next one
+    #
+    spooled.append(make_lines(4, 4))
+    spooled.append(make_lines(8, 4))
+    assert drain(spooled) == make_lines(4, 8)
+    spooled.close()
+
+
+def test_reopen(tmp_path):
+    spooled = spool.Spool(str(tmp_path), segment_bytes=40)
+    spooled.append(make_lines(0, 6))
+    spooled.close()
+    spooled = spool.Spool(str(tmp_path), segment_bytes=40)
+    assert len(spooled) == 60
+    spooled.append(make_lines(6, 2))
+    assert segment_files(tmp_path) == ['{:016d}.spool'.format(seq) for seq in range(2)]
+    assert drain(spooled) == make_lines(0, 8)
+    spooled.close()
+
+
+def test_torn_tail(tmp_path):
+    spooled = spool.Spool(str(tmp_path), segment_bytes=40)
+    spooled.append(make_lines(0, 4))
+    spooled.append(make_lines(4, 2))
+    spooled.close()
+    #
+    # A crash in the middle of a write leaves a line without its newline
+    #
+    with open(os.path.join(str(tmp_path), '{:016d}.spool'.format(0)), 'ab') as f:
+        f.write(b'm v=99')
+    spooled = spool.Spool(str(tmp_path), segment_bytes=40)
+    assert drain(spooled) == make_lines(0, 6)
+    assert segment_files(tmp_path) == []
+    spooled.close()
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+#
+# Standard library imports
+#
+import concurrent.futures
+import logging
+import threading
+import time
+#
+# Project's imports
+#
+import telemetry
+
+
+OVERRUN_POLICIES = ('skip', 'queue', 'run')
+
+
+class JobState:
+    """Book-keeping of the runs of a job in the worker pool"""
+
+    def __init__(self):
+        """Creates an idle job state"""
+        self.running = 0
+        self.queued = None
+        self.skipped = 0
+
+
+class WorkerPool:
+    """Fixed-size pool of worker threads running the jobs
+
+    The pool reuses a fixed number of threads instead of spawning one per
+    run. When a job is submitted while its previous run is still in flight,
+    the overrun policy of the job decides what happens:
+
+    - skip: the run is dropped and counted
+    - queue: the run is started as soon as the previous one ends (at most
+      one run is kept waiting per job)
+    - run: the run is started anyway, concurrently with the previous one
+    """
+
+    def __init__(self, pool_size=4):
+        """Creates the pool
+
+        :param pool_size: Number of worker threads
+        """
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=pool_size,
+                thread_name_prefix='sysprobe-worker',
+        )
+        self.lock = threading.Lock()
+        self.states = {}
+
+    def submit(self, job_name, job_function, args, overrun='skip'):
+        """Submit a run of a job
+
+        :param job_name: The name of the job
+        :param job_function: The function performing the job
+        :param args: A tuple of the arguments of the job function
+        :param overrun: The overrun policy of the job
+        :return: None
+        """
+        logger = logging.getLogger()
+        with self.lock:
+            state = self.states.setdefault(job_name, JobState())
+            if state.running and overrun != 'run':
+                if overrun == 'queue':
+                    state.queued = (job_function, args)
+                    if telemetry.enabled:
+                        telemetry.count(job_name, "queued")
+                else:
+                    state.skipped += 1
+                    logger.warning("Job {} still running, skipped ({} skipped so far)".format(
+                            job_name, state.skipped))
+                    if telemetry.enabled:
+                        telemetry.count(job_name, "skipped")
+                return
+            state.running += 1
+        self.executor.submit(self.run, job_name, job_function, args)
+
+    def run(self, job_name, job_function, args):
+        """Worker body: run a job, then start its queued run if any
+
+        :param job_name: The name of the job
+        :param job_function: The function performing the job
+        :param args: A tuple of the arguments of the job function
+        :return: None
+        """
+        logger = logging.getLogger()
+        started = time.perf_counter() if telemetry.enabled else None
+        try:
+            job_function(*args)
+        except Exception as e:
+            logger.exception("Job {} failed".format(job_name))
+            if started is not None:
+                telemetry.count(job_name, "failures_{}".format(type(e).__name__))
+        if started is not None:
+            telemetry.observe(job_name, "collect_seconds", time.perf_counter() - started)
+        with self.lock:
+            state = self.states[job_name]
+            state.running -= 1
+            queued = state.queued if not state.running else None
+            if queued is not None:
+                state.queued = None
+                state.running += 1
+        if queued is not None:
+            try:
+                self.executor.submit(self.run, job_name, *queued)
+            except RuntimeError:
+                #
+                # The pool is shutting down
+                #
+                pass
+
+    def skipped(self, job_name):
+        """Get the number of skipped runs of a job
+
+        :param job_name: The name of the job
+        :return: The number of runs skipped because of an overrun
+        """
+        with self.lock:
+            return self.states[job_name].skipped if job_name in self.states else 0
+
+    def shutdown(self):
+        """Wait for the running jobs and stop the worker threads
+
+        :return: None
+        """
+        self.executor.shutdown(wait=True)
+
+
+def get_worker_pool(workers_config):
+    """Build the worker pool from the workers configuration
+
+    :param workers_config: A dictionary of the workers configuration
+    :return: A WorkerPool object
+    """
+    pool_size = workers_config["pool_size"] if "pool_size" in workers_config else 4
+    return WorkerPool(pool_size=pool_size)
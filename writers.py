@@ -0,0 +1,471 @@
+# -*- coding: utf-8 -*-
+
+#
+# Standard library imports
+#
+import logging
+import os
+import socket
+import threading
+import time
+#
+# Project's imports
+#
+import helpers
+import lineprotocol
+import spool
+import telemetry
+
+
+class InfluxDBWriter:
+    """Process-wide InfluxDB writer
+
+    Owns a single InfluxDB client, and therefore a single persistent HTTP
+    session, shared by every job. Points are rendered to line protocol by
+    the writer and writes are serialized with a lock so the writer can be
+    used from any number of threads.
+    """
+
+    def __init__(self, influxdb_config):
+        """Creates the writer
+
+        :param influxdb_config: A dictionary of InfluxDB configuration
+        """
+        self.influxdb_config = influxdb_config
+        self.client = helpers.get_influxdb_client(influxdb_config)
+        self.precision = influxdb_config["precision"] if "precision" in influxdb_config else "n"
+        self.lock = threading.Lock()
+
+    def write_points(self, record):
+        """Write points to InfluxDB
+
+        :param record: A list of the points to write
+        :return: False if the write failed on a transient error, True otherwise
+        """
+        if not telemetry.enabled:
+            return self.write_lines(lineprotocol.render(record, precision=self.precision))
+        started = time.perf_counter()
+        lines = lineprotocol.render(record, precision=self.precision)
+        telemetry.observe("writer", "serialize_seconds", time.perf_counter() - started)
+        return self.write_lines(lines)
+
+    def write_lines(self, lines):
+        """Write line-protocol points to InfluxDB
+
+        :param lines: A list of line-protocol strings
+        :return: False if the write failed on a transient error, True otherwise
+        """
+        if not lines:
+            return True
+        with self.lock:
+            if not telemetry.enabled:
+                return helpers.influxdb_write_points(self.client, lines, 'line', self.precision)
+            started = time.perf_counter()
+            result = helpers.influxdb_write_points(self.client, lines, 'line', self.precision)
+            telemetry.observe("writer", "write_seconds", time.perf_counter() - started)
+            telemetry.observe("writer", "batch_points", len(lines), telemetry.SIZE_BOUNDS)
+            return result
+
+    def close(self):
+        """Close the underlying HTTP session
+
+        :return: None
+        """
+        with self.lock:
+            self.client.close()
+
+
+class BatchWriter:
+    """Queue-backed batching stage in front of an InfluxDB writer
+
+    Jobs hand their points to the batch writer, which only appends them to
+    a pending list. A background flusher thread sends the pending points in
+    a single write when the batch reaches batch_size points or when its
+    oldest point is flush_interval seconds old, so the network round trip
+    is kept off the collection path.
+    """
+
+    def __init__(self, writer, batch_size=5000, flush_interval=1):
+        """Creates the batch writer and starts its flusher thread
+
+        :param writer: The InfluxDB writer the batches are sent to
+        :param batch_size: Number of points triggering a flush
+        :param flush_interval: Maximum age (secs) of a pending point
+        """
+        self.writer = writer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.pending_points = 0
+        self.pending_since = None
+        self.stopping = False
+        self.condition = threading.Condition()
+        self.flusher = threading.Thread(target=self.flush_loop, name='sysprobe-flusher', daemon=True)
+        self.flusher.start()
+        if telemetry.enabled:
+            telemetry.gauge("writer", "pending_points", lambda: self.pending_points)
+
+    def write_points(self, record):
+        """Queue points for the next batch
+
+        :param record: A list of the points to write
+        :return: None
+        """
+        with self.condition:
+            if not self.pending:
+                #
+                # Wake the flusher up so that it starts the flush_interval
+                # countdown of the new batch
+                #
+                self.pending_since = time.monotonic()
+                self.condition.notify()
+            self.pending.extend(record)
+            self.pending_points += lineprotocol.count_points(record)
+            if self.pending_points >= self.batch_size:
+                self.condition.notify()
+
+    def next_batch(self):
+        """Wait for the next batch to be due and take it from the pending list
+
+        :return: A list of points, empty when stopping with nothing pending
+        """
+        with self.condition:
+            while not self.stopping and self.pending_points < self.batch_size:
+                if self.pending:
+                    timeout = self.pending_since + self.flush_interval - time.monotonic()
+                    if timeout <= 0:
+                        break
+                else:
+                    timeout = None
+                self.condition.wait(timeout)
+            batch, self.pending, points = lineprotocol.split(self.pending, self.batch_size)
+            self.pending_points -= points
+            if not self.pending:
+                self.pending_since = None
+            return batch
+
+    def flush_loop(self):
+        """Flusher thread body: sends the batches until stopped
+
+        :return: None
+        """
+        logger = logging.getLogger()
+        while True:
+            batch = self.next_batch()
+            if batch:
+                try:
+                    self.writer.write_points(batch)
+                except Exception:
+                    logger.exception("Unexpected error writing a batch of {} points".format(len(batch)))
+            elif self.stopping:
+                break
+
+    def close(self):
+        """Flush the pending points, stop the flusher and close the writer
+
+        :return: None
+        """
+        with self.condition:
+            self.stopping = True
+            self.condition.notify()
+        self.flusher.join()
+        self.writer.close()
+
+
+class SpoolWriter:
+    """Spooling stage in front of an InfluxDB writer
+
+    Points whose write fails on a transient error are encoded to line
+    protocol and appended to an on-disk spool instead of being dropped. A
+    replay thread sends the spooled points back, oldest first, in batches of
+    replay_batch points and at no more than replay_rate points per second,
+    once live writes succeed again.
+    """
+
+    def __init__(self, writer, spool_config, previous_spool=None):
+        """Creates the spooling stage and starts its replay thread
+
+        :param writer: The InfluxDB writer the points are sent to
+        :param spool_config: A dictionary of the spool configuration
+        :param previous_spool: None, or the Spool object of the writer chain being replaced, used again when it is in
+        the same directory
+        """
+        path = spool_config["path"] if "path" in spool_config else "spool"
+        max_bytes = spool_config["max_bytes"] if "max_bytes" in spool_config else 100 * 1024 * 1024
+        segment_bytes = spool_config["segment_bytes"] if "segment_bytes" in spool_config else 4 * 1024 * 1024
+        self.replay_batch = spool_config["replay_batch"] if "replay_batch" in spool_config else 5000
+        self.replay_rate = spool_config["replay_rate"] if "replay_rate" in spool_config else 10000
+        self.retry_interval = spool_config["retry_interval"] if "retry_interval" in spool_config else 5
+        self.writer = writer
+        if previous_spool is not None and os.path.abspath(previous_spool.path) == os.path.abspath(path):
+            #
+            # A second Spool object on the directory would not see the
+            # segments the other one removes
+            #
+            with previous_spool.lock:
+                previous_spool.max_bytes = max_bytes
+                previous_spool.segment_bytes = segment_bytes
+            self.spool = previous_spool
+        else:
+            self.spool = spool.Spool(path, max_bytes=max_bytes, segment_bytes=segment_bytes)
+        self.healthy = threading.Event()
+        self.healthy.set()
+        self.stopping = threading.Event()
+        self.replayer = threading.Thread(target=self.replay_loop, name='sysprobe-replayer', daemon=True)
+        self.replayer.start()
+        if telemetry.enabled:
+            telemetry.gauge("writer", "spooled_bytes", lambda: len(self.spool))
+
+    def write_points(self, record):
+        """Write points to InfluxDB, spooling them if the write fails
+
+        Points without a timestamp are stamped with the current time when
+        they are spooled, so that they keep their place in their series.
+
+        :param record: A list of the points to write
+        :return: True
+        """
+        if self.writer.write_points(record):
+            self.healthy.set()
+        else:
+            self.healthy.clear()
+            self.spool.append(lineprotocol.render(
+                    record,
+                    default_time=time.time_ns(),
+                    precision=self.writer.precision,
+            ))
+        return True
+
+    def replay_loop(self):
+        """Replay thread body: drains the spool while InfluxDB is healthy
+
+        :return: None
+        """
+        logger = logging.getLogger()
+        while not self.stopping.is_set():
+            if not self.healthy.wait(self.retry_interval) or not len(self.spool):
+                self.stopping.wait(self.retry_interval)
+                continue
+            try:
+                with self.spool.replay_lock:
+                    lines = self.spool.peek(self.replay_batch)
+                    if not lines:
+                        self.spool.commit()
+                        continue
+                    replayed = self.writer.write_lines(lines)
+                    if replayed:
+                        self.spool.commit()
+                if replayed:
+                    logger.info("Replayed {} spooled points".format(len(lines)))
+                    #
+                    # Throttle the replay so that a recovering InfluxDB is
+                    # not swamped and live writes get their share
+                    #
+                    self.stopping.wait(len(lines) / self.replay_rate)
+                else:
+                    self.healthy.clear()
+            except Exception:
+                logger.exception("Unexpected error replaying the spool")
+                self.stopping.wait(self.retry_interval)
+
+    def close(self):
+        """Stop the replay thread, close the spool and the writer
+
+        :return: None
+        """
+        self.stopping.set()
+        self.replayer.join()
+        self.spool.close()
+        self.writer.close()
+
+
+class UdpWriter:
+    """Fire-and-forget InfluxDB writer over UDP
+
+    Points are rendered to line protocol and packed into datagrams of at
+    most payload_size bytes (e.g. 1400 to fit a 1500 bytes MTU, or 8900 with
+    jumbo frames), sent over a single socket to the UDP listener of
+    InfluxDB. A datagram is sent as soon as it is full, or by a flusher
+    thread when its oldest point is flush_interval seconds old. Nothing
+    tells whether a datagram was received, so writes never block on a slow
+    database and nothing is spooled. A point longer than payload_size is
+    sent alone.
+    """
+
+    def __init__(self, influxdb_config):
+        """Creates the writer and starts its flusher thread
+
+        :param influxdb_config: A dictionary of InfluxDB configuration
+        """
+        host = influxdb_config["host"] if "host" in influxdb_config else "localhost"
+        udp_port = influxdb_config["udp_port"] if "udp_port" in influxdb_config else 4444
+        self.payload_size = influxdb_config["udp_payload_size"] if "udp_payload_size" in influxdb_config else 1400
+        self.flush_interval = influxdb_config["udp_flush_interval"] if "udp_flush_interval" in influxdb_config else 0.1
+        self.precision = influxdb_config["precision"] if "precision" in influxdb_config else "n"
+        family, socket_type, proto, _, address = socket.getaddrinfo(host, udp_port, type=socket.SOCK_DGRAM)[0]
+        self.socket = socket.socket(family, socket_type, proto)
+        self.socket.connect(address)
+        self.datagram = bytearray()
+        self.datagram_points = 0
+        self.datagram_since = None
+        self.stopping = False
+        self.condition = threading.Condition()
+        self.flusher = threading.Thread(target=self.flush_loop, name='sysprobe-udp-flusher', daemon=True)
+        self.flusher.start()
+
+    def write_points(self, record):
+        """Pack points into datagrams, sending the full ones
+
+        :param record: A list of the points to write
+        :return: True
+        """
+        if telemetry.enabled:
+            started = time.perf_counter()
+            lines = lineprotocol.render(record, precision=self.precision)
+            telemetry.observe("writer", "serialize_seconds", time.perf_counter() - started)
+        else:
+            lines = lineprotocol.render(record, precision=self.precision)
+        with self.condition:
+            for line in lines:
+                data = line.encode('utf-8') + b'\n'
+                if self.datagram and len(self.datagram) + len(data) > self.payload_size:
+                    self.send()
+                if not self.datagram:
+                    self.datagram_since = time.monotonic()
+                    self.condition.notify()
+                self.datagram += data
+                self.datagram_points += 1
+                if len(self.datagram) >= self.payload_size:
+                    self.send()
+        return True
+
+    def send(self):
+        """Send the current datagram
+
+        Must be called with the lock held.
+
+        :return: None
+        """
+        logger = logging.getLogger()
+        try:
+            self.socket.send(self.datagram)
+        except OSError as e:
+            logger.warning("Error sending a datagram of {} points: {}".format(self.datagram_points, e))
+            if telemetry.enabled:
+                telemetry.count("writer", "failures_{}".format(type(e).__name__))
+        else:
+            logger.debug("Sent {} points".format(self.datagram_points))
+            if telemetry.enabled:
+                telemetry.observe("writer", "batch_points", self.datagram_points, telemetry.SIZE_BOUNDS)
+        self.datagram = bytearray()
+        self.datagram_points = 0
+        self.datagram_since = None
+
+    def flush_loop(self):
+        """Flusher thread body: sends the datagrams left partial
+
+        :return: None
+        """
+        with self.condition:
+            while not self.stopping:
+                timeout = None
+                if self.datagram:
+                    timeout = self.datagram_since + self.flush_interval - time.monotonic()
+                    if timeout <= 0:
+                        self.send()
+                        continue
+                self.condition.wait(timeout)
+            if self.datagram:
+                self.send()
+
+    def close(self):
+        """Send the partial datagram, stop the flusher and close the socket
+
+        :return: None
+        """
+        with self.condition:
+            self.stopping = True
+            self.condition.notify()
+        self.flusher.join()
+        self.socket.close()
+
+
+class ReloadableWriter:
+    """Stable front of the writer chain, whose target can be replaced
+
+    The jobs and their stages hold on to this object, so that a new writer
+    chain can be swapped in when the InfluxDB configuration is reloaded.
+    """
+
+    def __init__(self, writer):
+        """Creates the front
+
+        :param writer: The writer the points are handed to
+        """
+        self.writer = writer
+        self.lock = threading.Lock()
+
+    def write_points(self, record):
+        """Hand points to the current writer
+
+        The lock is held so that no points are handed to a writer being
+        closed.
+
+        :param record: A list of the points to write
+        :return: The result of the current writer
+        """
+        with self.lock:
+            return self.writer.write_points(record)
+
+    def replace(self, writer):
+        """Swap in a new writer, then close the previous one
+
+        Closing the previous writer sends the points it still holds.
+
+        :param writer: The new writer
+        :return: None
+        """
+        with self.lock:
+            previous, self.writer = self.writer, writer
+        previous.close()
+
+    def close(self):
+        """Close the current writer
+
+        :return: None
+        """
+        with self.lock:
+            self.writer.close()
+
+
+def find_spool(writer):
+    """Find the spool of a writer chain
+
+    :param writer: The writer in front of the chain
+    :return: The Spool object of the chain, None if the chain does not spool
+    """
+    while writer is not None:
+        if type(writer) is SpoolWriter:
+            return writer.spool
+        writer = getattr(writer, 'writer', None)
+    return None
+
+
+def get_writer(influxdb_config, previous=None):
+    """Build the process-wide writer from the InfluxDB configuration
+
+    :param influxdb_config: A dictionary of InfluxDB configuration
+    :param previous: None, or the writer chain being replaced, whose spool is used again when in the same directory
+    :return: A writer object accepting points from the jobs
+    """
+    use_udp = influxdb_config["use_udp"] if "use_udp" in influxdb_config else False
+    if use_udp:
+        if "spool" in influxdb_config:
+            logging.getLogger().warning("The spool is not used with UDP writes, ignoring it")
+        return UdpWriter(influxdb_config)
+    batch_size = influxdb_config["batch_size"] if "batch_size" in influxdb_config else 5000
+    flush_interval = influxdb_config["flush_interval"] if "flush_interval" in influxdb_config else 1
+    writer = InfluxDBWriter(influxdb_config)
+    if "spool" in influxdb_config:
+        writer = SpoolWriter(writer, influxdb_config["spool"], find_spool(previous))
+    return BatchWriter(writer, batch_size=batch_size, flush_interval=flush_interval)